@@ -1,10 +1,21 @@
-import RPi.GPIO as GPIO
-import socket
+import os
+if os.environ.get("TUNER_SIMULATION"):
+    import gpio_sim as GPIO # Simulated steppers and encoders for running off the Pi
+else:
+    import RPi.GPIO as GPIO
+import asyncio
+import logging
 from time import sleep
 import pickle
-import os
+from encoder_journal import EncoderJournal, LEGACY_POSITION_SCALE
+import metrics
+from metrics import Counter, Gauge
+from tuner_log import setup_logging
 
-ENCODER_SAVE_FILE = "encoders.pkl"  # File to save encoder positions
+ENCODER_SAVE_FILE = "encoders.bin"  # Binary journal holding the four encoder positions
+LEGACY_SAVE_FILE = "encoders.pkl"  # Pickled encoders from older versions, migrated on first start
+JOURNAL_FLUSH_INTERVAL_S = 1.0  # How often changed positions are written to the journal
+JOURNAL_FSYNC = "always"  # "always" survives power loss, "never" leaves writes to the OS cache
 
 # Define GPIO pins for encoder channels
 ENCODER_A_1 = 6  # GPIO pin for Channel A_1
@@ -27,17 +38,46 @@ INDEX_4 = 26  # GPIO pin for Index Channel X_4
 # Set up TCP socket
 HOST = "127.0.0.1"  # Localhost
 PORT = 65432        # Port number for communication
+METRICS_HOST = "0.0.0.0" # HTTP listener serving GET /metrics, scraped from the network
+METRICS_PORT = 9101
+
+logger = logging.getLogger("encoder")
+
+COMMANDS = Counter("encoder_server_commands_total", "Commands served, by command", ["command"])
+CLIENTS = Gauge("encoder_server_clients", "Connected position clients")
+POSITION = Gauge("encoder_position", "Encoder position in 4x counts", ["motor"])
+MISSED_EDGES = Gauge("encoder_missed_edges", "Illegal quadrature transitions since start", ["motor"])
 
 # Initialize global variables !! load the initialize position   
 position = 0
-last_a_state = None
 
+# Full 4x quadrature decoding: both edges of both channels are counted, so one encoder
+# cycle is 4 counts (800 counts per revolution for the 200 ppr encoder).
+# The table is indexed by (previous AB state << 2) | current AB state, with AB = (A << 1) | B.
+# Forward rotation runs 00 -> 01 -> 11 -> 10 -> 00. A change of both channels at once means
+# an edge was missed, so the direction is unknown and it is counted as an error instead.
+ILLEGAL = 2
+QUADRATURE_TABLE = (
+    0, +1, -1, ILLEGAL,
+    -1, 0, ILLEGAL, +1,
+    +1, ILLEGAL, 0, -1,
+    ILLEGAL, -1, +1, 0,
+)
+COUNTS_PER_CYCLE = 4
+
+# Wire protocol: clients keep one connection open and send newline-terminated ASCII
+# commands; every command gets exactly one newline-terminated reply.
 class channel_command:
     CALIBRATE = 0
     REQ_POS_MOTOR_1 = 1
     REQ_POS_MOTOR_2 = 2
     REQ_POS_MOTOR_3 = 3
     REQ_POS_MOTOR_4 = 4
+    REQ_POS_ALL = "A" # Reply is all four positions, comma separated, in motor order
+    REQ_ERRORS_ALL = "E" # Reply is all four missed-edge error counts, comma separated
+
+REPLY_OK = "OK"
+REPLY_ERROR = "ERR"
 
 class Encoder:
     def __init__(self, ENCODER_A:int, ENCODER_B:int, INDEX:int, ID:int)->None:
@@ -49,81 +89,167 @@ class Encoder:
         self.INDEX = INDEX
         self.ID = ID
         self.position = position
+        self.state = 0 # last AB state, (A << 1) | B
+        self.error_count = 0 # illegal transitions, i.e. missed edges
         
     def initGPIO(self):
         """
         Initialize GPIO and add event
         """
+        if hasattr(GPIO, "attach_encoder"): # gpio_sim: drive A/B from the simulated axis
+            GPIO.attach_encoder(self.ENCODER_A, self.ENCODER_B, self.ID)
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.ENCODER_A, GPIO.IN, pull_up_down=GPIO.PUD_UP)
         GPIO.setup(self.ENCODER_B, GPIO.IN, pull_up_down=GPIO.PUD_UP)
         GPIO.setup(self.INDEX, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
+        self.state = (GPIO.input(self.ENCODER_A) << 1) | GPIO.input(self.ENCODER_B)
         GPIO.add_event_detect(self.ENCODER_A, GPIO.BOTH, callback=self.encoder_callback)
- 
+        GPIO.add_event_detect(self.ENCODER_B, GPIO.BOTH, callback=self.encoder_callback)
 
     def encoder_callback(self, channel)->None:
         """
-        Callback function for Channel A
+        Callback function for edges on Channel A and Channel B
         """
-        if GPIO.input(self.ENCODER_A) == GPIO.input(self.ENCODER_B):
-            self.position += 1
+        state = (GPIO.input(self.ENCODER_A) << 1) | GPIO.input(self.ENCODER_B)
+        step = QUADRATURE_TABLE[(self.state << 2) | state]
+        self.state = state
+        if step == ILLEGAL:
+            self.error_count += 1
         else:
-            self.position -= 1
+            self.position += step
 
-def calibrate(encoders)->None:
+def calibrate(encoders, journal:EncoderJournal)->None:
     for encoder in encoders:
         encoder.position = 0
-    with open(ENCODER_SAVE_FILE,'wb') as file:
-        pickle.dump(encoders,file)
+    journal.flush_now() # persist the new zero immediately
+
+def load_positions(journal:EncoderJournal):
+    """
+    Load saved positions from the journal, falling back to the legacy pickle file
+    (saved before 4x decoding, so its positions are rescaled to the current counts)
+    """
+    positions = journal.load()
+    if positions is None and os.path.exists(LEGACY_SAVE_FILE):
+        with open(LEGACY_SAVE_FILE,'rb') as file:
+            positions = [encoder.position * LEGACY_POSITION_SCALE for encoder in pickle.load(file)]
+        logger.info("Migrated encoder positions", extra={'source': LEGACY_SAVE_FILE, 'positions': positions})
+    return positions
+
+def handle_command(command:str, encoders, journal:EncoderJournal)->str:
+    """
+    Executes one protocol command and returns the reply (without the line terminator)
+    """
+    if command == channel_command.REQ_POS_ALL:
+        return ",".join(f"{encoder.position}" for encoder in encoders)
+    if command == channel_command.REQ_ERRORS_ALL:
+        return ",".join(f"{encoder.error_count}" for encoder in encoders)
+    try:
+        channel = int(command)
+    except ValueError:
+        return f"{REPLY_ERROR} unknown command {command!r}"
+
+    if channel == channel_command.CALIBRATE: # if the reset command is recieved
+        calibrate(encoders, journal)
+        logger.info("Encoders calibrated", extra={'positions': [encoder.position for encoder in encoders]})
+        return REPLY_OK
+    # Find the position for the requested channel
+    for encoder in encoders:
+        if encoder.ID == channel:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Position requested", extra={'motor': channel, 'position': encoder.position})
+            return f"{encoder.position}"
+    return f"{REPLY_ERROR} unknown motor {channel}"
+
+async def handle_client(reader:asyncio.StreamReader, writer:asyncio.StreamWriter, encoders,
+                        journal:EncoderJournal)->None:
+    """
+    Serves one long-lived client connection until it disconnects
+    """
+    addr = writer.get_extra_info('peername')
+    logger.info("Client connected", extra={'client': addr})
+    CLIENTS.inc()
+    try:
+        while True:
+            message = await reader.readline()
+            if not message: # client closed the connection
+                break
+            command = message.decode(encoding='utf-8').strip()
+            if not command:
+                continue
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Command received", extra={'command': command})
+            COMMANDS.labels(command if len(command) == 1 else "other").inc()
+            reply = handle_command(command, encoders, journal)
+            writer.write(f"{reply}\n".encode(encoding='utf-8'))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        logger.info("Client disconnected", extra={'client': addr})
+        CLIENTS.dec()
+        writer.close()
+
+async def handle_metrics(reader:asyncio.StreamReader, writer:asyncio.StreamWriter)->None:
+    """
+    Minimal HTTP/1.0 responder: GET /metrics returns the metrics, anything else 404
+    """
+    try:
+        request_line = (await reader.readline()).decode(encoding='utf-8', errors='replace').split()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""): # skip the headers
+            pass
+        if len(request_line) >= 2 and request_line[0] == "GET" and request_line[1].split("?")[0] == "/metrics":
+            status, content_type, body = "200 OK", metrics.CONTENT_TYPE, metrics.render().encode(encoding='utf-8')
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode(encoding='utf-8') + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(encoders, journal:EncoderJournal)->None:
+    """
+    Runs the position server; any number of clients can stay connected at once
+    """
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(reader, writer, encoders, journal), HOST, PORT)
+    logger.info(f"Encoder server listening on {HOST}:{PORT}")
+    for encoder in encoders:
+        POSITION.labels(encoder.ID).set_function(lambda encoder=encoder: encoder.position)
+        MISSED_EDGES.labels(encoder.ID).set_function(lambda encoder=encoder: encoder.error_count)
+    metrics_server = await asyncio.start_server(handle_metrics, METRICS_HOST, METRICS_PORT)
+    logger.info(f"Encoder metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    async with server, metrics_server:
+        await asyncio.gather(server.serve_forever(), metrics_server.serve_forever())
 
 def main():
-    # if file does not exist
-    if os.path.exists(ENCODER_SAVE_FILE):
-        with open(ENCODER_SAVE_FILE,'rb') as file:
-            encoders = pickle.load(file)
-    else:
-        encoders = [
-            Encoder(ENCODER_A_1, ENCODER_B_1, INDEX_1, 1),
-            Encoder(ENCODER_A_2, ENCODER_B_2, INDEX_2, 2),
-            Encoder(ENCODER_A_3, ENCODER_B_3, INDEX_3, 3),
-            Encoder(ENCODER_A_4, ENCODER_B_4, INDEX_4, 4)
-        ]
+    setup_logging("encoder")
+    encoders = [
+        Encoder(ENCODER_A_1, ENCODER_B_1, INDEX_1, 1),
+        Encoder(ENCODER_A_2, ENCODER_B_2, INDEX_2, 2),
+        Encoder(ENCODER_A_3, ENCODER_B_3, INDEX_3, 3),
+        Encoder(ENCODER_A_4, ENCODER_B_4, INDEX_4, 4)
+    ]
+    journal = EncoderJournal(ENCODER_SAVE_FILE, len(encoders), JOURNAL_FLUSH_INTERVAL_S, JOURNAL_FSYNC)
+    positions = load_positions(journal)
+    if positions is not None:
+        for encoder, saved_position in zip(encoders, positions):
+            encoder.position = saved_position
     
     for encoder in encoders:
         encoder.initGPIO()
-        # print(f"{encoder.position}")
+    journal.start(lambda: [encoder.position for encoder in encoders])
 
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-            server_socket.bind((HOST, PORT))
-            server_socket.listen()
-            # print(f"Connected to server at {HOST}:{PORT}")
-            while True:
-                conn, addr = server_socket.accept()
-                # Receive the server's message (channel request)
-                message = conn.recv(1024)
-                channel = message.decode(encoding='utf-8').strip()
-                print(f"Server requested: {channel}")
-                if int(channel) == channel_command.CALIBRATE: # if the reset command is recieved
-                    calibrate(encoders)
-                    for encoder in encoders:
-                        print(f"{encoder.position}")
-                else:
-                    # Find the position for the requested channel
-                    for encoder in encoders:
-                        if encoder.ID == int(channel):
-                            print(f"{encoder.position}")
-                            conn.sendall(f"{encoder.position}".encode(encoding='utf-8'))
-                            # saves encoder positions to a file using pickle
-                            with open(ENCODER_SAVE_FILE,'wb') as file:
-                                pickle.dump(encoders,file)
-                            # exit for loop
-                            break
+        asyncio.run(serve(encoders, journal))
     except KeyboardInterrupt:
-        print("Exiting program.")
+        logger.info("Exiting program.")
     finally:
+        journal.stop()
         GPIO.cleanup()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,17 @@
-import RPi.GPIO as GPIO
+import os
+if os.environ.get("TUNER_SIMULATION"):
+    import gpio_sim as GPIO # Simulated steppers and encoders for running off the Pi
+else:
+    import RPi.GPIO as GPIO
+import logging
 import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import Counter, Histogram
+from tuner_log import setup_logging
+
+logger = logging.getLogger("motors")
 
 RST = 2 # reset pin for all motors
 GPIO.setmode(GPIO.BCM)  # Use Broadcom pin numbers
@@ -31,10 +42,149 @@ EN_4 = 24
 HOST = "127.0.0.1"  # Localhost
 PORT = 65432        # Port number for communication
 
+NUM_MOTORS = 4
+
 # PWM configuration
 FREQUENCY =  80 # 80Hz suit the encoder 200 ppr resolution
 DELAY_ONE_STEP = 1/FREQUENCY
 DUTY = 50
+PULSES_PER_STEP = 2 # PWM pulses per RUN_STEPS unit
+
+# Trapezoidal motion profile: moves start at START_FREQUENCY, ramp at ACCELERATION up to
+# CRUISE_FREQUENCY and ramp back down into the target. Short moves never reach cruise.
+START_FREQUENCY = FREQUENCY # Hz, speed the motor can start and stop at without losing steps
+ACCELERATION = 800 # Hz per second
+CRUISE_FREQUENCY = 320 # Hz, the 4x encoder decoding keeps up at this rate
+RAMP_UPDATE_INTERVAL = 0.02 # Seconds between PWM frequency updates while ramping
+
+# Closed-loop positioning
+ENCODER_COUNTS_PER_STEP = 2 # 4x encoder counts per RUN_STEPS unit (two PWM pulses per step)
+POSITION_POLL_INTERVAL = 0.02 # Seconds between encoder reads while moving to a target
+MOVE_TIMEOUT_FACTOR = 1.5 # A feedback move is abandoned after this multiple of its nominal run time
+MAX_CORRECTIONS = 3 # Correction moves allowed after the first move of move_to()
+
+# Metrics, served at /metrics by app.py
+ENCODER_REQUEST_SECONDS = Histogram("encoder_request_seconds", "Round trip of one encoder server command",
+                                    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1))
+ENCODER_CLIENT_ERRORS = Counter("encoder_client_errors_total", "Failed encoder server exchanges (the client reconnects)")
+MOVE_SECONDS = Histogram("motor_move_seconds", "Duration of one motor run, PWM on to off", ["motor"],
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+MOVE_STEPS = Histogram("motor_move_steps", "Commanded RUN_STEPS of one motor run", ["motor"],
+                       buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+CORRECTIONS = Counter("motor_corrections_total", "Correction moves made after the first move of move_to", ["motor"])
+
+class MotionProfile:
+    """
+    Trapezoidal velocity profile for one motor, executed by re-programming the
+    step PWM frequency at fixed intervals.
+    """
+    def __init__(self, start_hz:float = START_FREQUENCY, acceleration:float = ACCELERATION,
+                 cruise_hz:float = CRUISE_FREQUENCY)->None:
+        """
+        Args:
+            start_hz (float): Step rate at the start and end of every move.
+            acceleration (float): Ramp rate in Hz per second; 0 runs at start_hz throughout.
+            cruise_hz (float): Maximum step rate.
+        """
+        if start_hz <= 0 or acceleration < 0 or cruise_hz < start_hz:
+            raise ValueError("Profile needs 0 < start_hz <= cruise_hz and acceleration >= 0")
+        self.start_hz = start_hz
+        self.acceleration = acceleration
+        self.cruise_hz = cruise_hz
+
+    def plan(self, pulses:int)->list:
+        """
+        Split a move into constant-frequency segments whose pulses add up to `pulses`.
+        Ramp segments run at the speed in the middle of their interval, so each one
+        emits exactly the pulses of the ideal linear ramp.
+
+        Returns:
+            list: (frequency Hz, duration s) tuples in execution order.
+        """
+        if pulses <= 0:
+            return []
+        if self.acceleration == 0 or self.cruise_hz == self.start_hz:
+            return [(self.start_hz, pulses / self.start_hz)]
+
+        a, v_start = self.acceleration, self.start_hz
+        # Pulses needed to reach cruise; if the move is too short, peak half way instead
+        ramp_pulses = (self.cruise_hz ** 2 - v_start ** 2) / (2 * a)
+        if 2 * ramp_pulses >= pulses:
+            ramp_pulses = pulses / 2
+        v_peak = (v_start ** 2 + 2 * a * ramp_pulses) ** 0.5
+        ramp_time = (v_peak - v_start) / a
+
+        ramp = []
+        elapsed = 0.0
+        while elapsed < ramp_time - 1e-9:
+            duration = min(RAMP_UPDATE_INTERVAL, ramp_time - elapsed)
+            ramp.append((v_start + a * (elapsed + duration / 2), duration))
+            elapsed += duration
+        cruise_pulses = pulses - 2 * ramp_pulses
+        cruise = [(v_peak, cruise_pulses / v_peak)] if cruise_pulses > 0 else []
+        return ramp + cruise + ramp[::-1]
+
+class EncoderClient:
+    """
+    Keeps one connection open to the Encoder.py position server and exchanges
+    newline-framed commands over it. Safe to share between threads.
+    """
+    def __init__(self, host:str, port:int)->None:
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def connect(self)->None:
+        """
+        Open the connection to the position server
+        """
+        self.sock = socket.create_connection((self.host, self.port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # small messages, no Nagle delay
+        self.reader = self.sock.makefile('rb')
+
+    def close(self)->None:
+        """
+        Close the connection, the next request reconnects
+        """
+        if self.sock:
+            try:
+                self.reader.close()
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.reader = None
+
+    def request(self, command:str)->str:
+        """
+        Send one command and return its reply. Reconnects once if the server went away.
+        """
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    start = time.perf_counter()
+                    self.sock.sendall(f"{command}\n".encode(encoding='utf-8'))
+                    reply = self.reader.readline()
+                    if not reply:
+                        raise ConnectionError("Encoder server closed the connection")
+                    ENCODER_REQUEST_SECONDS.observe(time.perf_counter() - start)
+                    break
+                except OSError:
+                    ENCODER_CLIENT_ERRORS.inc()
+                    self.close()
+                    if attempt == 1:
+                        raise
+        reply = reply.decode(encoding='utf-8').strip()
+        if reply.startswith("ERR"):
+            raise RuntimeError(f"Encoder server rejected {command!r}: {reply}")
+        return reply
+
+encoder_client = EncoderClient(HOST, PORT)
+
 class Motor: 
     def __init__(self, DIR:int, STEP:int, EN:int, ID:int)->None:
         """
@@ -44,6 +194,8 @@ class Motor:
         self.STEP = STEP
         self.EN = EN
         self.ID = ID
+        self.profile = MotionProfile()
+        self.stop_event = threading.Event() # set by stop_motor(), cleared by clear_stop()
         
         GPIO.setmode(GPIO.BCM)  # Use Broadcom pin numbers
         GPIO.setup(self.DIR, GPIO.OUT)  # Direction pin
@@ -51,6 +203,8 @@ class Motor:
         GPIO.setup(self.EN, GPIO.OUT)  # Enable pin
 
         GPIO.output(self.EN, GPIO.HIGH) # Disable H Bridge
+        if hasattr(GPIO, "attach_stepper"): # gpio_sim: step pulses move the simulated axis
+            GPIO.attach_stepper(self.STEP, self.DIR, self.EN, self.ID)
 
     def move_motor(self, RUN_STEPS:int)->None:
         """
@@ -58,51 +212,150 @@ class Motor:
         Positive RUN_STEPS moves clockwise (DIR=1),
         Negative RUN_STEPS moves counterclockwise (DIR=0).
         """
+        self._run(RUN_STEPS)
+
+    def _run(self, RUN_STEPS:int, target:int = None, tolerance:int = 0)->None:
+        """
+        Drive the step PWM for RUN_STEPS following the motor's motion profile. With a
+        target, the encoder is polled while stepping and the PWM stops as soon as the
+        target is reached (within tolerance). stop_motor() ends the move early, and
+        makes every later move return at once until clear_stop() is called.
+        """
         direction = 0 if RUN_STEPS > 0 else 1
         if direction == 1:
             GPIO.output(self.DIR, GPIO.HIGH)
         elif direction == 0:
             GPIO.output(self.DIR, GPIO.LOW)
+        segments = self.profile.plan(abs(RUN_STEPS) * PULSES_PER_STEP)
+        if not segments or self.stop_event.is_set():
+            return
         GPIO.output(self.EN, GPIO.LOW) # Enable H Bridge  
+        MOVE_STEPS.labels(self.ID).observe(abs(RUN_STEPS))
+        start = time.perf_counter()
         # Start PWM and run for request steps
-        RUN_TIME = abs(RUN_STEPS) * DELAY_ONE_STEP * 2.0
-        # print(RUN_TIME)
-        step = GPIO.PWM(self.STEP,FREQUENCY)
+        step = GPIO.PWM(self.STEP,segments[0][0])
         step.start(DUTY)
-        time.sleep(RUN_TIME)
-        step.stop()  
-        GPIO.output(self.EN, GPIO.HIGH) # Disable H Bridge
+        try:
+            if target is None:
+                for frequency, duration in segments:
+                    step.ChangeFrequency(frequency)
+                    if self.stop_event.wait(duration):
+                        break
+            else:
+                self._follow_with_feedback(step, segments, 1 if RUN_STEPS > 0 else -1, target, tolerance)
+        finally:
+            step.stop()  
+            GPIO.output(self.EN, GPIO.HIGH) # Disable H Bridge
+            MOVE_SECONDS.labels(self.ID).observe(time.perf_counter() - start)
 
-    def request_position(self)->str:
+    def _follow_with_feedback(self, step, segments:list, sign:int, target:int, tolerance:int)->None:
         """
-        Request capacitor position from encoder
+        Play the profile segments while polling the encoder, until the remaining travel
+        towards target is within tolerance. The distance moved since the previous poll
+        is used as a lead, so the PWM stops about where the next poll would have found
+        the target. If the profile ends first (missed steps), the motor keeps running at
+        the start speed until MOVE_TIMEOUT_FACTOR times the planned duration.
+        """
+        boundaries = []
+        elapsed = 0.0
+        for frequency, duration in segments:
+            elapsed += duration
+            boundaries.append(elapsed)
+        start = time.monotonic()
+        deadline = start + elapsed * MOVE_TIMEOUT_FACTOR
+        index = 0
+        previous = self.request_position()
+        while time.monotonic() < deadline:
+            now = time.monotonic() - start
+            while index < len(segments) and now >= boundaries[index]:
+                index += 1
+                step.ChangeFrequency(segments[index][0] if index < len(segments) else self.profile.start_hz)
+            until_boundary = boundaries[index] - now if index < len(segments) else POSITION_POLL_INTERVAL
+            if self.stop_event.wait(min(POSITION_POLL_INTERVAL, until_boundary)):
+                return
+            position = self.request_position()
+            remaining = (target - position) * sign
+            lead = abs(position - previous) / 2
+            if remaining <= tolerance + lead:
+                return
+            previous = position
+
+    def move_to(self, target:int, tolerance:int = 1, max_corrections:int = MAX_CORRECTIONS)->tuple:
         """
-        channel_request = f"{self.ID}"
-        print(f"Request motor: {self.ID}") # recieve encoder position
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-            client_socket.connect((HOST, PORT))
-            client_socket.sendall(channel_request.encode(encoding='utf-8'))
-            message = client_socket.recv(1024)
+        Move to an absolute encoder position using encoder feedback. The first move
+        stops when the encoder reaches the target; if the capacitor then sits outside
+        the tolerance, up to max_corrections shorter moves are made towards it.
 
-        return message.decode(encoding='utf-8')
+        Args:
+            target (int): Target encoder position (4x counts).
+            tolerance (int): Accepted distance from the target, in encoder counts.
+            max_corrections (int): Correction moves allowed after the first move.
+
+        Returns:
+            tuple: (final encoder position, number of moves made)
+        """
+        position = self.request_position()
+        iterations = 0
+        while (abs(target - position) > tolerance and iterations <= max_corrections
+               and not self.stop_event.is_set()):
+            error = target - position
+            # Round the travel to whole steps, but always make at least one step
+            RUN_STEPS = round(error / ENCODER_COUNTS_PER_STEP) or (1 if error > 0 else -1)
+            self._run(RUN_STEPS, target, tolerance)
+            iterations += 1
+            position = self.request_position()
+        if iterations > 1:
+            CORRECTIONS.labels(self.ID).inc(iterations - 1)
+        return position, iterations
+
+    def request_position(self)->int:
+        """
+        Request capacitor position from encoder
+        """
+        position = int(encoder_client.request(f"{self.ID}")) # recieve encoder position
+        if logger.isEnabledFor(logging.DEBUG): # polled every POSITION_POLL_INTERVAL while moving
+            logger.debug("Position read", extra={'motor': self.ID, 'position': position})
+        return position
         
     def stop_motor(self):
          """
-         Stop the motor.
+         Stop the motor. Safe to call from another thread: a move in progress
+         returns at its next check and shuts its PWM down itself.
          """
-         print("STOP signal received! Stopping motor...")
+         logger.info("Stop requested", extra={'motor': self.ID})
+         self.stop_event.set()
          GPIO.output(self.EN, GPIO.HIGH)  # Disable H Bridge
          GPIO.output(self.STEP, GPIO.LOW) # Stop PWM signal
 
+def clear_stop()->None:
+    """
+    Re-arm every motor after stop_motor(). Called when a sweep job or a manual move
+    takes the motors, never between the moves of a job, so a stop that lands between
+    two moves still stops the next one.
+    """
+    for motor in motors:
+        motor.stop_event.clear()
+
 def reset_position():
     """
     Reset encoder position
     """
-    channel_request = f"{0}"
-    print(f"Request reset") # recieve encoder position
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-        client_socket.connect((HOST, PORT))
-        client_socket.sendall(channel_request.encode(encoding='utf-8'))
+    logger.info("Encoder positions reset")
+    encoder_client.request(f"{0}")
+
+def request_all_positions()->list:
+    """
+    Request all capacitor positions from the encoder in one round trip
+    """
+    reply = encoder_client.request("A")
+    return [int(position) for position in reply.split(",")]
+
+def request_encoder_errors()->list:
+    """
+    Request the missed-edge (illegal quadrature transition) counts of all encoders
+    """
+    reply = encoder_client.request("E")
+    return [int(count) for count in reply.split(",")]
 
 motors = [
     Motor(DIR_1, STEP_1, EN_1, 1),
@@ -111,22 +364,103 @@ motors = [
     Motor(DIR_4, STEP_4, EN_4, 4),
 ]
 
+# One worker per axis so every motor in a multi-axis move steps at the same time
+motion_executor = ThreadPoolExecutor(max_workers=NUM_MOTORS, thread_name_prefix="motor")
+
+def _as_int(value, name:str)->int:
+    """
+    Converts a motor ID, step count or position (an int, or its decimal string) to int.
+    Fractional values are rejected rather than truncated.
+    """
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{name} must be an integer, not {value!r}")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer, not {value!r}") from None
+
+def _validate_axes(arguments:dict)->dict:
+    """
+    Checks every motor ID and argument of a multi-axis call before any axis moves.
+
+    Returns:
+        dict: Motor ID (int) -> argument (int).
+
+    Raises:
+        ValueError: If an ID is not a motor, appears twice (e.g. 1 and "1"), or an argument
+                    is not an integer.
+    """
+    if not isinstance(arguments, dict):
+        raise ValueError(f"Expected {{motor: value}}, not {arguments!r}")
+    checked = {}
+    for motor_id, argument in arguments.items():
+        number = _as_int(motor_id, "Motor ID")
+        if not 1 <= number <= NUM_MOTORS:
+            raise ValueError(f"Unknown motor {motor_id}")
+        if number in checked:
+            raise ValueError(f"Motor {number} given more than once")
+        checked[number] = _as_int(argument, f"Value for motor {number}")
+    return checked
+
+def _run_on_axes(method:str, arguments:dict, **kwargs)->dict:
+    """
+    Call the same Motor method on several axes concurrently and wait for all of them.
+    All arguments are validated first, so an invalid request moves no axis.
+    If any axis fails, the first error is raised once every axis has finished.
+    """
+    futures = {}
+    for motor_id, argument in _validate_axes(arguments).items():
+        futures[motor_id] = motion_executor.submit(getattr(motors[motor_id - 1], method), argument, **kwargs)
+    results, error = {}, None
+    for motor_id, future in futures.items():
+        try:
+            results[motor_id] = future.result()
+        except Exception as e:
+            error = error or e
+    if error:
+        raise error
+    return results
+
+def move_all(moves:dict)->None:
+    """
+    Move several motors by relative steps at the same time, e.g. move_all({1: +120, 3: -40}).
+    Returns when the last axis has finished, so the total time is that of the longest move.
+
+    Args:
+        moves (dict): Motor ID (1-4) -> RUN_STEPS, as for Motor.move_motor.
+    """
+    _run_on_axes("move_motor", moves)
+
+def move_all_to(targets:dict, tolerance:int = 1)->dict:
+    """
+    Move several motors to absolute encoder positions at the same time, in closed loop.
+
+    Args:
+        targets (dict): Motor ID (1-4) -> target encoder position.
+        tolerance (int): Accepted distance from each target, in encoder counts.
+
+    Returns:
+        dict: Motor ID -> (final encoder position, number of moves made), as for Motor.move_to.
+    """
+    return _run_on_axes("move_to", targets, tolerance=tolerance)
+
 def main():
     try:
         # while True:
         # Create a TCP server to receive encoder signals   
         # Bind the socket to address and port
-        print(f"Motor control script running, Listening on {HOST}:{PORT}")
+        setup_logging("motors")
+        logger.info(f"Motor control script running, encoder server at {HOST}:{PORT}")
         # reset_position()
         while True:
             for i in range(4):
                 motors[i].move_motor(-100)  # Move forward x steps
                 position = motors[i].request_position() # Request position from Encoder.py
-                print(f"Received position from client: {position}")
+                logger.info("Received position", extra={'motor': i + 1, 'position': position})
                 time.sleep(2)
 
     except KeyboardInterrupt:
-        print("Motor movement stopped by user")
+        logger.info("Motor movement stopped by user")
     finally:
         ...
         # time.sleep(5)
@@ -1,31 +1,80 @@
-from flask import Flask, send_from_directory, request, flash, jsonify,send_file
+from flask import Flask, send_from_directory, request, flash, jsonify,send_file, Response, stream_with_context
 import Impedance_Tuning as it
-from vna_impedance import VNAController, VNA_ADDRESS
-import traceback
-
-import csv # Import csv module for handling CSV files
-import io
+from vna_pool import VNAPool, VNAUnavailable, load_instruments
+import impedance_conversion as ic
+from sweep_jobs import SweepJobManager, JobStatus
+from measurement_store import MeasurementStore, DEFAULT_DB_PATH, RUN_SINGLE, RUN_AUTO_TUNE, READ_CHUNK_SIZE
+from measurement_export import export_points, export_filename, available_formats, EXPORT_FORMATS
+from decimation import decimate, METHODS as DECIMATION_METHODS
+from sweep_plan import parse_axes, grid_points, count_points, ORDERS, ORDER_SERPENTINE
+from auto_tune import AutoTuner, METHOD_COORDINATE
+from tuning_map import TuningMap, load_default_map
+import metrics
+from metrics import Gauge
+from tuner_log import setup_logging
+
+from contextlib import contextmanager
+import json
+import logging
+import sys
+import threading
+import time
+import numpy as np
 
 # --- Flask Application Setup ---
 UPLOAD_FOLDER = './uploads'
 ALLOWED_EXTENSIONS = {'txt','pdf','png','jpg','jpeg','gif'}
 app = Flask(__name__,static_folder='src/static')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+logger = logging.getLogger("app")
 
-# Global instance for VNAController
-vna:VNAController = None
+# VNAs leased to measurements (None: no VNA could be connected, impedances are simulated)
+vna_pool:VNAPool = None
 
-# Global list to store impedance history
-# Each entry will be a dictionary containing:
+# Measurement history, persisted in SQLite. Each entry of a run is a dictionary containing:
 # 'motor_positions': List of current positions for motors 1-4
 # 'frequency_mhz': Frequency at which impedance was measured
 # 'real_impedance': Real part of the measured impedance
 # 'imag_impedance': Imaginary part of the measured impedance
+# 'gamma_real', 'gamma_imag': Reflection coefficient, pre-computed for the Smith chart
 # 'color': Color associated with the data point for plotting/display
-impedance_history = []
-
-# Global list to store impedance history for parameter sweeps
-sweep_history = []
+store = MeasurementStore(DEFAULT_DB_PATH)
+
+# Run holding the single measurements of the Motor Control tab (resumed after a restart)
+single_run_id = store.latest_run(RUN_SINGLE) or store.create_run(RUN_SINGLE)
+
+# Sweep jobs run on a background worker thread, one at a time; each job is a run in the store
+sweep_jobs = SweepJobManager(store)
+SSE_KEEPALIVE_S = 15 # Comment line sent on an idle event stream so proxies keep it open
+MAX_QUERY_PAGE = 5000 # Largest page /query_points returns
+MAX_DECIMATED_POINTS = 10000 # Largest decimated result /query_points returns
+
+# Inverse tuning map (impedance -> motor positions) built from the recordings in data/
+# on first use, and extended with every sweep measured on the VNA
+tuning_map:TuningMap = None
+tuning_map_lock = threading.Lock()
+
+# History sizes and sweep rate, computed when /metrics is scraped
+Gauge("measurement_store_points", "Points in the measurement store").set_function(store.total_points)
+Gauge("measurement_store_pending_points", "Points buffered for the next store write").set_function(
+    lambda: len(store.pending))
+Gauge("sweep_jobs_retained", "Sweep and auto-tune jobs kept for status queries").set_function(
+    lambda: len(sweep_jobs.jobs))
+Gauge("sweep_recent_points", "Sweep points held in memory for live readers").set_function(
+    lambda: sum(len(job.recent_points) for job in list(sweep_jobs.jobs.values())))
+def running_points_per_minute()->float:
+    job = sweep_jobs.running()
+    return job.points_per_minute() if job else 0.0
+Gauge("sweep_points_per_minute", "Measuring rate of the running job (0 when idle)").set_function(
+    running_points_per_minute)
+Gauge("tuning_map_samples", "Samples in the tuning map (0 until it is first used)").set_function(
+    lambda: len(tuning_map) if tuning_map is not None else 0)
+
+# Ownership of the motors: a running sweep or auto-tune job has them to itself, so manual
+# moves are refused (409) rather than interleaved with the job's moves or clearing its stop request
+motion_condition = threading.Condition()
+manual_moves = 0 # Manual moves in progress
+job_owns_motors = False
 
 # Dummy motor positions for simulation if Impedance_Tuning is not available
 simulated_motor_positions = [0, 0, 0, 0]
@@ -34,21 +83,28 @@ simulated_motor_positions = [0, 0, 0, 0]
 # INIT VNA
 #--------------------------------------------------------------------------------
 
-# Initialize VNAController when app start .......................................
+# Initialize the VNA pool when app start .......................................
 # @app.before_first_request
-def initialize_vna_controller():
+def initialize_vna_pool():
     """
-    Initializes the VNAController global instance.
+    Connects the VNAs listed in VNA_INSTRUMENTS (or the one at VNA_ADDRESS) and starts
+    their health checks. If none of them can be connected, impedances are simulated.
     This function is called when the Flask application starts.
     """
-    global vna
+    global vna_pool
     try:
-        vna = VNAController(VNA_ADDRESS)
-        print("VNA Controller initialized successfully.")
-    except ConnectionError as e:
-        print(f"Application failed to initialize VNA: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred during VNA controller initialization: {e}")
+        pool = VNAPool(load_instruments())
+        pool.start()
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Application failed to load the VNA configuration: {e}")
+        return
+    if not any(status['state'] != "offline" for status in pool.status()):
+        logger.error("Application failed to connect to any VNA, impedances are simulated.")
+        pool.close()
+        return
+    vna_pool = pool
+    logger.info("VNA pool initialized successfully.", extra={'instruments': {status['name']: status['state']
+                                                                            for status in pool.status()}})
 
 # Ensure VNA connection is closed when the app context tears down
 # @app.teardown_appcontext
@@ -58,10 +114,123 @@ def initialize_vna_controller():
 #         vna.close()
 #         vna = None # Clear the instance
 
+def reflection_fields(real_impedance: float, imag_impedance: float, z0: float = ic.Z0)->dict:
+    """
+    Returns the reflection coefficient of an impedance as JSON-ready fields,
+    so the browser can plot it without repeating the conversion.
+    """
+    gamma = complex(ic.impedance_to_gamma(complex(real_impedance, imag_impedance), z0))
+    return {'gamma_real': gamma.real, 'gamma_imag': gamma.imag}
+
+def measurement_fields(impedance_data_from_vna: dict)->dict:
+    """
+    The fields a measurement adds to a data point: impedance, reflection coefficient
+    and, when measured on a pooled VNA, the instrument's name.
+    """
+    fields = {'real_impedance': impedance_data_from_vna['real_impedance'],
+              'imag_impedance': impedance_data_from_vna['imag_impedance'],
+              **reflection_fields(impedance_data_from_vna['real_impedance'],
+                                  impedance_data_from_vna['imag_impedance'],
+                                  impedance_data_from_vna.get('z0', ic.Z0))}
+    if impedance_data_from_vna.get('instrument') is not None:
+        fields['instrument'] = impedance_data_from_vna['instrument']
+    return fields
+
+def measure_impedance(target_frequency_hz: float, instrument: str = None)->dict:
+    """
+    Measures impedance on a VNA leased from the pool, or simulates a response if no VNA
+    is connected (for testing without hardware).
+
+    Args:
+        target_frequency_hz (float): Measurement frequency in Hz.
+        instrument (str): Name of the VNA to use, or None for any VNA covering the frequency.
+
+    Returns:
+        dict: The VNAController result plus the 'instrument' that measured it and its 'z0',
+              or an error message.
+    """
+    if vna_pool is None:
+        import random
+        real_imp = random.uniform(10, 100)
+        imag_imp = random.uniform(-50, 50)
+        impedance_data_from_vna = {'real_impedance': real_imp, 'imag_impedance': imag_imp}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Simulated impedance", extra=impedance_data_from_vna)
+        return impedance_data_from_vna
+    # Attempt to get actual impedance from VNA
+    try:
+        with vna_pool.lease(instrument, target_frequency_hz) as leased:
+            result = leased.controller.get_impedance(target_frequency_hz)
+            leased.failed = "error" in result # checked by the pool before its next lease
+            return {**result, 'instrument': leased.name, 'z0': leased.controller.z0}
+    except VNAUnavailable as e:
+        return {"error": f"{e}"}
+
+def check_instrument(name)->None:
+    """
+    Raises ValueError if a VNA name is given but not configured.
+    """
+    if name is not None and vna_pool is not None and name not in vna_pool.instruments:
+        raise ValueError(f"Unknown VNA {name}")
+
+def stop_all_motors()->None:
+    """
+    Stops every motor; used when a sweep job is cancelled.
+    """
+    for motor in it.motors:
+        motor.stop_motor()
+
+class MotorsBusy(Exception):
+    """
+    Raised when a manual move is requested while a job owns the motors.
+    """
+
+@contextmanager
+def manual_motion():
+    """
+    Wraps a manual move (as a decorator or `with` block).
+
+    Raises:
+        MotorsBusy: If a sweep or auto-tune job is running; answered with 409.
+    """
+    global manual_moves
+    with motion_condition:
+        if job_owns_motors or sweep_jobs.running():
+            raise MotorsBusy()
+        manual_moves += 1
+        it.clear_stop()
+    try:
+        yield
+    finally:
+        with motion_condition:
+            manual_moves -= 1
+            motion_condition.notify_all()
+
+@contextmanager
+def job_motion():
+    """
+    Wraps a job's run function: waits for manual moves in progress to finish, then
+    holds the motors until the job ends.
+    """
+    global job_owns_motors
+    with motion_condition:
+        motion_condition.wait_for(lambda: manual_moves == 0)
+        job_owns_motors = True
+        it.clear_stop() # once per job: a cancel between two of its moves must stop the next one
+    try:
+        yield
+    finally:
+        with motion_condition:
+            job_owns_motors = False
+
 #--------------------------------------------------------------------------------
 # ROUTES
 #--------------------------------------------------------------------------------
 
+@app.errorhandler(MotorsBusy)
+def motors_busy(e):
+    return jsonify({"error": "The motors are in use by a running sweep or auto-tune job."}), 409
+
 # Web Server Resource Handlers ................................................
 @app.route('/')
 def home():
@@ -71,40 +240,99 @@ def home():
 @app.route('/static/<path:fileName>')
 def staticFileHandler(fileName):
     """Serves static files (CSS, JS) from the 'static' directory."""
-    print(f"attempt to access static file: static/{fileName}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Static file requested", extra={'path': f"static/{fileName}"})
     return send_from_directory('static', fileName)
 
 # Motor Control Event Handlers .....................................................
 @app.route('/button/<int:n>_<int(signed=True):value>')
+@manual_motion()
 def doButtonThing(n,value):
     it.motors[n-1].move_motor(value)
     position = it.motors[n-1].request_position()
-    print(f'button {n} was pressed, motor move {position} steps')
+    logger.info("Button pressed", extra={'motor': n, 'steps': value, 'position': position})
     return f'{position}'
 
+@app.route('/button/<int:n>/move_to/<int(signed=True):target>')
+@manual_motion()
+def moveMotorTo(n,target):
+    """Moves motor n to an absolute encoder position in closed loop."""
+    position, moves = it.motors[n-1].move_to(target)
+    logger.info("Motor moved", extra={'motor': n, 'position': position, 'target': target, 'moves': moves})
+    return jsonify({"position": position, "moves": moves})
+
+@app.route('/move_all', methods=['POST'])
+@manual_motion()
+def moveAllMotors():
+    """
+    Moves several motors at once. The JSON body holds either 'moves'
+    ({motor: steps}, relative) or 'targets' ({motor: position}, closed loop).
+    """
+    data = request.get_json()
+    try:
+        if 'targets' in data:
+            results = it.move_all_to(data['targets'])
+            positions = {n: position for n, (position, _) in results.items()}
+        else:
+            it.move_all(data.get('moves', {}))
+            positions = dict(zip(range(1, it.NUM_MOTORS + 1), it.request_all_positions()))
+    except ValueError as e:
+        return jsonify({"error": f"{e}"}), 400
+    logger.info("Multi-axis move finished", extra={'positions': positions})
+    return jsonify(positions)
+
+@app.route('/motion_profile/<int:n>', methods=['GET', 'POST'])
+def motionProfile(n):
+    """
+    Reads (GET) or replaces (POST JSON: start_hz, acceleration, cruise_hz) the
+    trapezoidal motion profile of motor n. A POST is refused (409) while a job owns the motors.
+    """
+    if not 1 <= n <= it.NUM_MOTORS:
+        return jsonify({"error": f"Unknown motor {n}"}), 400
+    motor = it.motors[n-1]
+    if request.method == 'POST':
+        data = request.get_json()
+        try:
+            profile = it.MotionProfile(float(data.get('start_hz', it.START_FREQUENCY)),
+                                       float(data.get('acceleration', it.ACCELERATION)),
+                                       float(data.get('cruise_hz', it.CRUISE_FREQUENCY)))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"{e}"}), 400
+        with manual_motion():
+            motor.profile = profile
+    profile = motor.profile
+    return jsonify({"start_hz": profile.start_hz, "acceleration": profile.acceleration,
+                    "cruise_hz": profile.cruise_hz})
+
 @app.route('/button/calibrate')
+@manual_motion()
 def calibrate_motor():
     it.reset_position()
-    print('motor position reseted')
+    logger.info("Motor positions reset")
     return f'Reset Position OK'
 
 @app.route('/button/getAllPositions')
 def getAllPositions():
-    position_all = []
-    for i in range(4):
-        position_all.append(it.motors[i].request_position())
-    print(f'All motors position listed: {position_all}')
+    position_all = it.request_all_positions()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("All motor positions listed", extra={'positions': position_all})
     # create comma separated values (csv) string
     positionStr = str(position_all)[1:-1]
     return positionStr
 
+@app.route('/button/getEncoderErrors')
+def getEncoderErrors():
+    """Returns the missed-edge error count of every encoder."""
+    return jsonify(it.request_encoder_errors())
+
 # VNA Impedance Measurement Handler (Single Measurement Tab) ......................
 @app.route('/get_impedance', methods=['POST'])
 def get_impedance_data():
     """
     Flask route to get impedance from VNA at a specified frequency in MHz.
-    Receives frequency, motor positions, and dataset color from the frontend via POST request.
-    Stores the complete data set in impedance_history.
+    Receives frequency, motor positions, and dataset color from the frontend via POST request,
+    and optionally the 'instrument' (VNA name) to measure on.
+    Stores the complete data set in the single measurement run of the store.
     Used by the 'Motor Control' tab.
     """
     data = request.get_json() # Get JSON data from the request body
@@ -114,24 +342,17 @@ def get_impedance_data():
 
     if frequency_mhz is None or motor_positions is None or dataset_color is None:
         return jsonify({"error": "Missing data: frequency, motor positions, or color."}), 400
-    
-    target_frequency_hz = frequency_mhz * 1e6 # Convert MHz to Hz
-    print(f"Request to get impedance at {frequency_mhz} MHz ({target_frequency_hz} Hz) "
-          f"with motor positions {motor_positions} and color {dataset_color}")
+    try:
+        check_instrument(data.get('instrument'))
+    except ValueError as e:
+        return jsonify({"error": f"{e}"}), 400
 
-    global vna, impedance_history
-    impedance_data_from_vna = {}
+    target_frequency_hz = frequency_mhz * 1e6 # Convert MHz to Hz
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Impedance requested", extra={'frequency_mhz': frequency_mhz, 'positions': motor_positions,
+                                                   'color': dataset_color})
 
-    if not vna:
-        # Simulate VNA response if not initialized (for testing without hardware)
-        import random
-        real_imp = random.uniform(10, 100)
-        imag_imp = random.uniform(-50, 50)
-        impedance_data_from_vna = {'real_impedance': real_imp, 'imag_impedance': imag_imp}
-        print(f"Simulated impedance: {impedance_data_from_vna}")
-    else:
-        # Attempt to get actual impedance from VNA
-        impedance_data_from_vna = vna.get_impedance(target_frequency_hz)
+    impedance_data_from_vna = measure_impedance(target_frequency_hz, data.get('instrument'))
 
     if "error" in impedance_data_from_vna:
         # If VNA returned an error, send it back to the client
@@ -141,183 +362,608 @@ def get_impedance_data():
         new_data_point = {
             'motor_positions': motor_positions,
             'frequency_mhz': frequency_mhz,
-            'real_impedance': impedance_data_from_vna['real_impedance'],
-            'imag_impedance': impedance_data_from_vna['imag_impedance'],
+            **measurement_fields(impedance_data_from_vna),
             'color': dataset_color
         }
-        impedance_history.append(new_data_point) # Add the new data point to the history list
+        store.add_point(single_run_id, new_data_point) # Add the new data point to the history
+        store.flush() # Single measurements are rare: persist each one at once
         return jsonify(new_data_point) # Return the newly added data point
 
-# CSV Export Handler (Single Measurement Tab) .....................................
+# History Query Handlers .......................................................
+def query_filters(args)->dict:
+    """
+    Point filters from query arguments: run_ids (comma-separated), kind,
+    frequency_min_mhz, frequency_max_mhz and motor<N>_min / motor<N>_max for N = 1-4.
+    """
+    motor_ranges = {}
+    for motor in range(1, it.NUM_MOTORS + 1):
+        low = args.get(f'motor{motor}_min', type=int)
+        high = args.get(f'motor{motor}_max', type=int)
+        if low is not None or high is not None:
+            motor_ranges[motor] = (low, high)
+    return {
+        'run_ids': [int(run_id) for run_id in args.get('run_ids', '').split(',') if run_id],
+        'kind': args.get('kind'),
+        'frequency_min_mhz': args.get('frequency_min_mhz', type=float),
+        'frequency_max_mhz': args.get('frequency_max_mhz', type=float),
+        'motor_ranges': motor_ranges,
+    }
+
+@app.route('/query_points')
+def query_points():
+    """
+    Queries stored points with filters (see query_filters), in run and sequence order.
+
+    Paginated by default: at most ?limit points (default READ_CHUNK_SIZE) per page, and
+    'next_cursor' is passed back as ?cursor= for the next page (null after the last).
+    With ?decimate=lttb or ?decimate=minmax the whole match is reduced on the server to
+    about ?max_points points (default 1000) that keep the shape of the sweep in the
+    Smith chart (both components of Γ), so a plot only receives what it can show.
+    With ?columns=gamma the points are returned as columns ('gamma_real', 'gamma_imag',
+    'real_impedance', 'imag_impedance', 'color') ready for plotting, instead of 'points'.
+    """
+    try:
+        filters = query_filters(request.args)
+        method = request.args.get('decimate')
+        if method:
+            if method not in DECIMATION_METHODS:
+                raise ValueError(f"Unknown decimation method {method}")
+            max_points = min(max(3, request.args.get('max_points', 1000, type=int)), MAX_DECIMATED_POINTS)
+            series = store.query_series(filters)
+            gamma = ic.impedance_to_gamma(series['impedance'])
+            kept = decimate([gamma.real, gamma.imag], max_points, method)
+            points = store.get_points_by_key(zip(series['run_id'][kept], series['seq'][kept]))
+            return jsonify({**query_result(points), 'matched': int(series['impedance'].size),
+                            'decimated': len(points) < series['impedance'].size, 'next_cursor': None})
+
+        cursor = request.args.get('cursor')
+        after = tuple(int(value) for value in cursor.split(':')) if cursor else None
+        if after is not None and len(after) != 2:
+            raise ValueError(f"Malformed cursor {cursor}")
+        limit = min(max(1, request.args.get('limit', READ_CHUNK_SIZE, type=int)), MAX_QUERY_PAGE)
+        points, next_after = store.query_points(filters, after, limit)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    return jsonify({**query_result(points), 'decimated': False,
+                    'next_cursor': None if next_after is None else f"{next_after[0]}:{next_after[1]}"})
+
+def query_result(points:list)->dict:
+    """
+    The points of a query, as point dicts or (with ?columns=gamma) as plotting columns.
+    """
+    if request.args.get('columns') != 'gamma':
+        return {'points': points}
+    real_impedance = [point['real_impedance'] for point in points]
+    imag_impedance = [point['imag_impedance'] for point in points]
+    gamma = ic.impedance_to_gamma(np.array(real_impedance, dtype=float) + 1j * np.array(imag_impedance, dtype=float))
+    return {'gamma_real': gamma.real.tolist(), 'gamma_imag': gamma.imag.tolist(),
+            'real_impedance': real_impedance, 'imag_impedance': imag_impedance,
+            'color': [point['color'] for point in points]}
+
+@app.route('/runs')
+def list_runs():
+    """
+    The newest stored runs (?kind= to filter, ?limit=) with their point counts, and the
+    run currently collecting single measurements.
+    """
+    return jsonify({'runs': store.runs(request.args.get('kind'), request.args.get('limit', 50, type=int)),
+                    'single_run_id': single_run_id})
+
+# Export Handlers ..............................................................
+def export_response(run_ids:list, export_format:str, filename:str):
+    """
+    Streams the points of one or more runs as a file download, reading them from the
+    store in chunks so that large runs are never held in memory.
+    """
+    points = (point for run_id in run_ids for point in store.iter_points(run_id))
+    try:
+        blocks = export_points(points, export_format)
+    except ValueError as e:
+        return jsonify({"error": f"{e}"}), 400
+    return Response(stream_with_context(blocks), mimetype=EXPORT_FORMATS[export_format][0],
+                    headers={'Content-Disposition': f'attachment; filename="{export_filename(filename, export_format)}"'})
+
 @app.route('/save_data_csv', methods=['POST'])
 def save_data_csv():
     """
-    Generates a CSV file from the stored single measurement impedance data.
-    The filename is provided by the user.
+    Streams the single measurement history as a file.
+    The filename is provided by the user; 'format' is one of available_formats() (default CSV).
     """
     data = request.get_json()
-    filename = data.get('filename', 'impedance_history').strip()
-    if not filename.endswith('.csv'):
-        filename += '.csv'
-
-    si = io.StringIO() # Create an in-memory text buffer
-    cw = csv.writer(si) # Create a CSV writer for the buffer
-
-    # Write header with all fields
-    cw.writerow([
-        'Data Number',
-        'Motor 1 Position',
-        'Motor 2 Position',
-        'Motor 3 Position',
-        'Motor 4 Position',
-        'Frequency (MHz)',
-        'Real Impedance (Ohms)',
-        'Imaginary Impedance (Ohms)',
-        'Color'
-    ])
-
-    # Write data rows
-    for i, row in enumerate(impedance_history):
-        # Ensure motor_positions is a list of 4 elements to avoid index errors
-        motor_pos = row.get('motor_positions', ['N/A', 'N/A', 'N/A', 'N/A'])
-        # Ensure motor_pos has exactly 4 elements, pad with 'N/A' if needed
-        while len(motor_pos) < 4:
-            motor_pos.append('N/A')
-
-        cw.writerow([
-            i + 1, # Data Number (row index + 1)
-            motor_pos[0],
-            motor_pos[1],
-            motor_pos[2],
-            motor_pos[3],
-            row.get('frequency_mhz', ''),
-            row.get('real_impedance', ''),
-            row.get('imag_impedance', ''),
-            row.get('color', '')
-        ])
-
-    output = io.BytesIO(si.getvalue().encode('utf-8')) # Encode string to bytes
-    output.seek(0) # Go to the beginning of the stream
-
-    return send_file(
-        output,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    return export_response([single_run_id], data.get('format', 'csv'), data.get('filename', 'impedance_history'))
+
+@app.route('/export_history')
+def export_history():
+    """
+    Streams the single measurement history as a file download.
+    Query: ?format= (csv, npz, parquet or arrow) and ?filename=.
+    Used by the 'Motor Control' tab.
+    """
+    return export_response([single_run_id], request.args.get('format', 'csv'),
+                           request.args.get('filename', 'impedance_history'))
+
+@app.route('/export_runs')
+def export_runs():
+    """
+    Streams stored runs (e.g. the run_id of each sweep job shown in the 'Parameter Sweep'
+    tab) as one file download, in the order given.
+    Query: ?run_ids=1,2,... , ?format= (csv, npz, parquet or arrow) and ?filename=.
+    """
+    try:
+        run_ids = [int(run_id) for run_id in request.args.get('run_ids', '').split(',') if run_id]
+    except ValueError:
+        return jsonify({"error": "run_ids must be a comma-separated list of run IDs."}), 400
+    if not run_ids:
+        return jsonify({"error": "No runs to export."}), 400
+    unknown = [run_id for run_id in run_ids if store.get_run(run_id) is None]
+    if unknown:
+        return jsonify({"error": f"Unknown runs {unknown}."}), 404
+    return export_response(run_ids, request.args.get('format', 'csv'),
+                           request.args.get('filename', 'sweep_results'))
+
+@app.route('/export_formats')
+def export_formats():
+    """
+    Export formats supported by the server (Parquet and Arrow need pyarrow).
+    """
+    return jsonify(available_formats())
 
 # Clear the Impedance History (Single Measurement Tab) .........................
 @app.route('/clear_impedance_history', methods=['POST'])
 def clear_impedance_history():
     """
-    Clears the global impedance_history list on the server.
+    Starts a new single measurement run, so the history shown and exported starts empty.
+    Earlier runs stay in the measurement store.
     Used by the 'Motor Control' tab.
     """
-    global impedance_history
-    impedance_history = [] # Reset the list to empty
-    print("Single measurement impedance history cleared on server.")
+    global single_run_id
+    single_run_id = store.create_run(RUN_SINGLE)
+    logger.info("Single measurement impedance history cleared on server.", extra={'run_id': single_run_id})
     return jsonify({"message": "Impedance history cleared successfully."}), 200
 
 # Parameter Sweep Handlers .....................................................
+@job_motion()
+def run_sweep(job):
+    """
+    Performs a grid sweep for a job on the sweep worker thread, publishing every
+    measured point as soon as it is available. Only the axes that change between
+    consecutive grid points are moved (all of them at once, in closed loop).
+    All points are measured on one VNA: the configured one, or the first free one.
+    """
+    config = job.config
+    axes = config['axes']
+    frequency_mhz = config['frequency_mhz']
+    target_frequency_hz = frequency_mhz * 1e6 # Convert MHz to Hz
+    instrument = config.get('instrument')
+
+    for axis in axes:
+        logger.info("Sweeping motor", extra={'job_id': job.job_id, 'motor': axis['motor_index'] + 1,
+                                             'start': axis['start_value'], 'stop': axis['stop_value'],
+                                             'step': axis['step_size']})
+    previous = None
+    for i, targets in enumerate(grid_points(axes, config['order'])):
+        job.check_cancelled()
+        moves = {axis['motor_index'] + 1: target
+                 for axis, target, last in zip(axes, targets, previous or [None] * len(axes))
+                 if target != last}
+        it.move_all_to(moves)
+        previous = targets
+        job.check_cancelled()
+        current_position = it.request_all_positions() # Get actual position after move
+        # Get impedance data
+        impedance_data_from_vna = measure_impedance(target_frequency_hz, instrument)
+        instrument = instrument or impedance_data_from_vna.get('instrument')
+
+        if "error" in impedance_data_from_vna:
+            logger.warning("Sweep point skipped", extra={'job_id': job.job_id, 'positions': current_position,
+                                                         'error': impedance_data_from_vna['error']})
+            # Decide how to handle VNA errors during sweep: skip point, stop sweep, etc.
+            # For now, we'll just continue with the sweep but log the error.
+            continue # Skip this data point if VNA error occurs
+
+        data_point = {
+            'id': i + 1, # Data point number in the sweep
+            'motor_positions': current_position,
+            'frequency_mhz': frequency_mhz,
+            **measurement_fields(impedance_data_from_vna),
+            'color': config['dataset_color'] # Use the selected dataset color
+        }
+        job.add_point(data_point)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sweep point measured", extra={'run_id': job.run_id, 'job_id': job.job_id,
+                                                        'positions': current_position, 'targets': list(targets),
+                                                        'frequency_mhz': frequency_mhz,
+                                                        'real': round(data_point['real_impedance'], 2),
+                                                        'imag': round(data_point['imag_impedance'], 2)})
+
+    if vna_pool is not None: # Simulated points would only pollute the map
+        added = get_tuning_map().add_points(list(store.iter_points(job.run_id)))
+        logger.info("Sweep points added to the tuning map", extra={'job_id': job.job_id, 'samples': added})
+    logger.info("Sweep finished.", extra={'run_id': job.run_id, 'job_id': job.job_id, 'points': job.point_count})
+
 @app.route('/start_sweep', methods=['POST'])
 def start_sweep():
     """
     Flask route to start a parameter sweep.
-    Receives motor index, start/stop values, step size, and frequency from frontend.
-    Performs the sweep and returns the collected data.
+    Receives either a single motor (motor index, start/stop values, step size) or a list
+    of 'axes' with the same fields for a grid sweep over several motors (the first axis
+    varies fastest), plus the frequency and an optional visiting 'order' ('serpentine'
+    or 'raster') and the 'instrument' (VNA name, default the first free one) from the frontend.
+    Queues the sweep as a background job and returns its job ID straight away;
+    progress and points are streamed from /sweep_stream/<job_id> (or polled from
+    the other /sweep_* routes) while it runs.
     """
     data = request.get_json()
-    motor_index:int = int(data.get('motor_index'))
-    start_value:int = int(data.get('start_value'))
-    stop_value:int = int(data.get('stop_value'))
-    step_size:int = int(data.get('step_size'))
-    frequency_mhz:float = float(data.get('frequency_mhz'))
-    dataset_color = data.get('dataset_color', '#3498db') # Default color for sweep
-
-    print("start sweep")
-    if any(val is None for val in [motor_index, start_value, stop_value, step_size, frequency_mhz]):
-        return jsonify({"error": "Missing parameter sweep configuration."}), 400
-    
-    target_frequency_hz = frequency_mhz * 1e6 # Convert MHz to Hz
+    axes = data.get('axes')
+    if axes is None:
+        # Single motor sweep, as sent by older clients
+        axes = [{key: data.get(key) for key in ('motor_index', 'start_value', 'stop_value', 'step_size')}]
+    try:
+        config = {
+            'axes': parse_axes(axes, it.NUM_MOTORS),
+            'order': data.get('order', ORDER_SERPENTINE),
+            'frequency_mhz': float(data.get('frequency_mhz')),
+            'dataset_color': data.get('dataset_color', '#3498db'), # Default color for sweep
+            'instrument': data.get('instrument'),
+        }
+        check_instrument(config['instrument'])
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameter sweep configuration: {e}"}), 400
+    if config['order'] not in ORDERS:
+        return jsonify({"error": f"Unknown sweep order {config['order']}."}), 400
+
+    job = sweep_jobs.submit(run_sweep, config, count_points(config['axes']))
+    return jsonify(job.summary()), 202
 
-    global sweep_history, simulated_motor_positions
-    sweep_history = [] # Clear previous sweep data
+# Tuning Map Handlers ..........................................................
+def get_tuning_map()->TuningMap:
+    """
+    Returns the tuning map, loading the recorded sweeps the first time it is needed.
+    """
+    global tuning_map
+    with tuning_map_lock:
+        if tuning_map is None:
+            tuning_map = load_default_map()
+        return tuning_map
+
+@app.route('/predict_positions', methods=['POST'])
+def predict_positions():
+    """
+    Predicts the motor positions that produce a target impedance, from recorded sweeps.
+    JSON body: 'frequency_mhz', 'target_real', 'target_imag' (Ohms), and optionally
+    'candidates' (number of nearest recorded points to return), 'max_frequency_offset_mhz'
+    and 'move' (pre-position the motors at the prediction, e.g. before /auto_tune).
+    """
+    data = request.get_json()
+    try:
+        frequency_mhz = float(data.get('frequency_mhz'))
+        target_impedance = complex(float(data.get('target_real')), float(data.get('target_imag', 0.0)))
+        max_offset_mhz = data.get('max_frequency_offset_mhz')
+        prediction = get_tuning_map().predict(
+            target_impedance, frequency_mhz * 1e6, int(data.get('candidates', 5)),
+            None if max_offset_mhz is None else float(max_offset_mhz) * 1e6)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Cannot predict positions: {e}"}), 400
+
+    if data.get('move'):
+        with manual_motion():
+            it.move_all_to({i + 1: position for i, position in enumerate(prediction['positions'])})
+            prediction['motor_positions'] = it.request_all_positions()
+        logger.info("Pre-positioned motors", extra={'positions': prediction['motor_positions'],
+                                                    'target_ohm': target_impedance})
+    return jsonify(prediction)
+
+# Auto-Tune Handlers ...........................................................
+AUTO_TUNE_DEFAULT_RANGE = 200 # Default search range either side of the current position
+
+def create_auto_tuner(config:dict, measure, on_evaluation=None)->AutoTuner:
+    """
+    AutoTuner for an /auto_tune configuration.
 
-    print(f"Starting sweep for motor {int(motor_index)+1}: {start_value} to {stop_value} with step {step_size}")
+    Raises:
+        ValueError: If the search settings are invalid (see AutoTuner).
+    """
+    return AutoTuner(measure, complex(config['target_real'], config['target_imag']),
+                     config['start'], config['bounds'], config['initial_step'], config['min_step'],
+                     config['budget'], config['tolerance'], config['method'], on_evaluation=on_evaluation)
 
+@job_motion()
+def run_auto_tune(job):
+    """
+    Searches motor positions for the target impedance on the sweep worker thread.
+    Every measurement is published as a job point, so the path can be followed live;
+    at the end the motors are moved to the best position found.
+    """
+    config = job.config
+    motor_indices = config['motors']
+    frequency_mhz = config['frequency_mhz']
+    target_frequency_hz = frequency_mhz * 1e6 # Convert MHz to Hz
+    latest = {} # the point measured by the last call to measure(), published by publish()
+    instrument = config.get('instrument')
+
+    def measure(positions):
+        nonlocal instrument
+        job.check_cancelled()
+        it.move_all_to({index + 1: position for index, position in zip(motor_indices, positions)})
+        job.check_cancelled()
+        impedance_data_from_vna = measure_impedance(target_frequency_hz, instrument)
+        if "error" in impedance_data_from_vna:
+            raise RuntimeError(impedance_data_from_vna['error'])
+        instrument = instrument or impedance_data_from_vna.get('instrument') # measure every point on one VNA
+        current_position = it.request_all_positions()
+        latest['point'] = {
+            'motor_positions': current_position,
+            'frequency_mhz': frequency_mhz,
+            **measurement_fields(impedance_data_from_vna),
+            'color': config['dataset_color']
+        }
+        return complex(impedance_data_from_vna['real_impedance'], impedance_data_from_vna['imag_impedance'])
+
+    def publish(entry):
+        data_point = {'id': entry['evaluation'], **latest['point'], 'mismatch': entry['mismatch']}
+        job.add_point(data_point)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Auto-tune evaluation", extra={'run_id': job.run_id, 'job_id': job.job_id,
+                                                        'evaluation': entry['evaluation'],
+                                                        'positions': entry['positions'],
+                                                        'mismatch': round(entry['mismatch'], 4)})
+
+    result = create_auto_tuner(config, measure, on_evaluation=publish).run()
+    job.check_cancelled()
+    it.move_all_to({index + 1: position for index, position in zip(motor_indices, result['positions'])})
+    job.result = {key: value for key, value in result.items() if key != 'path'}
+    job.result['path'] = [entry['positions'] for entry in result['path']]
+    logger.info("Auto-tune finished", extra={'job_id': job.job_id, 'stop_reason': result['stop_reason'],
+                                             'evaluations': result['evaluations'], 'positions': result['positions'],
+                                             'mismatch': round(result['mismatch'], 4)})
+
+@app.route('/auto_tune', methods=['POST'])
+def auto_tune():
+    """
+    Starts an automatic impedance match as a background job.
+    JSON body: 'frequency_mhz', 'target_real', 'target_imag' (Ohms), and optionally
+    'motors' (0-based indices to tune, default all), 'bounds' ([low, high] per tuned
+    motor, default current position +/- AUTO_TUNE_DEFAULT_RANGE), 'initial_step',
+    'min_step', 'budget' (maximum measurements), 'tolerance' (|Γ| to stop at),
+    'method' ('coordinate' or 'nelder-mead'), 'dataset_color' and 'instrument' (VNA name).
+    The job streams like a sweep; its result holds the best point and the path taken.
+    """
+    data = request.get_json()
     try:
-        # Move to start position
-        current_position = it.motors[motor_index].request_position()
-        it.motors[motor_index].move_motor(start_value - current_position)
-
-        current_position = [
-            it.motors[motor_index_tmp].request_position() # Get actual position after move
-            for motor_index_tmp in range(it.NUM_MOTORS)
-        ]
-        # Adjust stop_value check to handle both increasing and decreasing sweeps
-        is_increasing = stop_value >= start_value
-
-        # Loop through positions
-      
-        # Let's calculate steps and loop for simplicity and accuracy with step_size
-        # This assumes step_size is consistent in motor units.
-        if is_increasing and step_size <= 0:
-             return jsonify({"error": "Step size must be positive for increasing sweep."}), 400
-        if not is_increasing and step_size >= 0:
-             return jsonify({"error": "Step size must be negative for decreasing sweep."}), 400
-
-        i = 0
-        while current_position[motor_index] < stop_value:
-            it.motors[motor_index].move_motor(step_size)
-            current_position = [
-                it.motors[motor_index_tmp].request_position() # Get actual position after move
-                for motor_index_tmp in range(it.NUM_MOTORS)
-            ]
-            # Get impedance data
-            impedance_data_from_vna = vna.get_impedance(target_frequency_hz)
-
-            if "error" in impedance_data_from_vna:
-                print(f"Error getting impedance at position {current_position}: {impedance_data_from_vna['error']}")
-                # Decide how to handle VNA errors during sweep: skip point, stop sweep, etc.
-                # For now, we'll just continue with the sweep but log the error.
-                continue # Skip this data point if VNA error occurs
-
-            data_point = {
-                'id': i + 1, # Data point number in the sweep
-                'motor_positions': current_position,
-                'frequency_mhz': frequency_mhz,
-                'real_impedance': impedance_data_from_vna['real_impedance'],
-                'imag_impedance': impedance_data_from_vna['imag_impedance'],
-                'color': dataset_color # Use the selected dataset color
-            }
-            sweep_history.append(data_point)
-            print(f"Measured at pos {current_position}: R={data_point['real_impedance']:.2f}, X={data_point['imag_impedance']:.2f}")
-
-            i = i+1
-        print("Sweep finished.")
-        return jsonify(sweep_history) # Return the collected sweep data
-
-    except Exception as e:
-        print(f"An error occurred during the sweep: {e}")
-        tracebackStr = traceback.format_exc()
-        print(tracebackStr)
-        return jsonify({"error": f"An error occurred during the sweep: {e}\n{tracebackStr}"}), 500
+        motor_indices = [int(index) for index in data.get('motors', range(it.NUM_MOTORS))]
+        if not motor_indices or any(not 0 <= index < it.NUM_MOTORS for index in motor_indices):
+            raise ValueError(f"Invalid motors {motor_indices}")
+        current_position = it.request_all_positions()
+        start = [current_position[index] for index in motor_indices]
+        bounds = data.get('bounds') or [[position - AUTO_TUNE_DEFAULT_RANGE, position + AUTO_TUNE_DEFAULT_RANGE]
+                                        for position in start]
+        config = {
+            'motors': motor_indices,
+            'frequency_mhz': float(data.get('frequency_mhz')),
+            'target_real': float(data.get('target_real')),
+            'target_imag': float(data.get('target_imag', 0.0)),
+            'start': start,
+            'bounds': [[int(low), int(high)] for low, high in bounds],
+            'initial_step': int(data.get('initial_step', 40)),
+            'min_step': int(data.get('min_step', 2)),
+            'budget': int(data.get('budget', 60)),
+            'tolerance': float(data.get('tolerance', 0.0)),
+            'method': data.get('method', METHOD_COORDINATE),
+            'dataset_color': data.get('dataset_color', '#2ecc71'),
+            'instrument': data.get('instrument'),
+        }
+        check_instrument(config['instrument'])
+        create_auto_tuner(config, None) # validates the search settings before the job is queued
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid auto-tune configuration: {e}"}), 400
+
+    job = sweep_jobs.submit(run_auto_tune, config, config['budget'], RUN_AUTO_TUNE)
+    return jsonify(job.summary()), 202
+
+@app.route('/sweep_status/<job_id>')
+def sweep_status(job_id):
+    """
+    Returns the state and progress of a sweep job.
+    """
+    job = sweep_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown sweep job {job_id}."}), 404
+    return jsonify(job.summary())
+
+@app.route('/sweep_points/<job_id>')
+def sweep_points(job_id):
+    """
+    Returns the points a sweep job has measured so far. With ?since=N only the
+    points after the first N are returned, so clients can poll incrementally; at most
+    ?limit points (default READ_CHUNK_SIZE) are returned per request, 'next' is the
+    index to continue from.
+    """
+    job = sweep_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown sweep job {job_id}."}), 404
+    since = request.args.get('since', 0, type=int)
+    points = job.points_since(since, request.args.get('limit', READ_CHUNK_SIZE, type=int))
+    return jsonify({**job.summary(), 'points': points, 'next': since + len(points)})
+
+@app.route('/sweep_stream/<job_id>')
+def sweep_stream(job_id):
+    """
+    Server-Sent Events stream of a sweep job: a 'status' event whenever the job state
+    changes, a 'point' event for every measured point (with its motor positions) as
+    soon as it is produced, and a final 'end' event. Each point event carries its index
+    as the event ID, so a reconnecting browser resumes after the last point it received.
+    """
+    job = sweep_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown sweep job {job_id}."}), 404
+    since = request.args.get('since', 0, type=int)
+    since = request.headers.get('Last-Event-ID', since, type=int)
+
+    def generate():
+        index, status = since, None
+        while True:
+            points, current_status = job.wait_for_update(index, status, SSE_KEEPALIVE_S, READ_CHUNK_SIZE)
+            for point in points:
+                index += 1
+                yield f"id: {index}\nevent: point\ndata: {json.dumps(point)}\n\n"
+            if current_status != status or points:
+                status = current_status
+                yield f"event: status\ndata: {json.dumps(job.summary())}\n\n"
+            elif not points:
+                yield ": keepalive\n\n"
+            if status in JobStatus.DONE and index >= job.point_count:
+                yield f"event: end\ndata: {json.dumps(job.summary())}\n\n"
+                return
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cancel_sweep/<job_id>', methods=['POST'])
+def cancel_sweep(job_id):
+    """
+    Cancels a queued or running sweep job, stopping the motors safely.
+    """
+    if not sweep_jobs.cancel(job_id, stop_all_motors):
+        return jsonify({"error": f"Unknown sweep job {job_id}."}), 404
+    logger.info("Sweep job cancellation requested", extra={'job_id': job_id})
+    return jsonify({"message": "Sweep cancellation requested."}), 200
 
 @app.route('/clear_sweep_history', methods=['POST'])
 def clear_sweep_history():
     """
-    Clears the global sweep_history list on the server.
+    Forgets finished sweep jobs on the server (their runs stay in the measurement store).
     Used by the 'Parameter Sweep' tab.
     """
-    global sweep_history
-    sweep_history = [] # Reset the list to empty
-    print("Parameter sweep history cleared on server.")
+    sweep_jobs.forget_finished()
+    logger.info("Parameter sweep history cleared on server.")
     return jsonify({"message": "Parameter sweep history cleared successfully."}), 200
 
+# VNA Pool Handler .............................................................
+@app.route('/vna_status')
+def vna_status():
+    """
+    Returns every configured VNA with its state (idle, leased, checking, suspect or
+    offline), frequency band, lease count and last error. Empty when impedances are simulated.
+    """
+    return jsonify(vna_pool.status() if vna_pool is not None else [])
+
+# Metrics Handler ..............................................................
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Counters, gauges and histograms of the VNA, motors, encoder client, sweep jobs and
+    measurement store, in the Prometheus text format.
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+#--------------------------------------------------------------------------------
+# TEST
+#--------------------------------------------------------------------------------
+
+def test()->None:
+    """
+    Exercises the routes through Flask's test client, with simulated impedances
+    (run with TUNER_SIMULATION=1, so the motors are simulated too). The test jobs
+    are stored in a throwaway in-memory store, not in measurements.db.
+    """
+    global store, sweep_jobs, single_run_id
+    saved = store, sweep_jobs, single_run_id
+    store = MeasurementStore(":memory:")
+    sweep_jobs = SweepJobManager(store)
+    single_run_id = store.create_run(RUN_SINGLE)
+    try:
+        _test_routes()
+    finally:
+        sweep_jobs.executor.shutdown()
+        store.close()
+        store, sweep_jobs, single_run_id = saved
+
+def _test_routes()->None:
+    client = app.test_client()
+
+    def run_points(job):
+        for i in range(4):
+            job.add_point({'motor_positions': [i, 0, 0, 0], 'frequency_mhz': 18.5, **measurement_fields(measure_impedance(18.5e6))})
+
+    job = sweep_jobs.submit(run_points, {}, 4)
+    sweep_jobs.executor.submit(lambda: None).result() # wait until the job has run
+    for query, headers, expected in (("", {}, [1, 2, 3, 4]), ("?since=2", {}, [3, 4]),
+                                     ("?since=2", {'Last-Event-ID': '3'}, [4])):
+        response = client.get(f"/sweep_stream/{job.job_id}{query}", headers=headers)
+        ids = [int(line[4:]) for line in response.get_data(as_text=True).splitlines() if line.startswith("id: ")]
+        assert response.status_code == 200 and ids == expected, (query, headers, ids)
+
+    # An invalid multi-axis request is rejected before any axis moves
+    import gpio_sim
+    before = list(gpio_sim.axes().positions())
+    for body in ({'moves': {"1": 50, "5": 50}}, {'moves': {"1": 50, "01": 50}}, {'moves': {"1": 50, "2": 1.5}},
+                 {'targets': {"1": 400, "2": "far"}}):
+        response = client.post("/move_all", json=body)
+        assert response.status_code == 400, (body, response.status_code)
+    time.sleep(0.2)
+    assert list(gpio_sim.axes().positions()) == before, (before, gpio_sim.axes().positions())
+
+    # Manual moves are refused while a job owns the motors
+    started, release = threading.Event(), threading.Event()
+    @job_motion()
+    def hold_motors(job):
+        started.set()
+        release.wait(10)
+    job = sweep_jobs.submit(hold_motors, {}, 0)
+    assert started.wait(10)
+    for method, url, body in (("get", "/button/1_50", None), ("get", "/button/2/move_to/100", None),
+                              ("post", "/move_all", {'moves': {"1": 50}}), ("get", "/button/calibrate", None),
+                              ("post", "/motion_profile/1", {'cruise_hz': 100})):
+        response = getattr(client, method)(url, json=body)
+        assert response.status_code == 409, (url, response.status_code)
+    release.set()
+    sweep_jobs.executor.submit(lambda: None).result()
+    assert job.status == JobStatus.FINISHED and not job_owns_motors and manual_moves == 0
+    assert list(gpio_sim.axes().positions()) == before, (before, gpio_sim.axes().positions())
+
+    # A cancel landing between a job's check and its next move stops that move
+    encoder_request = it.encoder_client.request
+    it.encoder_client.request = lambda command: "0,0,0,0" if command == "A" else "0" # no encoder server
+    try:
+        @job_motion()
+        def cancelled_before_move(job):
+            job.check_cancelled()
+            sweep_jobs.cancel(job.job_id, stop_all_motors)
+            it.move_all_to({1: 400, 2: -400})
+            job.check_cancelled()
+        job = sweep_jobs.submit(cancelled_before_move, {}, 0)
+        sweep_jobs.executor.submit(lambda: None).result()
+    finally:
+        it.encoder_client.request = encoder_request
+    assert job.status == JobStatus.CANCELLED, job.summary()
+    assert list(gpio_sim.axes().positions()) == before, (before, gpio_sim.axes().positions())
+
+    # Motion profiles exist only for motors 1 to NUM_MOTORS
+    for n in (0, it.NUM_MOTORS + 1):
+        assert client.get(f"/motion_profile/{n}").status_code == 400, n
+    assert client.get("/motion_profile/1").status_code == 200
+
+    # Invalid auto-tune settings are answered with 400 and queue no job
+    request_all_positions = it.request_all_positions
+    it.request_all_positions = lambda: [0, 0, 0, 0] # no encoder server in the test
+    try:
+        for settings in ({'budget': 0}, {'min_step': 0}, {'initial_step': 2, 'min_step': 4},
+                         {'method': "random"}, {'bounds': [[0, 10]]}):
+            jobs = len(sweep_jobs.jobs)
+            response = client.post("/auto_tune", json={'frequency_mhz': 18.5, 'target_real': 50, **settings})
+            assert response.status_code == 400 and len(sweep_jobs.jobs) == jobs, (settings, response.status_code)
+    finally:
+        it.request_all_positions = request_all_positions
+    print("app test passed")
+
 #--------------------------------------------------------------------------------
 # RUN MAIN
 #--------------------------------------------------------------------------------
 
 if __name__ == '__main__':
-    initialize_vna_controller() # Initialize VNAController when app start
+    if "--test" in sys.argv:
+        test()
+        sys.exit()
+    setup_logging("app")
+    initialize_vna_pool() # Connect the VNAs when app start
     app.run(host='0.0.0.0', port=5500, debug=True)
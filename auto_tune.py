@@ -0,0 +1,220 @@
+import numpy as np
+
+METHOD_COORDINATE = "coordinate" # compass/pattern search, one axis at a time
+METHOD_NELDER_MEAD = "nelder-mead" # simplex search over all axes at once
+METHODS = (METHOD_COORDINATE, METHOD_NELDER_MEAD)
+
+class BudgetExhausted(Exception):
+    """
+    Raised internally when the measurement budget has been used up.
+    """
+
+def mismatch(impedance:complex, target_impedance:complex)->float:
+    """
+    |Γ| of an impedance relative to the target, |Z - Zt| / |Z + Zt*|: zero when
+    Z equals the target and below one for any passive Z.
+    """
+    return abs(impedance - target_impedance) / abs(impedance + np.conj(target_impedance))
+
+class AutoTuner:
+    """
+    Drives motor positions towards a target impedance with a derivative-free search,
+    using live measurements as the objective. Positions are integers (encoder counts);
+    each distinct position is measured at most once.
+    """
+    def __init__(self, measure, target_impedance:complex, start:list, bounds:list,
+                 initial_step:int = 40, min_step:int = 2, budget:int = 60,
+                 tolerance:float = 0.0, method:str = METHOD_COORDINATE, on_evaluation=None)->None:
+        """
+        Args:
+            measure (Callable[[tuple], complex]): Moves the tuned motors to the given
+                positions and returns the measured impedance.
+            target_impedance (complex): Impedance to match, in Ohms.
+            start (list): Starting position of every tuned motor.
+            bounds (list): (low, high) position limits of every tuned motor.
+            initial_step (int): First search step, in encoder counts.
+            min_step (int): The search stops once the step shrinks below this.
+            budget (int): Maximum number of measurements.
+            tolerance (float): The search stops once |Γ| falls to or below this.
+            method (str): One of METHODS.
+            on_evaluation (Callable[[dict], None] | None): Called with every path entry.
+
+        Raises:
+            ValueError: For an unknown method, mismatched or inverted bounds, a budget below
+                        one or steps not satisfying initial_step >= min_step >= 1.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown auto-tune method: {method}")
+        if len(start) != len(bounds):
+            raise ValueError("start and bounds must have one entry per tuned motor")
+        if any(low > high for low, high in bounds):
+            raise ValueError(f"Invalid bounds: {bounds}")
+        if int(budget) < 1:
+            raise ValueError(f"budget must be at least 1, got {budget}")
+        if not int(initial_step) >= int(min_step) >= 1:
+            raise ValueError(f"Steps must satisfy initial_step >= min_step >= 1, got {initial_step} and {min_step}")
+        self.measure = measure
+        self.target_impedance = complex(target_impedance)
+        self.bounds = [(int(low), int(high)) for low, high in bounds]
+        self.start = self._clip(start)
+        self.initial_step = int(initial_step)
+        self.min_step = int(min_step)
+        self.budget = int(budget)
+        self.tolerance = tolerance
+        self.method = method
+        self.on_evaluation = on_evaluation
+        self.cache = {}
+        self.path = []
+        self.best = None
+
+    def _clip(self, position)->tuple:
+        return tuple(int(min(max(round(value), low), high))
+                     for value, (low, high) in zip(position, self.bounds))
+
+    def evaluate(self, position)->float:
+        """
+        Mismatch at a position, measuring it only if it has not been measured before.
+        """
+        position = self._clip(position)
+        if position in self.cache:
+            return self.cache[position]
+        if len(self.path) >= self.budget:
+            raise BudgetExhausted()
+        impedance = complex(self.measure(position))
+        value = mismatch(impedance, self.target_impedance)
+        self.cache[position] = value
+        entry = {'evaluation': len(self.path) + 1, 'positions': list(position),
+                 'real_impedance': impedance.real, 'imag_impedance': impedance.imag,
+                 'mismatch': value}
+        self.path.append(entry)
+        if self.best is None or value < self.best['mismatch']:
+            self.best = entry
+        if self.on_evaluation:
+            self.on_evaluation(entry)
+        return value
+
+    def _converged(self)->bool:
+        return self.best is not None and self.best['mismatch'] <= self.tolerance
+
+    def run(self)->dict:
+        """
+        Run the search until it converges, the step shrinks below min_step or the
+        budget is exhausted.
+
+        Returns:
+            dict: 'positions', 'real_impedance', 'imag_impedance' and 'mismatch' of the
+                  best point, 'evaluations', 'stop_reason' and the full 'path'.
+        """
+        try:
+            if self.method == METHOD_COORDINATE:
+                self._coordinate_search()
+            else:
+                self._nelder_mead()
+            stop_reason = "converged" if self._converged() else "step below minimum"
+        except BudgetExhausted:
+            stop_reason = "budget exhausted"
+        return {**self.best, 'evaluations': len(self.path), 'stop_reason': stop_reason,
+                'path': self.path}
+
+    def _coordinate_search(self)->None:
+        """
+        Compass search: try a step either way along each axis, keep any improvement,
+        and halve the step when no axis improves.
+        """
+        center = self.start
+        value = self.evaluate(center)
+        step = self.initial_step
+        while step >= self.min_step and not self._converged():
+            improved = False
+            for axis in range(len(center)):
+                for direction in (1, -1):
+                    candidate = list(center)
+                    candidate[axis] += direction * step
+                    candidate = self._clip(candidate)
+                    candidate_value = self.evaluate(candidate)
+                    if candidate_value < value:
+                        center, value, improved = candidate, candidate_value, True
+                        break
+            if not improved:
+                step //= 2
+
+    def _nelder_mead(self)->None:
+        """
+        Nelder-Mead simplex search with positions rounded to whole counts. The simplex
+        starts at `start` plus one initial_step along each axis; the search stops when
+        the simplex has shrunk below min_step.
+        """
+        dimensions = len(self.start)
+        simplex = [np.array(self.start, dtype=float)]
+        for axis in range(dimensions):
+            vertex = np.array(self.start, dtype=float)
+            vertex[axis] += self.initial_step
+            simplex.append(np.array(self._clip(vertex), dtype=float))
+        values = [self.evaluate(vertex) for vertex in simplex]
+
+        while not self._converged():
+            order = np.argsort(values)
+            simplex = [simplex[i] for i in order]
+            values = [values[i] for i in order]
+            size = max(np.max(np.abs(vertex - simplex[0])) for vertex in simplex[1:])
+            if size < self.min_step:
+                return
+            previous_simplex = sorted(tuple(vertex) for vertex in simplex)
+
+            centroid = np.mean(simplex[:-1], axis=0)
+            reflected = np.array(self._clip(centroid + (centroid - simplex[-1])), dtype=float)
+            reflected_value = self.evaluate(reflected)
+            if reflected_value < values[0]:
+                expanded = np.array(self._clip(centroid + 2 * (centroid - simplex[-1])), dtype=float)
+                expanded_value = self.evaluate(expanded)
+                if expanded_value < reflected_value:
+                    simplex[-1], values[-1] = expanded, expanded_value
+                else:
+                    simplex[-1], values[-1] = reflected, reflected_value
+            elif reflected_value < values[-2]:
+                simplex[-1], values[-1] = reflected, reflected_value
+            else:
+                contracted = np.array(self._clip(centroid + 0.5 * (simplex[-1] - centroid)), dtype=float)
+                contracted_value = self.evaluate(contracted)
+                if contracted_value < values[-1]:
+                    simplex[-1], values[-1] = contracted, contracted_value
+                else:
+                    # Shrink every vertex towards the best one
+                    for i in range(1, len(simplex)):
+                        simplex[i] = np.array(self._clip(simplex[0] + 0.5 * (simplex[i] - simplex[0])), dtype=float)
+                        values[i] = self.evaluate(simplex[i])
+            if sorted(tuple(vertex) for vertex in simplex) == previous_simplex:
+                return # rounding to whole counts left the simplex unchanged
+
+def test()->None:
+    """
+    Checks the argument validation, then tunes two axes of a synthetic impedance
+    surface with both methods.
+    """
+    optimum = (37, -12)
+    target = complex(50, 0)
+    def measure(position):
+        # Impedance moves away from the target in proportion to the distance from the optimum
+        return target + complex(0.4 * (position[0] - optimum[0]), 0.3 * (position[1] - optimum[1]))
+
+    bounds = [(-200, 200), (-200, 200)]
+    for arguments in ({'budget': 0}, {'min_step': 0}, {'initial_step': 1, 'min_step': 2}, {'method': "random"}):
+        try:
+            AutoTuner(measure, target, [0, 0], bounds, **arguments)
+        except ValueError as e:
+            print(f"{arguments}: {e}")
+        else:
+            raise AssertionError(f"{arguments} was accepted")
+
+    for method in METHODS:
+        result = AutoTuner(measure, target, [0, 0], bounds, initial_step=32, min_step=1, budget=200,
+                           method=method).run()
+        print(f"{method}: {result['positions']} |Γ|={result['mismatch']:.4f} after {result['evaluations']} "
+              f"measurements ({result['stop_reason']})")
+        assert result['mismatch'] < 0.01, result
+    result = AutoTuner(measure, target, [0, 0], bounds, budget=1).run()
+    assert result['evaluations'] == 1 and result['stop_reason'] == "budget exhausted", result
+
+# Example usage
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,295 @@
+"""
+Sweep latency benchmark. Runs standard sweeps through the same calls as app.run_sweep
+(closed-loop moves, encoder position reads, VNA measurement, measurement store) and
+records how long every stage of every point takes:
+    move      - it.move_all_to() of the axes that change (PWM, encoder polling, corrections)
+    positions - it.request_all_positions() after the move
+    vna_wait  - time the VNA took to report the sweep complete (VNAController wait_time_s)
+    vna_io    - the rest of the measurement: configuration writes, trace transfer, conversion
+    store     - MeasurementStore.add_point() (including the batch flushes it triggers)
+The JSON report holds percentiles per stage and points per minute for every scenario, so
+reports of two revisions can be compared (--baseline) to catch regressions.
+
+Against the simulated hardware (starts vna_sim and Encoder.py itself):
+    python benchmark.py --simulate --output report.json
+Against the tuner and VNA (Encoder.py must be running):
+    python benchmark.py --output report.json --baseline previous.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+from measurement_store import MeasurementStore, RUN_SWEEP
+from sweep_plan import grid_points, parse_axes, ORDER_SERPENTINE
+
+STAGES = ("move", "positions", "vna_wait", "vna_io", "store")
+PERCENTILES = (50, 90, 99)
+REGRESSION_THRESHOLD = 0.10 # Relative slow-down of a p50 or of points/minute reported as a regression
+ENCODER_STARTUP_S = 10.0 # How long to wait for the simulated encoder server to accept connections
+
+# Standard sweeps: the axes as sent to /start_sweep, and the frequencies measured at each point
+SCENARIOS = {
+    "single_axis": {
+        "axes": [{"motor_index": 0, "start_value": 0, "stop_value": 200, "step_size": 20}],
+        "frequencies_mhz": [18.5],
+    },
+    "grid": {
+        "axes": [{"motor_index": 0, "start_value": 0, "stop_value": 100, "step_size": 25},
+                 {"motor_index": 1, "start_value": 0, "stop_value": 100, "step_size": 25}],
+        "frequencies_mhz": [18.5],
+    },
+    "multi_frequency": {
+        "axes": [{"motor_index": 0, "start_value": 0, "stop_value": 200, "step_size": 40}],
+        "frequencies_mhz": [18.3, 18.4, 18.5, 18.6, 18.7],
+    },
+}
+
+class PointTimer:
+    """
+    Accumulates the duration of each stage of one sweep point.
+    """
+    def __init__(self)->None:
+        self.times = dict.fromkeys(STAGES, 0.0)
+
+    @contextmanager
+    def stage(self, name:str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += time.perf_counter() - start
+
+def run_scenario(name:str, scenario:dict, it, vna, store)->dict:
+    """
+    Runs one sweep and returns its per-point stage timings.
+
+    Args:
+        name (str): Scenario name, recorded with the run.
+        scenario (dict): 'axes' and 'frequencies_mhz', as in SCENARIOS.
+        it (module): Impedance_Tuning.
+        vna (VNAController): Connected VNA.
+        store (MeasurementStore): Store the points are written to.
+
+    Returns:
+        dict: 'points' (list of per-point stage times in seconds, plus 'total') and
+              'elapsed_s' for the whole sweep.
+
+    Raises:
+        RuntimeError: If the VNA reports an error.
+    """
+    axes = parse_axes(scenario['axes'], it.NUM_MOTORS)
+    frequencies_hz = np.array(scenario['frequencies_mhz']) * 1e6
+    run_id = store.create_run(RUN_SWEEP, {'benchmark': name, **scenario})
+    # Start from the first grid point, outside the timed loop
+    it.move_all_to({axis['motor_index'] + 1: axis['start_value'] for axis in axes})
+
+    points = []
+    previous = None
+    sweep_start = time.perf_counter()
+    for targets in grid_points(axes, ORDER_SERPENTINE):
+        point_start = time.perf_counter()
+        timer = PointTimer()
+        moves = {axis['motor_index'] + 1: target
+                 for axis, target, last in zip(axes, targets, previous or [None] * len(axes))
+                 if target != last}
+        with timer.stage("move"):
+            if moves:
+                it.move_all_to(moves)
+        previous = targets
+        with timer.stage("positions"):
+            positions = it.request_all_positions()
+
+        measure_start = time.perf_counter()
+        if frequencies_hz.size == 1:
+            result = vna.get_impedance(frequencies_hz[0])
+        else:
+            result = vna.get_impedance_list(frequencies_hz)
+        if "error" in result:
+            raise RuntimeError(f"VNA error during {name}: {result['error']}")
+        timer.times["vna_wait"] = result['wait_time_s']
+        timer.times["vna_io"] = time.perf_counter() - measure_start - result['wait_time_s']
+
+        with timer.stage("store"):
+            for frequency_hz, real, imag in zip(np.atleast_1d(frequencies_hz), np.atleast_1d(result['real_impedance']),
+                                                np.atleast_1d(result['imag_impedance'])):
+                store.add_point(run_id, {'motor_positions': positions, 'frequency_mhz': frequency_hz / 1e6,
+                                         'real_impedance': float(real), 'imag_impedance': float(imag),
+                                         'color': '#3498db'})
+        points.append({**timer.times, 'total': time.perf_counter() - point_start})
+    store.flush()
+    return {'points': points, 'elapsed_s': time.perf_counter() - sweep_start}
+
+def summarise(name:str, scenario:dict, timings:dict)->dict:
+    """
+    Percentiles (in ms) of each stage and of the whole point, and the sweep rate.
+    """
+    points = timings['points']
+    stages = {}
+    for stage in STAGES + ("total",):
+        values = np.array([point[stage] for point in points]) * 1e3
+        stages[stage] = {'mean_ms': float(values.mean()),
+                         **{f'p{q}_ms': float(np.percentile(values, q)) for q in PERCENTILES},
+                         'max_ms': float(values.max()),
+                         'share': float(values.sum() / 1e3 / timings['elapsed_s'])}
+    return {
+        'points': len(points),
+        'frequencies_per_point': len(scenario['frequencies_mhz']),
+        'elapsed_s': timings['elapsed_s'],
+        'points_per_minute': len(points) / timings['elapsed_s'] * 60,
+        'stages': stages,
+        'per_point_ms': [{stage: value * 1e3 for stage, value in point.items()} for point in points],
+    }
+
+def git_revision()->str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report:dict, baseline:dict, threshold:float = REGRESSION_THRESHOLD)->list:
+    """
+    Lists the regressions of a report against a baseline report: stages whose p50 grew,
+    or scenarios whose points per minute fell, by more than threshold.
+    """
+    regressions = []
+    for name, scenario in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        if scenario['points_per_minute'] < previous['points_per_minute'] * (1 - threshold):
+            regressions.append(f"{name}: {scenario['points_per_minute']:.1f} points/min, "
+                               f"was {previous['points_per_minute']:.1f}")
+        for stage, values in scenario['stages'].items():
+            before = previous['stages'].get(stage, {}).get('p50_ms')
+            # Sub-millisecond stages are dominated by scheduling noise
+            if before is not None and values['p50_ms'] > max(before * (1 + threshold), before + 1.0):
+                regressions.append(f"{name}/{stage}: p50 {values['p50_ms']:.1f} ms, was {before:.1f} ms")
+    return regressions
+
+def print_report(report:dict)->None:
+    for name, scenario in report['scenarios'].items():
+        print(f"{name}: {scenario['points']} points in {scenario['elapsed_s']:.2f} s "
+              f"({scenario['points_per_minute']:.1f} points/min)")
+        for stage, values in scenario['stages'].items():
+            print(f"    {stage:<10} p50 {values['p50_ms']:8.1f} ms  p90 {values['p90_ms']:8.1f} ms  "
+                  f"p99 {values['p99_ms']:8.1f} ms  ({values['share'] * 100:5.1f}% of sweep)")
+
+def _accepts_connections(host:str, port:int)->bool:
+    try:
+        socket.create_connection((host, port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+@contextmanager
+def simulated_hardware(directory:str):
+    """
+    Starts the simulated VNA (in this process) and the simulated encoder server (Encoder.py
+    in a subprocess, with its journal in directory), sharing the axes in directory.
+
+    Yields:
+        str: The simulated VNA's VISA address.
+    """
+    os.environ["TUNER_SIMULATION"] = "1"
+    os.environ["TUNER_SIM_STATE"] = os.path.join(directory, "axes.bin")
+    import gpio_sim
+    import vna_sim
+    import Impedance_Tuning as it
+    if _accepts_connections(it.HOST, it.PORT):
+        # Our encoder server could not bind, and the benchmark would measure the other one
+        raise RuntimeError(f"An encoder server is already listening on {it.HOST}:{it.PORT}; stop it first")
+    repository = os.path.dirname(os.path.abspath(__file__))
+    server = vna_sim.SCPIServer(("127.0.0.1", 0), vna_sim.SimulatedZVA(
+        vna_sim.ImpedanceModel.from_recordings(os.path.join(repository, "data", "*.csv")),
+        gpio_sim.axes().positions))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    encoder_script = os.path.join(repository, "Encoder.py")
+    encoder = subprocess.Popen([sys.executable, encoder_script], cwd=directory,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + ENCODER_STARTUP_S
+        while not _accepts_connections(it.HOST, it.PORT):
+            if time.monotonic() > deadline or encoder.poll() is not None:
+                raise RuntimeError("The simulated encoder server did not start")
+            time.sleep(0.1)
+        if encoder.poll() is not None:
+            raise RuntimeError(f"The simulated encoder server exited; another server holds {it.HOST}:{it.PORT}")
+        yield f"TCPIP0::127.0.0.1::{server.server_address[1]}::SOCKET"
+    finally:
+        encoder.terminate()
+        encoder.wait()
+        server.shutdown()
+
+def run(scenarios:list, vna_address:str, sync_mode:str, data_format:str, directory:str)->dict:
+    import Impedance_Tuning as it
+    from vna_impedance import VNAController
+
+    vna = VNAController(vna_address, sync_mode=sync_mode, data_format=data_format)
+    store = MeasurementStore(os.path.join(directory, "benchmark.db"))
+    report = {
+        'revision': git_revision(),
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'environment': {'simulated': bool(os.environ.get("TUNER_SIMULATION")), 'vna_address': vna_address,
+                        'sync_mode': sync_mode, 'data_format': data_format,
+                        'python': platform.python_version(), 'machine': platform.machine()},
+        'scenarios': {},
+    }
+    try:
+        for name in scenarios:
+            print(f"Running {name}...")
+            timings = run_scenario(name, SCENARIOS[name], it, vna, store)
+            report['scenarios'][name] = summarise(name, SCENARIOS[name], timings)
+    finally:
+        store.close()
+    return report
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark of standard sweeps.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--simulate", action="store_true", help="Run against vna_sim and gpio_sim")
+    parser.add_argument("--vna-address", default=None, help="VISA address (default: VNA_ADDRESS)")
+    parser.add_argument("--sync-mode", default="opc", choices=("opc", "esr"))
+    parser.add_argument("--data-format", default="REAL,64", choices=("REAL,64", "REAL,32", "ASCII"))
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="Report of an earlier revision to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.simulate:
+            with simulated_hardware(directory) as vna_address:
+                report = run(args.scenarios, vna_address, args.sync_mode, args.data_format, directory)
+        else:
+            from vna_impedance import VNA_ADDRESS
+            report = run(args.scenarios, args.vna_address or VNA_ADDRESS, args.sync_mode, args.data_format, directory)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Report written to {args.output}")
+    else:
+        print(json.dumps({name: {key: value for key, value in scenario.items() if key != 'per_point_ms'}
+                          for name, scenario in report['scenarios'].items()}, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
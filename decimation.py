@@ -0,0 +1,87 @@
+import numpy as np
+
+METHOD_LTTB = "lttb" # Largest-Triangle-Three-Buckets: keeps the visual shape of a line
+METHOD_MINMAX = "minmax" # Min/max bucketing: keeps every extreme, so no peak or dip is lost
+METHODS = (METHOD_LTTB, METHOD_MINMAX)
+
+def lttb(x, y, threshold:int)->np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Args:
+        x (array-like): Sample positions along the sweep, increasing.
+        y (array-like): Sample values.
+        threshold (int): Number of samples to keep (at least 3).
+
+    Returns:
+        np.ndarray: Sorted indices of the kept samples; the first and last are always kept.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    count = x.size
+    if threshold >= count or count <= 2:
+        return np.arange(count)
+    threshold = max(3, int(threshold))
+    # Interior points split into threshold - 2 buckets; the end points are buckets of their own
+    edges = np.linspace(1, count - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # The next bucket is represented by its average (the last point for the final bucket)
+        if bucket + 2 < threshold - 1:
+            next_start, next_stop = edges[bucket + 1], edges[bucket + 2]
+            next_x, next_y = x[next_start:next_stop].mean(), y[next_start:next_stop].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+def minmax(y, buckets:int)->np.ndarray:
+    """
+    Keeps the minimum and maximum sample of each of `buckets` equal slices along the sweep.
+
+    Returns:
+        np.ndarray: Sorted unique indices (at most 2 * buckets).
+    """
+    y = np.asarray(y, dtype=float)
+    if 2 * buckets >= y.size:
+        return np.arange(y.size)
+    edges = np.linspace(0, y.size, buckets + 1).astype(int)
+    kept = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            kept += [start + int(np.argmin(y[start:stop])), start + int(np.argmax(y[start:stop]))]
+    return np.unique(kept)
+
+def decimate(series:list, max_points:int, method:str = METHOD_LTTB)->np.ndarray:
+    """
+    Indices of the samples to keep so a plot of several value series along the same
+    sweep (e.g. Γ real and imaginary) shows their shape with about max_points samples.
+    The budget is split between the series and the kept indices are merged.
+
+    Args:
+        series (list): Value arrays of equal length, in sweep order.
+        max_points (int): Approximate number of samples to keep.
+        method (str): One of METHODS.
+
+    Returns:
+        np.ndarray: Sorted unique indices.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown decimation method: {method}")
+    count = len(series[0])
+    if max_points >= count:
+        return np.arange(count)
+    share = max(1, max_points // len(series))
+    kept = []
+    for y in series:
+        if method == METHOD_LTTB:
+            kept.append(lttb(np.arange(count), y, max(3, share)))
+        else:
+            kept.append(minmax(y, max(1, share // 2)))
+    return np.unique(np.concatenate(kept))
@@ -0,0 +1,164 @@
+import logging
+import os
+import struct
+import threading
+import zlib
+
+# On-disk layout: two fixed 64-byte slots written alternately, so a power cut during a
+# write always leaves the previous slot intact. Each slot holds
+#   magic (4s) | version (H) | axis count (H) | sequence (Q) | positions (4 x q) | crc32 (I)
+# padded to SLOT_SIZE. The valid slot with the highest sequence number wins on load.
+# Version 1 journals were written before 4x quadrature decoding and hold positions in half
+# the current units; they are scaled on load and rewritten as the current version.
+JOURNAL_MAGIC = b"ENCJ"
+JOURNAL_VERSION = 2
+LEGACY_POSITION_SCALE = 2 # Positions from before 4x decoding (journal version 1, encoders.pkl, data/ recordings) are multiplied by 2
+POSITION_SCALES = {1: LEGACY_POSITION_SCALE, JOURNAL_VERSION: 1} # Readable versions -> scale to current counts
+MAX_AXES = 4
+SLOT_FORMAT = f"<4sHHQ{MAX_AXES}q"
+SLOT_SIZE = 64
+FSYNC_POLICIES = ("always", "never")
+
+logger = logging.getLogger("encoder.journal")
+
+class EncoderJournal:
+    """
+    Persists encoder positions in a tiny fixed-layout binary file. Positions are written
+    by a background flusher only when they have changed, keeping disk I/O out of the
+    position server's request path and limiting SD card wear.
+    """
+    def __init__(self, path:str, num_axes:int = MAX_AXES, flush_interval_s:float = 1.0,
+                 fsync_policy:str = "always")->None:
+        """
+        Args:
+            path (str): Journal file path.
+            num_axes (int): Number of positions stored (at most MAX_AXES).
+            flush_interval_s (float): How often the flusher checks for changed positions.
+            fsync_policy (str): "always" fsyncs every write so it survives power loss,
+                                "never" leaves it to the OS page cache.
+        """
+        if not 0 < num_axes <= MAX_AXES:
+            raise ValueError(f"num_axes must be between 1 and {MAX_AXES}")
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        self.path = path
+        self.num_axes = num_axes
+        self.flush_interval_s = flush_interval_s
+        self.fsync_policy = fsync_policy
+        self.sequence = 0
+        self.last_written = None
+        self.fd = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def load(self):
+        """
+        Read the newest valid positions from the journal, in current encoder counts.
+
+        Returns:
+            list[int] | None: The stored positions, or None if there is no valid journal.
+        """
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read(2 * SLOT_SIZE)
+        except FileNotFoundError:
+            return None
+
+        best = None
+        for offset in (0, SLOT_SIZE):
+            slot = self._unpack_slot(data[offset:offset + SLOT_SIZE])
+            if slot and (best is None or slot[0] > best[0]):
+                best = slot
+        if best is None:
+            return None
+        self.sequence, version, positions = best
+        if version != JOURNAL_VERSION:
+            positions = tuple(position * POSITION_SCALES[version] for position in positions)
+            logger.info("Rescaled encoder positions from an older journal",
+                        extra={'path': self.path, 'version': version, 'positions': positions})
+        else:
+            self.last_written = positions # an older version is rewritten on the next flush
+        return list(positions)
+
+    def _unpack_slot(self, slot:bytes):
+        """
+        Returns (sequence, version, positions) for a valid slot, otherwise None.
+        """
+        payload_size = struct.calcsize(SLOT_FORMAT)
+        if len(slot) < payload_size + 4:
+            return None
+        payload = slot[:payload_size]
+        (crc,) = struct.unpack_from("<I", slot, payload_size)
+        if zlib.crc32(payload) != crc:
+            return None
+        magic, version, num_axes, sequence, *positions = struct.unpack(SLOT_FORMAT, payload)
+        if magic != JOURNAL_MAGIC or version not in POSITION_SCALES or num_axes != self.num_axes:
+            return None
+        return sequence, version, tuple(positions[:num_axes])
+
+    def write(self, positions)->bool:
+        """
+        Write positions to the next slot if they differ from the last write.
+
+        Returns:
+            bool: True if a write happened.
+        """
+        positions = tuple(int(position) for position in positions)
+        if len(positions) != self.num_axes:
+            raise ValueError(f"Expected {self.num_axes} positions, got {len(positions)}")
+        with self.lock:
+            if positions == self.last_written:
+                return False
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+            self.sequence += 1
+            padded = positions + (0,) * (MAX_AXES - self.num_axes)
+            payload = struct.pack(SLOT_FORMAT, JOURNAL_MAGIC, JOURNAL_VERSION, self.num_axes,
+                                  self.sequence, *padded)
+            slot = (payload + struct.pack("<I", zlib.crc32(payload))).ljust(SLOT_SIZE, b"\0")
+            os.pwrite(self.fd, slot, (self.sequence % 2) * SLOT_SIZE)
+            if self.fsync_policy == "always":
+                os.fsync(self.fd)
+            self.last_written = positions
+            return True
+
+    def start(self, read_positions)->None:
+        """
+        Start the background flusher.
+
+        Args:
+            read_positions (Callable[[], Sequence[int]]): Returns the current positions.
+        """
+        self.read_positions = read_positions
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="encoder-journal", daemon=True)
+        self.thread.start()
+
+    def _run(self)->None:
+        while not self.stop_event.wait(self.flush_interval_s):
+            try:
+                self.write(self.read_positions())
+            except OSError as e:
+                logger.error("Encoder journal write failed", extra={'path': self.path, 'error': e})
+
+    def flush_now(self)->None:
+        """
+        Write the current positions immediately (e.g. after calibration).
+        """
+        self.write(self.read_positions())
+
+    def stop(self)->None:
+        """
+        Stop the flusher, write the final positions and close the file.
+        """
+        if self.thread:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            self.flush_now()
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
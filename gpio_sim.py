@@ -0,0 +1,214 @@
+"""
+Simulated RPi.GPIO for developing off the Pi. Impedance_Tuning.py and Encoder.py import
+this module instead of RPi.GPIO when TUNER_SIMULATION is set in the environment.
+
+Each tuner axis has a simulated physical position (in 4x encoder counts) kept in a small
+shared memory-mapped file, so the motor process (app.py) and the encoder process
+(Encoder.py) see the same hardware:
+  - PWM on a stepper's STEP pin emits pulses at the requested frequency in real time; every
+    pulse moves the axis by COUNTS_PER_PULSE in the direction set by its DIR pin, while its
+    EN pin is LOW (H bridge enabled).
+  - A watcher thread turns changes of an axis position into quadrature edges on the
+    encoder's A/B pins and calls the registered edge callbacks, so the real decoder runs.
+The VNA simulator (vna_sim.py) reads the same positions.
+"""
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+
+# RPi.GPIO constants
+BCM = 11
+BOARD = 10
+OUT = 0
+IN = 1
+LOW = 0
+HIGH = 1
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+SIM_STATE_PATH = os.environ.get("TUNER_SIM_STATE", "/tmp/impedance_tuner_sim.bin")
+NUM_AXES = 4
+COUNTS_PER_PULSE = 1 # 4x encoder counts per STEP pulse (2 pulses and 2 counts per RUN_STEPS unit)
+PULSE_TICK_S = 0.001 # Stepper pulse generator update period
+WATCH_INTERVAL_S = 0.0005 # Encoder watcher poll period
+MISSED_PULSE_PROBABILITY = float(os.environ.get("TUNER_SIM_MISSED_PULSES", "0")) # Fraction of pulses lost (stall)
+
+GRAY_SEQUENCE = (0b00, 0b01, 0b11, 0b10) # AB states of forward rotation, matching Encoder.QUADRATURE_TABLE
+
+class SimAxes:
+    """
+    Physical axis positions shared between processes through a memory-mapped file.
+    """
+    FORMAT = f"<{NUM_AXES}q"
+
+    def __init__(self, path:str = SIM_STATE_PATH)->None:
+        size = struct.calcsize(self.FORMAT)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+        self.lock = threading.Lock()
+
+    def positions(self)->list:
+        return list(struct.unpack_from(self.FORMAT, self.map))
+
+    def position(self, axis:int)->int:
+        return struct.unpack_from("<q", self.map, 8 * (axis - 1))[0]
+
+    def move(self, axis:int, counts:int)->None:
+        with self.lock:
+            struct.pack_into("<q", self.map, 8 * (axis - 1), self.position(axis) + counts)
+
+    def reset(self)->None:
+        with self.lock:
+            struct.pack_into(self.FORMAT, self.map, 0, *([0] * NUM_AXES))
+
+_axes = None
+_levels = {} # pin -> simulated level
+_callbacks = {} # pin -> edge callback
+_steppers = {} # STEP pin -> (axis, DIR pin, EN pin)
+_encoders = [] # [axis, A pin, B pin, emitted position]
+_watcher = None
+_stop_watcher = threading.Event()
+_lock = threading.Lock()
+
+def axes()->SimAxes:
+    """
+    The shared axis positions, mapped on first use.
+    """
+    global _axes
+    if _axes is None:
+        _axes = SimAxes()
+    return _axes
+
+def setmode(mode)->None:
+    pass
+
+def setwarnings(flag)->None:
+    pass
+
+def setup(pin, direction, pull_up_down = PUD_OFF, initial = None)->None:
+    pins = pin if isinstance(pin, (list, tuple)) else [pin]
+    for each in pins:
+        if each not in _levels:
+            _levels[each] = initial if initial is not None else (HIGH if pull_up_down == PUD_UP else LOW)
+
+def output(pin, value)->None:
+    pins = pin if isinstance(pin, (list, tuple)) else [pin]
+    for each in pins:
+        _levels[each] = int(bool(value))
+
+def input(pin)->int:
+    return _levels.get(pin, LOW)
+
+def attach_stepper(step_pin:int, dir_pin:int, en_pin:int, axis:int)->None:
+    """
+    Simulation only: wires a stepper driver's pins to an axis.
+    """
+    _steppers[step_pin] = (axis, dir_pin, en_pin)
+
+def attach_encoder(a_pin:int, b_pin:int, axis:int)->None:
+    """
+    Simulation only: wires an encoder's A/B pins to an axis, with the pin levels of
+    the axis' current position.
+    """
+    position = axes().position(axis)
+    state = GRAY_SEQUENCE[position % 4]
+    _levels[a_pin], _levels[b_pin] = state >> 1, state & 1
+    with _lock:
+        _encoders.append([axis, a_pin, b_pin, position])
+
+def add_event_detect(pin, edge, callback = None, bouncetime = None)->None:
+    global _watcher
+    _callbacks[pin] = callback
+    if _watcher is None:
+        _stop_watcher.clear()
+        _watcher = threading.Thread(target=_watch_encoders, name="gpio-sim-encoders", daemon=True)
+        _watcher.start()
+
+def remove_event_detect(pin)->None:
+    _callbacks.pop(pin, None)
+
+def _watch_encoders()->None:
+    """
+    Emits one quadrature edge per count until every encoder has caught up with its axis.
+    """
+    while not _stop_watcher.wait(WATCH_INTERVAL_S):
+        with _lock:
+            encoders = list(_encoders)
+        for encoder in encoders:
+            axis, a_pin, b_pin, emitted = encoder
+            target = axes().position(axis)
+            while emitted != target:
+                emitted += 1 if target > emitted else -1
+                state = GRAY_SEQUENCE[emitted % 4]
+                a, b = state >> 1, state & 1
+                changed = a_pin if a != _levels.get(a_pin) else b_pin
+                _levels[a_pin], _levels[b_pin] = a, b
+                callback = _callbacks.get(changed)
+                if callback:
+                    callback(changed)
+            encoder[3] = emitted
+
+def cleanup(pin = None)->None:
+    global _watcher
+    if _watcher is not None:
+        _stop_watcher.set()
+        _watcher.join()
+        _watcher = None
+    _callbacks.clear()
+
+class PWM:
+    """
+    PWM output. On a stepper STEP pin it generates pulses that move the simulated axis.
+    """
+    def __init__(self, pin:int, frequency:float)->None:
+        self.pin = pin
+        self.frequency = frequency
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, duty_cycle:float)->None:
+        if self.pin not in _steppers or self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._pulse, name=f"gpio-sim-pwm-{self.pin}", daemon=True)
+        self.thread.start()
+
+    def _pulse(self)->None:
+        axis, dir_pin, en_pin = _steppers[self.pin]
+        phase = 0.0
+        last = time.monotonic()
+        while not self.stop_event.wait(PULSE_TICK_S):
+            now = time.monotonic()
+            phase += self.frequency * (now - last)
+            last = now
+            pulses = int(phase)
+            if not pulses:
+                continue
+            phase -= pulses
+            if MISSED_PULSE_PROBABILITY:
+                pulses = sum(random.random() >= MISSED_PULSE_PROBABILITY for _ in range(pulses))
+            if _levels.get(en_pin, HIGH) == LOW: # H bridge enabled
+                # DIR LOW is the positive direction (Motor._run sets it for positive RUN_STEPS)
+                sign = 1 if _levels.get(dir_pin, LOW) == LOW else -1
+                axes().move(axis, sign * pulses * COUNTS_PER_PULSE)
+
+    def ChangeFrequency(self, frequency:float)->None:
+        self.frequency = frequency
+
+    def ChangeDutyCycle(self, duty_cycle:float)->None:
+        pass
+
+    def stop(self)->None:
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,289 @@
+import csv
+import numpy as np
+
+Z0 = 50.0 # Default reference impedance in Ohms
+SPEED_OF_LIGHT = 299792458.0 # m/s
+
+#--------------------------------------------------------------------------------
+# REFLECTION COEFFICIENT <-> IMPEDANCE
+#--------------------------------------------------------------------------------
+# Every function accepts scalars or NumPy arrays of any shape and works element-wise.
+
+def s11_to_impedance(s11, z0: float = Z0):
+    """
+    Converts S11 (Γ) to impedance, Z = Z0 * (1 + Γ) / (1 - Γ).
+
+    Args:
+        s11 (complex | np.ndarray): Reflection coefficient(s).
+        z0 (float): Reference impedance in Ohms.
+
+    Returns:
+        complex | np.ndarray: Impedance(s) in Ohms. Γ = 1 (open) gives inf.
+    """
+    s11 = np.asarray(s11, dtype=complex)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return z0 * (1 + s11) / (1 - s11)
+
+def impedance_to_gamma(impedance, z0: float = Z0):
+    """
+    Converts impedance to the reflection coefficient, Γ = (Z - Z0) / (Z + Z0).
+
+    Args:
+        impedance (complex | np.ndarray): Impedance(s) in Ohms.
+        z0 (float): Reference impedance in Ohms.
+
+    Returns:
+        complex | np.ndarray: Reflection coefficient(s).
+    """
+    impedance = np.asarray(impedance, dtype=complex)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (impedance - z0) / (impedance + z0)
+
+def impedance_to_admittance(impedance):
+    """
+    Converts impedance to admittance, Y = 1 / Z, in Siemens.
+    """
+    impedance = np.asarray(impedance, dtype=complex)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 / impedance
+
+def gamma_to_vswr(gamma):
+    """
+    Converts the reflection coefficient to VSWR, (1 + |Γ|) / (1 - |Γ|). |Γ| >= 1 gives inf.
+    """
+    magnitude = np.abs(gamma)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(magnitude < 1, (1 + magnitude) / (1 - magnitude), np.inf)
+
+def gamma_to_return_loss_db(gamma):
+    """
+    Converts the reflection coefficient to return loss in dB, -20 * log10(|Γ|).
+    A perfect match (Γ = 0) gives inf.
+    """
+    with np.errstate(divide='ignore'):
+        return -20 * np.log10(np.abs(gamma))
+
+def analyse_s11(s11, z0: float = Z0)->dict:
+    """
+    Derives every quantity used by the tuner from S11 in one vectorised pass.
+
+    Args:
+        s11 (complex | np.ndarray): Reflection coefficient(s).
+        z0 (float): Reference impedance in Ohms.
+
+    Returns:
+        dict: 'gamma', 'impedance', 'admittance', 'vswr' and 'return_loss_db', each with
+              the shape of `s11`.
+    """
+    gamma = np.asarray(s11, dtype=complex)
+    impedance = s11_to_impedance(gamma, z0)
+    return {
+        'gamma': gamma,
+        'impedance': impedance,
+        'admittance': impedance_to_admittance(impedance),
+        'vswr': gamma_to_vswr(gamma),
+        'return_loss_db': gamma_to_return_loss_db(gamma),
+    }
+
+def analyse_impedance(impedance, z0: float = Z0)->dict:
+    """
+    Same as analyse_s11, starting from measured impedance (e.g. the CSVs in data/).
+    """
+    return analyse_s11(impedance_to_gamma(impedance, z0), z0)
+
+#--------------------------------------------------------------------------------
+# TWO-PORT NETWORKS (ABCD) FOR DE-EMBEDDING
+#--------------------------------------------------------------------------------
+# Networks are stacks of 2x2 ABCD matrices with shape (N, 2, 2), one per frequency,
+# so a whole sweep is cascaded and de-embedded with a single np.matmul.
+
+def transmission_line_abcd(frequency_hz, length_m: float, z0: float = Z0,
+                           velocity_factor: float = 1.0, loss_db_per_m: float = 0.0)->np.ndarray:
+    """
+    ABCD matrices of a uniform transmission line (cable, port extension).
+
+    Args:
+        frequency_hz (float | np.ndarray): Frequencies in Hz.
+        length_m (float): Physical line length in metres.
+        z0 (float): Characteristic impedance of the line in Ohms.
+        velocity_factor (float): Propagation velocity as a fraction of c.
+        loss_db_per_m (float): Line attenuation in dB per metre.
+
+    Returns:
+        np.ndarray: ABCD matrices with shape (N, 2, 2).
+    """
+    frequency_hz = np.atleast_1d(np.asarray(frequency_hz, dtype=float))
+    alpha = loss_db_per_m / (20 * np.log10(np.e)) # dB/m -> Np/m
+    beta = 2 * np.pi * frequency_hz / (SPEED_OF_LIGHT * velocity_factor)
+    gamma_l = (alpha + 1j * beta) * length_m
+
+    abcd = np.empty(frequency_hz.shape + (2, 2), dtype=complex)
+    abcd[..., 0, 0] = np.cosh(gamma_l)
+    abcd[..., 0, 1] = z0 * np.sinh(gamma_l)
+    abcd[..., 1, 0] = np.sinh(gamma_l) / z0
+    abcd[..., 1, 1] = np.cosh(gamma_l)
+    return abcd
+
+def series_impedance_abcd(impedance)->np.ndarray:
+    """
+    ABCD matrices of a series element (e.g. a bond wire or connector inductance).
+    """
+    impedance = np.atleast_1d(np.asarray(impedance, dtype=complex))
+    abcd = np.zeros(impedance.shape + (2, 2), dtype=complex)
+    abcd[..., 0, 0] = 1
+    abcd[..., 0, 1] = impedance
+    abcd[..., 1, 1] = 1
+    return abcd
+
+def shunt_admittance_abcd(admittance)->np.ndarray:
+    """
+    ABCD matrices of a shunt element (e.g. fixture pad capacitance).
+    """
+    admittance = np.atleast_1d(np.asarray(admittance, dtype=complex))
+    abcd = np.zeros(admittance.shape + (2, 2), dtype=complex)
+    abcd[..., 0, 0] = 1
+    abcd[..., 1, 0] = admittance
+    abcd[..., 1, 1] = 1
+    return abcd
+
+def cascade_abcd(*networks)->np.ndarray:
+    """
+    Cascades two-ports from the VNA port towards the DUT. Each network is an (N, 2, 2)
+    or (2, 2) stack; shapes broadcast, so a frequency-independent network can be mixed
+    with per-frequency ones.
+    """
+    result = np.asarray(networks[0], dtype=complex)
+    for network in networks[1:]:
+        result = np.matmul(result, network)
+    return result
+
+def s2p_to_abcd(s_params, z0: float = Z0)->np.ndarray:
+    """
+    Converts (N, 2, 2) S-parameters (e.g. a measured fixture .s2p) to ABCD matrices.
+    """
+    s = np.asarray(s_params, dtype=complex)
+    s11, s12, s21, s22 = s[..., 0, 0], s[..., 0, 1], s[..., 1, 0], s[..., 1, 1]
+    abcd = np.empty(s.shape, dtype=complex)
+    abcd[..., 0, 0] = ((1 + s11) * (1 - s22) + s12 * s21) / (2 * s21)
+    abcd[..., 0, 1] = z0 * ((1 + s11) * (1 + s22) - s12 * s21) / (2 * s21)
+    abcd[..., 1, 0] = ((1 - s11) * (1 - s22) - s12 * s21) / (2 * s21 * z0)
+    abcd[..., 1, 1] = ((1 - s11) * (1 + s22) + s12 * s21) / (2 * s21)
+    return abcd
+
+def abcd_to_s2p(abcd, z0: float = Z0)->np.ndarray:
+    """
+    Converts (N, 2, 2) ABCD matrices to S-parameters referenced to z0.
+    """
+    m = np.asarray(abcd, dtype=complex)
+    a, b, c, d = m[..., 0, 0], m[..., 0, 1], m[..., 1, 0], m[..., 1, 1]
+    denominator = a + b / z0 + c * z0 + d
+    s = np.empty(m.shape, dtype=complex)
+    s[..., 0, 0] = (a + b / z0 - c * z0 - d) / denominator
+    s[..., 0, 1] = 2 * (a * d - b * c) / denominator
+    s[..., 1, 0] = 2 / denominator
+    s[..., 1, 1] = (-a + b / z0 - c * z0 + d) / denominator
+    return s
+
+def embed_impedance(load_impedance, fixture_abcd):
+    """
+    Impedance seen at the VNA port when `load_impedance` terminates the fixture,
+    Zin = (A * ZL + B) / (C * ZL + D).
+    """
+    m = np.asarray(fixture_abcd, dtype=complex)
+    load_impedance = np.asarray(load_impedance, dtype=complex)
+    a, b, c, d = m[..., 0, 0], m[..., 0, 1], m[..., 1, 0], m[..., 1, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (a * load_impedance + b) / (c * load_impedance + d)
+
+def deembed_impedance(measured_impedance, fixture_abcd):
+    """
+    Removes a fixture from measured impedance, ZL = (D * Zin - B) / (A - C * Zin).
+
+    Args:
+        measured_impedance (np.ndarray): Impedance at the VNA reference plane, shape (N,).
+        fixture_abcd (np.ndarray): Fixture between the VNA port and the DUT, shape (N, 2, 2)
+                                   or (2, 2).
+
+    Returns:
+        np.ndarray: Impedance at the DUT reference plane, shape (N,).
+    """
+    m = np.asarray(fixture_abcd, dtype=complex)
+    measured_impedance = np.asarray(measured_impedance, dtype=complex)
+    a, b, c, d = m[..., 0, 0], m[..., 0, 1], m[..., 1, 0], m[..., 1, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (d * measured_impedance - b) / (a - c * measured_impedance)
+
+def deembed_s11(s11, frequency_hz, z0: float = Z0, port_extension_m: float = 0.0,
+                velocity_factor: float = 1.0, fixture_abcd=None):
+    """
+    Moves the reference plane of measured S11 to the DUT: first through a port extension
+    (a lossless Z0 line of the given length), then through an optional fixture.
+
+    Args:
+        s11 (np.ndarray): Measured reflection coefficients, shape (N,).
+        frequency_hz (np.ndarray): Frequency of every point in Hz, shape (N,).
+        z0 (float): Reference impedance in Ohms.
+        port_extension_m (float): Electrical length to remove, in metres of line.
+        velocity_factor (float): Velocity factor of the port extension line.
+        fixture_abcd (np.ndarray | None): Fixture ABCD matrices, shape (N, 2, 2) or (2, 2).
+
+    Returns:
+        np.ndarray: S11 at the DUT reference plane, shape (N,).
+    """
+    s11 = np.asarray(s11, dtype=complex)
+    if not port_extension_m and fixture_abcd is None:
+        return s11
+
+    networks = [transmission_line_abcd(frequency_hz, port_extension_m, z0, velocity_factor)]
+    if fixture_abcd is not None:
+        networks.append(fixture_abcd)
+    impedance = deembed_impedance(s11_to_impedance(s11, z0), cascade_abcd(*networks))
+    return impedance_to_gamma(impedance, z0)
+
+#--------------------------------------------------------------------------------
+# OFFLINE ANALYSIS
+#--------------------------------------------------------------------------------
+
+def load_history_csv(path: str)->dict:
+    """
+    Loads a CSV exported by the web interface (the files in data/) into NumPy arrays.
+
+    Args:
+        path (str): Path to the CSV file.
+
+    Returns:
+        dict: 'motor_positions' (N, 4) float array (NaN where missing), 'frequency_hz' (N,)
+              and 'impedance' (N,) complex array.
+    """
+    motor_positions, frequency_mhz, impedance = [], [], []
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            motor_positions.append([_to_float(row.get(f'Motor {i} Position')) for i in range(1, 5)])
+            frequency_mhz.append(_to_float(row.get('Frequency (MHz)')))
+            impedance.append(complex(_to_float(row.get('Real Impedance (Ohms)')),
+                                     _to_float(row.get('Imaginary Impedance (Ohms)'))))
+    return {
+        'motor_positions': np.array(motor_positions, dtype=float).reshape(-1, 4),
+        'frequency_hz': np.array(frequency_mhz, dtype=float) * 1e6,
+        'impedance': np.array(impedance, dtype=complex),
+    }
+
+def _to_float(value)->float:
+    """
+    Parses a CSV cell, mapping blanks and 'N/A' to NaN.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+# Example usage: summarise the recorded sweeps
+if __name__ == "__main__":
+    import glob
+    for path in sorted(glob.glob("data/*.csv")):
+        history = load_history_csv(path)
+        analysis = analyse_impedance(history['impedance'])
+        best = np.argmin(analysis['vswr'])
+        print(f"{path}: {history['impedance'].size} points, best VSWR {analysis['vswr'][best]:.3f} "
+              f"(RL {analysis['return_loss_db'][best]:.1f} dB) at motor positions "
+              f"{history['motor_positions'][best].astype(int).tolist()}")
@@ -0,0 +1,260 @@
+import csv
+import io
+import itertools
+import tempfile
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Parquet and Arrow export are optional
+    pa = None
+
+EXPORT_CHUNK_SIZE = 500 # Points converted and sent at a time
+SPOOL_MAX_BYTES = 8 * 1024 * 1024 # Binary exports larger than this are assembled on disk, not in memory
+READ_BLOCK_BYTES = 64 * 1024
+
+# Format -> (MIME type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'npz': ('application/octet-stream', '.npz'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', '.arrow'),
+}
+
+CSV_HEADER = [
+    'Data Number',
+    'Motor 1 Position',
+    'Motor 2 Position',
+    'Motor 3 Position',
+    'Motor 4 Position',
+    'Frequency (MHz)',
+    'Real Impedance (Ohms)',
+    'Imaginary Impedance (Ohms)',
+    'Color'
+]
+
+def available_formats()->list:
+    """
+    Export formats supported with the installed packages.
+    """
+    return [name for name in EXPORT_FORMATS if pa is not None or name not in ('parquet', 'arrow')]
+
+def export_filename(filename:str, export_format:str)->str:
+    """
+    Appends the format's extension to a user-supplied filename if it is missing.
+    """
+    extension = EXPORT_FORMATS[export_format][1]
+    filename = filename.strip() or 'impedance_history'
+    return filename if filename.endswith(extension) else filename + extension
+
+def export_points(points, export_format:str):
+    """
+    Encodes measurement points as a stream of bytes.
+
+    Args:
+        points (Iterable[dict]): Data points with 'motor_positions', 'frequency_mhz',
+                                 'real_impedance', 'imag_impedance' and 'color'; consumed lazily.
+        export_format (str): One of available_formats().
+
+    Returns:
+        Iterator[bytes]: The encoded file, in blocks.
+
+    Raises:
+        ValueError: If the format is unknown or its package is not installed.
+    """
+    if export_format not in available_formats():
+        raise ValueError(f"Unsupported export format {export_format}; available: {available_formats()}")
+    if export_format == 'csv':
+        return iter_csv(points)
+    if export_format == 'npz':
+        return iter_npz(points)
+    return iter_arrow(points, export_format)
+
+def _position(value):
+    return 'N/A' if value is None else value
+
+def iter_csv(points):
+    """
+    Yields the CSV export (same columns as the web interface's export) one row at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for i, point in enumerate(points):
+        motor_positions = list(point.get('motor_positions') or [])[:4]
+        motor_positions += [None] * (4 - len(motor_positions)) # Pad a copy, never the stored point
+        writer.writerow([
+            i + 1, # Data Number (row index + 1)
+            *(_position(position) for position in motor_positions),
+            point.get('frequency_mhz', ''),
+            point.get('real_impedance', ''),
+            point.get('imag_impedance', ''),
+            point.get('color', '')
+        ])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+def iter_columns(points, chunk_size:int = EXPORT_CHUNK_SIZE):
+    """
+    Yields the points as dicts of NumPy columns, chunk_size points at a time:
+    'motor_positions' (n, 4) float (NaN where missing), 'frequency_mhz',
+    'real_impedance', 'imag_impedance' and 'color'.
+    """
+    points = iter(points)
+    while True:
+        chunk = list(itertools.islice(points, chunk_size))
+        if not chunk:
+            return
+        motor_positions = np.full((len(chunk), 4), np.nan)
+        for row, point in enumerate(chunk):
+            for axis, position in enumerate(list(point.get('motor_positions') or [])[:4]):
+                try:
+                    motor_positions[row, axis] = float(position)
+                except (TypeError, ValueError):
+                    pass # 'N/A' stays NaN
+        yield {
+            'motor_positions': motor_positions,
+            'frequency_mhz': np.array([point.get('frequency_mhz', np.nan) for point in chunk], dtype=float),
+            'real_impedance': np.array([point.get('real_impedance', np.nan) for point in chunk], dtype=float),
+            'imag_impedance': np.array([point.get('imag_impedance', np.nan) for point in chunk], dtype=float),
+            'color': np.array([point.get('color') or '' for point in chunk], dtype=str),
+        }
+
+def _stream_file(file):
+    file.seek(0)
+    while True:
+        block = file.read(READ_BLOCK_BYTES)
+        if not block:
+            return
+        yield block
+
+def iter_npz(points):
+    """
+    Yields a NumPy .npz export with the columns of iter_columns. The zip format needs the
+    whole columns, which are compact (about 40 bytes per point); the file itself is
+    assembled in a spooled temporary file and sent in blocks.
+    """
+    chunks = list(iter_columns(points))
+    if chunks:
+        columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    else:
+        columns = {'motor_positions': np.empty((0, 4)), 'frequency_mhz': np.empty(0),
+                   'real_impedance': np.empty(0), 'imag_impedance': np.empty(0), 'color': np.empty(0, dtype=str)}
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as file:
+        np.savez_compressed(file, **columns)
+        yield from _stream_file(file)
+
+class _ChunkSink:
+    """
+    Write-only file object collecting what pyarrow writes, drained after every batch.
+    """
+    def __init__(self)->None:
+        self.blocks = []
+        self.closed = False
+
+    def write(self, data)->int:
+        self.blocks.append(bytes(data))
+        return len(data)
+
+    def flush(self)->None:
+        pass
+
+    def close(self)->None:
+        self.closed = True
+
+    def drain(self)->bytes:
+        data = b"".join(self.blocks)
+        self.blocks = []
+        return data
+
+def _arrow_schema():
+    return pa.schema([
+        ('motor1', pa.int64()), ('motor2', pa.int64()), ('motor3', pa.int64()), ('motor4', pa.int64()),
+        ('frequency_mhz', pa.float64()),
+        ('real_impedance', pa.float64()),
+        ('imag_impedance', pa.float64()),
+        ('color', pa.string()),
+    ])
+
+def iter_arrow(points, export_format:str):
+    """
+    Yields a Parquet file (one row group per chunk) or an Arrow IPC stream (one record
+    batch per chunk), sending each chunk as soon as it is encoded. Missing motor
+    positions are nulls.
+    """
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    output = pa.PythonFile(sink, mode='w')
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(output, schema)
+    else:
+        writer = pa.ipc.new_stream(output, schema)
+    for columns in iter_columns(points):
+        motor_positions = columns['motor_positions']
+        arrays = [pa.array(motor_positions[:, axis], mask=np.isnan(motor_positions[:, axis])).cast(pa.int64())
+                  for axis in range(4)]
+        arrays += [pa.array(columns[name]) for name in ('frequency_mhz', 'real_impedance', 'imag_impedance', 'color')]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def load_export(path:str)->dict:
+    """
+    Loads an exported file (.npz, .parquet, .arrow or .csv) into the arrays returned by
+    impedance_conversion.load_history_csv.
+
+    Returns:
+        dict: 'motor_positions' (N, 4) float array (NaN where missing), 'frequency_hz' (N,)
+              and 'impedance' (N,) complex array.
+    """
+    if path.endswith('.csv'):
+        import impedance_conversion as ic
+        return ic.load_history_csv(path)
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            motor_positions, frequency_mhz = data['motor_positions'], data['frequency_mhz']
+            impedance = data['real_impedance'] + 1j * data['imag_impedance']
+    else:
+        if pa is None:
+            raise ValueError("pyarrow is required to load Parquet and Arrow exports")
+        if path.endswith('.parquet'):
+            table = pq.read_table(path)
+        else:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_stream(source).read_all()
+        motor_positions = np.column_stack([table.column(f'motor{axis}').to_numpy(zero_copy_only=False).astype(float)
+                                           for axis in range(1, 5)])
+        frequency_mhz = table.column('frequency_mhz').to_numpy()
+        impedance = table.column('real_impedance').to_numpy() + 1j * table.column('imag_impedance').to_numpy()
+    return {'motor_positions': motor_positions.reshape(-1, 4),
+            'frequency_hz': frequency_mhz * 1e6,
+            'impedance': impedance}
+
+def test()->None:
+    """
+    Exports synthetic points in every available format and loads them back.
+    """
+    import os
+    rng = np.random.default_rng(0)
+    points = [{'motor_positions': [i, 2 * i, 0, 'N/A'], 'frequency_mhz': 18.5,
+               'real_impedance': float(rng.uniform(10, 90)), 'imag_impedance': float(rng.uniform(-40, 40)),
+               'color': '#e74c3c'} for i in range(2000)]
+    with tempfile.TemporaryDirectory() as directory:
+        for export_format in available_formats():
+            path = os.path.join(directory, export_filename('test', export_format))
+            with open(path, 'wb') as file:
+                for block in export_points(iter(points), export_format):
+                    file.write(block)
+            loaded = load_export(path)
+            assert loaded['impedance'].size == len(points)
+            assert np.isclose(loaded['impedance'][7], complex(points[7]['real_impedance'], points[7]['imag_impedance']))
+            assert np.isnan(loaded['motor_positions'][0, 3]) and loaded['motor_positions'][5, 1] == 10
+            print(f"{export_format}: {os.path.getsize(path)} bytes for {len(points)} points")
+
+# Example usage
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,381 @@
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from metrics import Histogram
+
+DEFAULT_DB_PATH = "measurements.db"
+BATCH_SIZE = 100 # Points buffered before they are written in one transaction
+FLUSH_INTERVAL_S = 1.0 # Buffered points are written at least this often while points keep arriving
+READ_CHUNK_SIZE = 500 # Rows fetched at a time when iterating over a run
+
+# Metrics, served at /metrics by app.py
+FLUSH_SECONDS = Histogram("measurement_store_flush_seconds", "Time to write one batch of points")
+
+# Run kinds
+RUN_SINGLE = "single" # measurements from the Motor Control tab
+RUN_SWEEP = "sweep"
+RUN_AUTO_TUNE = "auto_tune"
+
+# Point fields stored in their own columns; any other fields go to the JSON 'extra' column
+POINT_COLUMNS = ('frequency_mhz', 'real_impedance', 'imag_impedance', 'color')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    job_id TEXT,
+    created_at REAL NOT NULL,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS points (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    seq INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    motor1 INTEGER, motor2 INTEGER, motor3 INTEGER, motor4 INTEGER,
+    frequency_mhz REAL,
+    real_impedance REAL,
+    imag_impedance REAL,
+    color TEXT,
+    extra TEXT,
+    PRIMARY KEY (run_id, seq)
+);
+CREATE INDEX IF NOT EXISTS points_frequency ON points (frequency_mhz);
+CREATE INDEX IF NOT EXISTS points_motors ON points (motor1, motor2, motor3, motor4);
+CREATE INDEX IF NOT EXISTS runs_kind ON runs (kind, run_id);
+"""
+
+class MeasurementStore:
+    """
+    Durable measurement history in SQLite (WAL mode). Every single-measurement session
+    and every sweep job is a run; points are appended to a run in batches, so a long
+    sweep costs one transaction per BATCH_SIZE points and no memory beyond the batch.
+    The connection is shared between threads behind a lock.
+    """
+    def __init__(self, path:str = DEFAULT_DB_PATH, batch_size:int = BATCH_SIZE,
+                 flush_interval_s:float = FLUSH_INTERVAL_S)->None:
+        """
+        Args:
+            path (str): Database file (":memory:" for a throwaway store).
+            batch_size (int): Points buffered before they are written.
+            flush_interval_s (float): Maximum age of the oldest buffered point when the
+                                      next point arrives.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL") # WAL stays consistent; a power cut loses at most the last commits
+        self.connection.executescript(SCHEMA)
+        self.pending = []
+        self.pending_since = None
+        self.next_seq = {} # run_id -> sequence number of the next point
+        # Points written or buffered, counted once here and kept up to date by add_point()
+        self.point_total = self.connection.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+
+    def create_run(self, kind:str, config:dict = None, job_id:str = None)->int:
+        """
+        Start a new run.
+
+        Returns:
+            int: The run ID.
+        """
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (kind, job_id, created_at, config) VALUES (?, ?, ?, ?)",
+                (kind, job_id, time.time(), json.dumps(config) if config is not None else None))
+            self.connection.commit()
+            self.next_seq[cursor.lastrowid] = 0
+            return cursor.lastrowid
+
+    def latest_run(self, kind:str):
+        """
+        Returns the ID of the newest run of a kind, or None.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT MAX(run_id) FROM runs WHERE kind = ?", (kind,)).fetchone()
+            return row[0]
+
+    def add_point(self, run_id:int, point:dict)->int:
+        """
+        Append a point to a run. It is written with the next batch.
+
+        Args:
+            run_id (int): The run.
+            point (dict): A data point with 'motor_positions', 'frequency_mhz',
+                          'real_impedance', 'imag_impedance', 'color' and any extra fields.
+
+        Returns:
+            int: The point's index within the run.
+        """
+        motors = list(point.get('motor_positions') or [])[:4]
+        motors = [_to_int(position) for position in motors] + [None] * (4 - len(motors))
+        extra = {key: value for key, value in point.items()
+                 if key not in POINT_COLUMNS and key != 'motor_positions'}
+        with self.lock:
+            seq = self._next_seq(run_id)
+            self.pending.append((run_id, seq, time.time(), *motors,
+                                 *(point.get(column) for column in POINT_COLUMNS),
+                                 json.dumps(extra) if extra else None))
+            self.point_total += 1
+            if self.pending_since is None:
+                self.pending_since = time.monotonic()
+            if (len(self.pending) >= self.batch_size
+                    or time.monotonic() - self.pending_since >= self.flush_interval_s):
+                self.flush()
+            return seq
+
+    def _next_seq(self, run_id:int)->int:
+        if run_id not in self.next_seq:
+            row = self.connection.execute("SELECT MAX(seq) FROM points WHERE run_id = ?", (run_id,)).fetchone()
+            self.next_seq[run_id] = 0 if row[0] is None else row[0] + 1
+        seq = self.next_seq[run_id]
+        self.next_seq[run_id] += 1
+        return seq
+
+    def flush(self)->None:
+        """
+        Write all buffered points in one transaction.
+        """
+        with self.lock:
+            if not self.pending:
+                return
+            with FLUSH_SECONDS.time(), self.connection:
+                self.connection.executemany(
+                    "INSERT INTO points (run_id, seq, created_at, motor1, motor2, motor3, motor4, "
+                    "frequency_mhz, real_impedance, imag_impedance, color, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+            self.pending = []
+            self.pending_since = None
+
+    def count_points(self, run_id:int)->int:
+        with self.lock:
+            self.flush()
+            return self.connection.execute("SELECT COUNT(*) FROM points WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+    def total_points(self)->int:
+        """
+        Number of points in the store, written or buffered (a running count: no query
+        and no lock, so /metrics scrapes never wait for a batch write).
+        """
+        return self.point_total
+
+    def get_points(self, run_id:int, since:int = 0, limit:int = None)->list:
+        """
+        Points of a run from index `since` on, as data point dicts.
+        """
+        with self.lock:
+            self.flush()
+            rows = self.connection.execute(
+                "SELECT * FROM points WHERE run_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (run_id, since, -1 if limit is None else limit)).fetchall()
+        return [_row_to_point(row) for row in rows]
+
+    def iter_points(self, run_id:int, chunk_size:int = READ_CHUNK_SIZE):
+        """
+        Yields the points of a run in order, reading chunk_size rows at a time so that
+        exporting a large run needs no more memory than one chunk.
+        """
+        since = 0
+        while True:
+            points = self.get_points(run_id, since, chunk_size)
+            yield from points
+            if len(points) < chunk_size:
+                return
+            since += len(points)
+
+    def query_points(self, filters:dict = None, after:tuple = None, limit:int = READ_CHUNK_SIZE)->tuple:
+        """
+        One page of the points matching the filters, ordered by run and sequence number.
+
+        Args:
+            filters (dict | None): See _where().
+            after (tuple | None): (run_id, seq) of the last point of the previous page.
+            limit (int): Maximum number of points on the page.
+
+        Returns:
+            tuple: (points, cursor) where every point carries its 'run_id' and 'seq', and
+                   cursor is the (run_id, seq) to pass as `after` for the next page, or
+                   None after the last page.
+        """
+        where, parameters = _where(filters)
+        if after is not None:
+            where.append("(run_id, seq) > (?, ?)") # Keyset pagination: no OFFSET scans
+            parameters += list(after)
+        with self.lock:
+            self.flush()
+            rows = self.connection.execute(
+                f"SELECT * FROM points {_where_clause(where)} ORDER BY run_id, seq LIMIT ?",
+                parameters + [limit + 1]).fetchall()
+        cursor = (rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [_row_to_point(row, with_key=True) for row in rows[:limit]], cursor
+
+    def query_series(self, filters:dict = None)->dict:
+        """
+        The keys and impedances of all points matching the filters as NumPy columns, in
+        run and sequence order (for decimation before fetching the full points).
+
+        Returns:
+            dict: 'run_id', 'seq' (int arrays) and 'impedance' (complex array).
+        """
+        where, parameters = _where(filters)
+        with self.lock:
+            self.flush()
+            rows = self.connection.execute(
+                f"SELECT run_id, seq, real_impedance, imag_impedance FROM points {_where_clause(where)} "
+                "ORDER BY run_id, seq", parameters).fetchall()
+        columns = np.array(rows, dtype=float).reshape(-1, 4)
+        return {'run_id': columns[:, 0].astype(int), 'seq': columns[:, 1].astype(int),
+                'impedance': columns[:, 2] + 1j * columns[:, 3]}
+
+    def get_points_by_key(self, keys)->list:
+        """
+        Points for a list of (run_id, seq) keys, in the order given.
+        """
+        keys = [(int(run_id), int(seq)) for run_id, seq in keys]
+        found = {}
+        with self.lock:
+            self.flush()
+            for start in range(0, len(keys), READ_CHUNK_SIZE):
+                chunk = keys[start:start + READ_CHUNK_SIZE]
+                placeholders = ", ".join("(?, ?)" for _ in chunk)
+                rows = self.connection.execute(
+                    f"SELECT * FROM points WHERE (run_id, seq) IN (VALUES {placeholders})",
+                    [value for key in chunk for value in key]).fetchall()
+                for row in rows:
+                    found[(row[0], row[1])] = _row_to_point(row, with_key=True)
+        return [found[key] for key in keys if key in found]
+
+    def runs(self, kind:str = None, limit:int = 50)->list:
+        """
+        The newest runs (of a kind, if given) with their point counts.
+        """
+        return self._select_runs("WHERE ? IS NULL OR kind = ? ORDER BY run_id DESC LIMIT ?", (kind, kind, limit))
+
+    def get_run(self, run_id:int):
+        """
+        Returns a run with its point count, or None if it does not exist.
+        """
+        runs = self._select_runs("WHERE run_id = ?", (run_id,))
+        return runs[0] if runs else None
+
+    def _select_runs(self, where:str, parameters:tuple)->list:
+        with self.lock:
+            self.flush()
+            rows = self.connection.execute(
+                "SELECT runs.run_id, kind, job_id, created_at, config, "
+                "(SELECT COUNT(*) FROM points WHERE points.run_id = runs.run_id) "
+                f"FROM runs {where}", parameters).fetchall()
+        return [{'run_id': run_id, 'kind': kind, 'job_id': job_id, 'created_at': created_at,
+                 'config': json.loads(config) if config else None, 'points': count}
+                for run_id, kind, job_id, created_at, config, count in rows]
+
+    def close(self)->None:
+        with self.lock:
+            self.flush()
+            self.connection.close()
+
+def _to_int(value):
+    """
+    Motor positions may arrive as numbers, numeric strings or 'N/A'.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _where(filters:dict)->tuple:
+    """
+    SQL conditions for point filters.
+
+    Args:
+        filters (dict | None): Any of 'run_ids' (list), 'kind' (run kind),
+            'frequency_min_mhz', 'frequency_max_mhz', and 'motor_ranges'
+            ({motor number 1-4: (min or None, max or None)}).
+
+    Returns:
+        tuple: (list of conditions, list of parameters)
+    """
+    filters = filters or {}
+    where, parameters = [], []
+    if filters.get('run_ids'):
+        where.append(f"run_id IN ({', '.join('?' for _ in filters['run_ids'])})")
+        parameters += [int(run_id) for run_id in filters['run_ids']]
+    if filters.get('kind'):
+        where.append("run_id IN (SELECT run_id FROM runs WHERE kind = ?)")
+        parameters.append(filters['kind'])
+    if filters.get('frequency_min_mhz') is not None:
+        where.append("frequency_mhz >= ?")
+        parameters.append(float(filters['frequency_min_mhz']))
+    if filters.get('frequency_max_mhz') is not None:
+        where.append("frequency_mhz <= ?")
+        parameters.append(float(filters['frequency_max_mhz']))
+    for motor, (low, high) in (filters.get('motor_ranges') or {}).items():
+        if int(motor) not in (1, 2, 3, 4):
+            raise ValueError(f"Invalid motor number {motor}")
+        if low is not None:
+            where.append(f"motor{int(motor)} >= ?")
+            parameters.append(int(low))
+        if high is not None:
+            where.append(f"motor{int(motor)} <= ?")
+            parameters.append(int(high))
+    return where, parameters
+
+def _where_clause(where:list)->str:
+    return f"WHERE {' AND '.join(where)}" if where else ""
+
+def _row_to_point(row, with_key:bool = False)->dict:
+    run_id, seq, created_at, motor1, motor2, motor3, motor4, frequency_mhz, real, imag, color, extra = row
+    point = {
+        'motor_positions': [motor1, motor2, motor3, motor4],
+        'frequency_mhz': frequency_mhz,
+        'real_impedance': real,
+        'imag_impedance': imag,
+        'color': color,
+    }
+    if extra:
+        point.update(json.loads(extra))
+    if with_key:
+        point['run_id'], point['seq'] = run_id, seq
+    return point
+
+def test()->None:
+    """
+    Writes a large run to a temporary database and reads it back.
+    """
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        store = MeasurementStore(os.path.join(directory, "test.db"))
+        run_id = store.create_run(RUN_SWEEP, {'note': 'test'})
+        start = time.perf_counter()
+        for i in range(10000):
+            store.add_point(run_id, {'id': i + 1, 'motor_positions': [i, 0, 0, 0], 'frequency_mhz': 18.5,
+                                     'real_impedance': 50.0 + i, 'imag_impedance': -1.0, 'color': '#e74c3c'})
+        store.flush()
+        print(f"10000 points written in {time.perf_counter() - start:.3f} s")
+        assert store.count_points(run_id) == 10000 and store.total_points() == 10000
+        assert store.get_points(run_id, since=9998)[0]['id'] == 9999
+        assert sum(1 for _ in store.iter_points(run_id)) == 10000
+        page, cursor = store.query_points({'motor_ranges': {1: (100, 1999)}}, limit=1000)
+        assert page[0]['motor_positions'][0] == 100 and cursor == (run_id, 1099)
+        page, cursor = store.query_points({'motor_ranges': {1: (100, 1999)}}, after=cursor, limit=1000)
+        assert page[-1]['motor_positions'][0] == 1999 and cursor is None
+        series = store.query_series({'run_ids': [run_id], 'frequency_min_mhz': 18})
+        assert series['impedance'].size == 10000
+        keys = list(zip(series['run_id'][[5, 3]], series['seq'][[5, 3]]))
+        assert [point['id'] for point in store.get_points_by_key(keys)] == [6, 4]
+        print(store.runs())
+        store.close()
+        reopened = MeasurementStore(os.path.join(directory, "test.db"))
+        reopened.add_point(run_id, {'motor_positions': [0, 0, 0, 0], 'frequency_mhz': 18.5})
+        assert reopened.total_points() == 10001
+        reopened.close()
+
+# Example usage
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,278 @@
+"""
+Counters, gauges and histograms exposed in the Prometheus text format (version 0.0.4),
+without a client library. Updating a metric takes one lock and a few additions, so
+they can sit in the measurement and motor hot paths.
+
+Metrics are created once at module level and register themselves:
+    REQUESTS = Counter("encoder_requests_total", "Commands served", ["command"])
+    REQUESTS.labels("A").inc()
+    with MOVE_SECONDS.labels("1").time():
+        ...
+render() returns the text served at /metrics.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # seconds
+
+class Registry:
+    """
+    The metrics rendered together at one endpoint.
+    """
+    def __init__(self)->None:
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric)->None:
+        """
+        Adds a metric. One with the same name replaces the previous one, as happens when
+        a module run as a script is imported again under its own name.
+        """
+        with self.lock:
+            self.metrics = [existing for existing in self.metrics if existing.name != metric.name]
+            self.metrics.append(metric)
+
+    def render(self)->str:
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def render()->str:
+    """
+    All registered metrics in the Prometheus text format.
+    """
+    return REGISTRY.render()
+
+def _format_value(value:float)->str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _escape(value:str)->str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names:tuple, values:tuple, extra:str = "")->str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Child:
+    """
+    A metric bound to one set of label values.
+    """
+    def __init__(self, metric, key:tuple)->None:
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount:float = 1)->None:
+        self.metric._inc(self.key, amount)
+
+    def dec(self, amount:float = 1)->None:
+        self.metric._inc(self.key, -amount)
+
+    def set(self, value:float)->None:
+        self.metric._set(self.key, value)
+
+    def set_function(self, function)->None:
+        self.metric._set_function(self.key, function)
+
+    def observe(self, value:float)->None:
+        self.metric._observe(self.key, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name:str, documentation:str, labelnames:list = (), registry:Registry = REGISTRY)->None:
+        """
+        Args:
+            name (str): Metric name, e.g. "vna_errors_total".
+            documentation (str): One-line description (the HELP text).
+            labelnames (list): Label names; values are given with labels().
+            registry (Registry): Where the metric is rendered.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        self.children = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values)->_Child:
+        """
+        The metric for one combination of label values (as strings).
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children.setdefault(key, _Child(self, key))
+        return child
+
+    def _unlabelled(self)->_Child:
+        if self.labelnames:
+            raise ValueError(f"{self.name} needs labels {self.labelnames}")
+        return self.labels()
+
+    def inc(self, amount:float = 1)->None:
+        self._unlabelled().inc(amount)
+
+    def samples(self)->list:
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+class Counter(_Metric):
+    """
+    A value that only goes up (events, errors, steps).
+    """
+    kind = "counter"
+
+    def _inc(self, key:tuple, amount:float)->None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, set directly or read from a function at render time.
+    """
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs)->None:
+        super().__init__(*args, **kwargs)
+        self.functions = {}
+
+    def _inc(self, key:tuple, amount:float)->None:
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _set(self, key:tuple, value:float)->None:
+        with self.lock:
+            self.values[key] = value
+
+    def _set_function(self, key:tuple, function)->None:
+        with self.lock:
+            self.functions[key] = function
+
+    def dec(self, amount:float = 1)->None:
+        self._unlabelled().dec(amount)
+
+    def set(self, value:float)->None:
+        self._unlabelled().set(value)
+
+    def set_function(self, function)->None:
+        """
+        Report function() at every render instead of a stored value.
+        """
+        self._unlabelled().set_function(function)
+
+    def samples(self)->list:
+        with self.lock:
+            functions = dict(self.functions)
+        for key, function in functions.items():
+            try:
+                value = function()
+            except Exception: # a failing callback must not break the whole endpoint
+                value = math.nan
+            with self.lock:
+                self.values[key] = value
+        return super().samples()
+
+class Histogram(_Metric):
+    """
+    Distribution of observations (durations, sizes) over fixed buckets.
+    """
+    kind = "histogram"
+
+    def __init__(self, name:str, documentation:str, labelnames:list = (), buckets:tuple = DEFAULT_BUCKETS,
+                 registry:Registry = REGISTRY)->None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _observe(self, key:tuple, value:float)->None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def observe(self, value:float)->None:
+        self._unlabelled().observe(value)
+
+    def time(self):
+        """
+        Context manager observing the duration of its block, in seconds.
+        """
+        return self._unlabelled().time()
+
+    def samples(self)->list:
+        with self.lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self.values.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def test()->None:
+    """
+    Renders a private registry and measures the cost of an observation.
+    """
+    registry = Registry()
+    errors = Counter("test_errors_total", "Errors", ["kind"], registry=registry)
+    latency = Histogram("test_latency_seconds", "Latency", registry=registry)
+    size = Gauge("test_size", "Size", registry=registry)
+    errors.labels("visa").inc()
+    errors.labels("visa").inc(2)
+    size.set_function(lambda: 42)
+    for value in (0.003, 0.02, 7.0, 60.0):
+        latency.observe(value)
+    text = registry.render()
+    print(text)
+    assert 'test_errors_total{kind="visa"} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.005"} 1' in text and 'test_latency_seconds_bucket{le="+Inf"} 4' in text
+    assert "test_size 42" in text
+    count = 100000
+    start = time.perf_counter()
+    for _ in range(count):
+        latency.observe(0.01)
+    print(f"{(time.perf_counter() - start) / count * 1e6:.2f} us per observation")
+
+# Example usage
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,272 @@
+"""
+SCPI command layer between VNAController and its pyvisa resource.
+
+Instrument settings are written through set(), which remembers the last value sent for
+each header and drops a write whose value the instrument already has. Settings and
+commands are not sent one message at a time: they are queued and go out together, joined
+with ";:", in front of the next query, e.g.
+    SENS1:FREQ:STAR 18500000.0;:SENS1:FREQ:STOP 18500000.0;:INIT1:IMM;*OPC?
+so a point of a sweep costs the trigger and the trace read, whatever it configured.
+(Each command after the first starts with ':' so it is resolved from the root of the
+command tree, not from the previous command's path.)
+
+The remembered values are only as good as the assumption that nothing else changes the
+instrument: they are forgotten on *RST and SYST:PRES, and whenever the resource raises
+(timeouts, lost connection), since the instrument may then have applied some, all or none
+of the last message. A message that carried setting changes is followed by a SYST:ERR?
+query: if the instrument rejected anything (e.g. a frequency out of range), the remembered
+values are forgotten too and SCPIError is raised.
+"""
+from metrics import Counter
+
+MAX_MESSAGE_BYTES = 4096 # Longest coalesced message; longer queues are split (instrument input buffer)
+RESET_COMMANDS = ("*RST", "SYST:PRES") # Commands that return every setting to its default
+NO_ERROR_CODE = 0 # SYST:ERR? code of an empty error queue
+
+# Metrics, served at /metrics by app.py
+MESSAGES = Counter("scpi_messages_total", "Messages sent to instruments", ["kind"])
+SUPPRESSED = Counter("scpi_settings_suppressed_total", "Setting writes skipped because the value was unchanged")
+INSTRUMENT_ERRORS = Counter("scpi_instrument_errors_total", "Errors read from instrument error queues")
+
+class SCPIError(Exception):
+    """
+    Raised when the instrument's error queue reports errors after settings were sent.
+    """
+    def __init__(self, errors:list)->None:
+        super().__init__(f"Instrument reported {', '.join(errors)}")
+        self.errors = errors
+
+def _header(command:str)->str:
+    return command.split(" ", 1)[0].upper().lstrip(":")
+
+class SCPISession:
+    """
+    Wraps an open pyvisa message-based resource with a settings cache and a write queue.
+    """
+    def __init__(self, resource, max_message_bytes:int = MAX_MESSAGE_BYTES)->None:
+        """
+        Args:
+            resource (pyvisa.resources.MessageBasedResource): The open instrument.
+            max_message_bytes (int): Longest message sent for queued commands.
+        """
+        self.resource = resource
+        self.max_message_bytes = max_message_bytes
+        self.known = {} # key -> value last sent (the instrument's current setting)
+        self.pending = [] # commands queued for the next message
+        self.unchecked = False # settings were queued or sent since the error queue was last read
+
+    def configure(self, key:str, value, commands:list)->bool:
+        """
+        Queues `commands` unless `key` is already known to have `value`.
+        Use set() for a plain "HEADER value" setting; this covers settings made by
+        several commands, such as a whole segment table.
+
+        Args:
+            key (str): Name of the setting.
+            value: Its new value (compared with ==).
+            commands (list): Commands that apply the value.
+
+        Returns:
+            bool: True if the commands were queued, False if suppressed.
+        """
+        if key in self.known and self.known[key] == value:
+            SUPPRESSED.inc()
+            return False
+        for command in commands:
+            self.send(command)
+        self.known[key] = value
+        self.unchecked = True
+        return True
+
+    def set(self, header:str, value)->bool:
+        """
+        Queues "header value" unless the instrument already has that value.
+
+        Returns:
+            bool: True if the setting was queued, False if suppressed.
+        """
+        return self.configure(_header(header), f"{value}", [f"{header} {value}"])
+
+    def send(self, command:str)->None:
+        """
+        Queues a command that is not a cached setting (an action such as INIT1:IMM,
+        or a setting whose value is not tracked). A reset forgets every known setting.
+        """
+        self.pending.append(command)
+        if _header(command) in RESET_COMMANDS:
+            self.known.clear()
+
+    def invalidate(self)->None:
+        """
+        Forgets every known setting, so the next set() of each is sent again.
+        """
+        self.known.clear()
+
+    def _messages(self, final:str = None)->list:
+        """
+        Joins the queued commands (and `final`) into as few messages as the size limit allows.
+        """
+        commands = self.pending + ([final] if final is not None else [])
+        self.pending = []
+        messages = []
+        for command in commands:
+            if messages and len(messages[-1]) + len(command) + 2 <= self.max_message_bytes:
+                messages[-1] += ";" + (command if command.startswith(("*", ":")) else ":" + command)
+            else:
+                messages.append(command)
+        return messages
+
+    def _call(self, function, *args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            # The instrument may have applied any part of the message
+            self.pending = []
+            self.invalidate()
+            raise
+
+    def _verify(self)->None:
+        """
+        Reads the error queue if settings went out since it was last read.
+
+        Raises:
+            SCPIError: If the instrument reported errors.
+        """
+        if self.unchecked:
+            errors = self.check_errors()
+            if errors:
+                raise SCPIError(errors)
+
+    def flush(self)->None:
+        """
+        Sends the queued commands. If they end with a query, the error queue is
+        read after its reply, by read().
+        """
+        messages = self._messages()
+        for message in messages:
+            MESSAGES.labels("write").inc()
+            self._call(self.resource.write, message)
+        if messages and not _header(messages[-1].rsplit(";", 1)[-1]).endswith("?"):
+            self._verify()
+
+    def write(self, command:str)->None:
+        """
+        Sends the queued commands and `command`, in one message where possible.
+        """
+        self.send(command)
+        self.flush()
+
+    def _send_with(self, query:str)->str:
+        """
+        Sends all but the last coalesced message, and returns the last one (ending in `query`).
+        """
+        messages = self._messages(query)
+        for message in messages[:-1]:
+            MESSAGES.labels("write").inc()
+            self._call(self.resource.write, message)
+        MESSAGES.labels("query").inc()
+        return messages[-1]
+
+    def query(self, command:str)->str:
+        """
+        Sends the queued commands together with a query and returns its reply.
+        """
+        reply = self._call(self.resource.query, self._send_with(command))
+        self._verify()
+        return reply
+
+    def query_binary_values(self, command:str, **kwargs):
+        """
+        Sends the queued commands together with a query answered by a binary block,
+        see pyvisa's query_binary_values().
+        """
+        values = self._call(self.resource.query_binary_values, self._send_with(command), **kwargs)
+        self._verify()
+        return values
+
+    def read(self)->str:
+        reply = self._call(self.resource.read)
+        self._verify()
+        return reply
+
+    def check_errors(self)->list:
+        """
+        Empties the instrument's error queue. Any error means a setting may not have been
+        applied as sent, so the known settings are forgotten.
+
+        Returns:
+            list: The error strings, e.g. ['-222,"Data out of range"'], empty if none.
+        """
+        self.unchecked = False
+        errors = []
+        while True:
+            reply = self.query("SYST:ERR?").strip()
+            try:
+                code = int(reply.split(",", 1)[0])
+            except ValueError:
+                code = None
+            if code == NO_ERROR_CODE:
+                break
+            errors.append(reply)
+            if code is None or len(errors) >= 100: # an unparsable reply would never end the loop
+                break
+        if errors:
+            INSTRUMENT_ERRORS.inc(len(errors))
+            self.invalidate()
+        return errors
+
+def test()->None:
+    """
+    Runs a session against a recording stand-in resource and checks which messages are sent.
+    """
+    class Recorder:
+        def __init__(self):
+            self.messages = []
+            self.errors = []
+        def write(self, message):
+            self.messages.append(message)
+        def query(self, message):
+            self.messages.append(message)
+            if message.endswith("SYST:ERR?"):
+                return self.errors.pop(0) if self.errors else '0,"No error"'
+            return "1"
+        def read(self):
+            return ""
+
+    resource = Recorder()
+    session = SCPISession(resource, max_message_bytes=80)
+    session.set("SENS1:FREQ:STAR", 18.5e6)
+    session.set("SENS1:FREQ:STOP", 18.5e6)
+    session.query("INIT1:IMM;*OPC?")
+    session.set("SENS1:FREQ:STAR", 18.5e6) # unchanged: suppressed
+    session.set("SENS1:FREQ:STOP", 18.5e6)
+    session.query("INIT1:IMM;*OPC?")
+    assert resource.messages == ["SENS1:FREQ:STAR 18500000.0;:SENS1:FREQ:STOP 18500000.0;:INIT1:IMM;*OPC?",
+                                 "SYST:ERR?", "INIT1:IMM;*OPC?"], resource.messages
+    session.write("*RST")
+    session.set("SENS1:FREQ:STAR", 18.5e6) # the reset forgot it
+    session.configure("SENS1:SEGM", (1e6, 2e6), [f"SENS1:SEGM{i}:ADD" for i in (1, 2)])
+    session.configure("SENS1:SEGM", (1e6, 2e6), [f"SENS1:SEGM{i}:ADD" for i in (1, 2)])
+    session.flush()
+    assert resource.messages[3:] == ["*RST", "SENS1:FREQ:STAR 18500000.0;:SENS1:SEGM1:ADD;:SENS1:SEGM2:ADD",
+                                     "SYST:ERR?"], resource.messages
+    for i in range(10):
+        session.send(f"SENS1:SEGM{i}:SWE:POIN 1")
+    session.flush()
+    assert all(len(message) <= 80 for message in resource.messages[6:]) and len(resource.messages) > 7
+    assert "SYST:ERR?" not in resource.messages[6:] # no setting changed
+
+    # A rejected setting is reported and forgets the known settings
+    resource.errors = ['-222,"Data out of range"']
+    session.set("SENS1:FREQ:STAR", 9e9)
+    try:
+        session.query("INIT1:IMM;*OPC?")
+    except SCPIError as e:
+        assert e.errors == ['-222,"Data out of range"'] and not session.known
+    else:
+        raise AssertionError("The error was not reported")
+    print("\n".join(resource.messages))
+
+# Example usage
+if __name__ == "__main__":
+    test()
@@ -1,3 +1,5 @@
+import { SmithChart } from './smith_chart.js';
+
 // --- Selectors for Motor Control Elements ---
 let inputBox1 = document.querySelector('#numin-1'); // Input field for Motor 1 steps
 let inputBox2 = document.querySelector('#numin-2'); // Input field for Motor 2 steps
@@ -17,7 +19,7 @@ let btnGetImpedance = document.querySelector('#btn-get-impedance'); // Button to
 let realImpedanceSpan = document.querySelector('#real-impedance'); // Span to display real impedance
 let imagImpedanceSpan = document.querySelector('#imag-impedance'); // Span to display imaginary impedance
 let smithChartCanvas = document.querySelector('#smith-chart-canvas'); // Canvas for Smith Chart
-let ctx = smithChartCanvas.getContext('2d'); // 2D rendering context for the canvas
+let smithChart = new SmithChart(smithChartCanvas); // Layered renderer for the Smith Chart
 let btnClearHistory = document.querySelector('#btn-clear-history'); // New: Button to clear impedance history
 
 // --- Selectors for Results Panel Elements ---
@@ -25,6 +27,7 @@ let impedanceResultsTableBody = document.querySelector('#impedance-results-table
 let datasetColorSelect = document.querySelector('#dataset-color-select'); // Dropdown for dataset color
 let exportFilenameInput = document.querySelector('#export-filename-input'); // Input for custom export filename
 let btnExportCustomImpedance = document.querySelector('#btn-export-custom-impedance'); // Button to export with custom filename
+let exportFormatSelect = document.querySelector('#export-format-select'); // Dropdown for export file format
 
 // --- Selectors for Parameter Sweep Elements ---
 let btnStartSweep = document.querySelector('#btn-start-sweep'); // Button to start a frequency sweep
@@ -32,11 +35,14 @@ let sweepImpedanceResultsTableBody = document.querySelector('#impedance-results-
 let realImpedanceSweepSpan = document.querySelector('#real-impedance-sweep'); // Span to display real impedance for sweep
 let imagImpedanceSweepSpan = document.querySelector('#imag-impedance-sweep'); // Span to display imaginary impedance for sweep
 let smithChartCanvasSweep = document.querySelector('#smith-chart-canvas-sweep'); // Canvas for Sweep Smith Chart
-let ctxSweep = smithChartCanvasSweep.getContext('2d'); // 2D rendering context for the sweep canvas
+let smithChartSweep = new SmithChart(smithChartCanvasSweep); // Layered renderer for the sweep Smith Chart
 let btnClearHistorySweep = document.querySelector('#btn-clear-history-sweep'); // Button to clear sweep impedance history
 let exportFilenameInputSweep = document.querySelector('#export-filename-input-sweep'); // Input for custom sweep export filename
 let btnExportCustomImpedanceSweep = document.querySelector('#btn-export-custom-impedance-sweep'); // Button to export sweep with custom filename
+let exportFormatSelectSweep = document.querySelector('#export-format-select-sweep'); // Dropdown for sweep export file format
 let datasetColorSelectSweep = document.querySelector('#dataset-color-select-sweep'); // Dropdown for sweep dataset color
+let btnStopSweep = document.querySelector('#btn-stop-sweep'); // Button to cancel the running sweep
+let sweepStatusSpan = document.querySelector('#sweep-status'); // Span to display sweep job status/progress
 
 // Global variable to store impedance history
 // Each entry will be:
@@ -59,7 +65,15 @@ let currentDatasetColor = datasetColorSelect.value; // Initialize with default s
 //   imag_impedance: number,
 //   color: string
 // }
+// Only the newest MAX_SWEEP_TABLE_ROWS points are kept; larger sweeps are redrawn from
+// a decimated server query.
 let sweepImpedanceHistory = [];
+let sweepPointCount = 0; // Points received from the current sweep, including those no longer kept
+const MAX_SWEEP_TABLE_ROWS = 500; // Sweep points kept in the page and shown in the table
+const MAX_SMITH_CHART_POINTS = 2000; // Points requested when a large sweep is redrawn
+let currentSweepJobId = null; // ID of the sweep job being followed, null when none is running
+let sweepRunIds = []; // Stored runs shown in the sweep tab, exported by the server
+let sweepEventSource = null; // Live event stream of the sweep job being followed
 
 // --- Helper for custom alert/message box ---
 /**
@@ -101,6 +115,10 @@ async function sendMotorCommand(motorNum, value) {
     try {
         // Fetch data from the Flask server
         let response = await fetch(url);
+        if (!response.ok) { // e.g. 409 while a sweep or auto-tune job owns the motors
+            showMessage((await response.json()).error || `Failed to move motor ${motorNum}.`, 'error');
+            return;
+        }
         // Get the response text (motor position)
         let data = await response.text();
         console.log(`Motor ${motorNum} response: ${data}`);
@@ -141,6 +159,10 @@ button_calibrate.addEventListener('click', async () => {
     let url = `${location.protocol}//${location.host}/button/calibrate`;
     try {
         let response = await fetch(url);
+        if (!response.ok) {
+            showMessage((await response.json()).error || "Calibration failed.", 'error');
+            return;
+        }
         let data = await response.text(); // Expecting "Reset Position OK"
         if (data === "Reset Position OK") {
             // Reset all position displays to 0
@@ -159,76 +181,6 @@ button_calibrate.addEventListener('click', async () => {
 });
 
 // --- VNA Impedance Functions ---------------------------------------------------------------------
-/**
- * Draws impedance points on a simplified Smith Chart canvas.
- * @param {HTMLCanvasElement} canvas - The canvas element to draw on.
- * @param {Array} impedancePoints - An array of impedance objects {real_impedance, imag_impedance, color, ...}.
-*/
-function drawSmithChart(canvas, impedancePoints) {
-    const ctx = canvas.getContext('2d');
-    const centerX = canvas.width / 2;
-    const centerY = canvas.height / 2;
-    const radius = Math.min(centerX, centerY) * 0.93; // Chart radius, 93% of smaller dimension
-    const z0 = 50; // Characteristic impedance (typically 50 Ohms)
-
-    // Clear the entire canvas before drawing to ensure previous points are removed
-    ctx.clearRect(0, 0, canvas.width, canvas.height);
-
-    // Draw outer circle (representing |Gamma|=1, normalized impedance 1+j0)
-    ctx.beginPath();
-    ctx.arc(centerX, centerY, radius, 0, 2 * Math.PI);
-    ctx.strokeStyle = '#95a5a6'; // Light grey color
-    ctx.lineWidth = 1; // Thin line
-    ctx.stroke();
-
-    // Draw horizontal line (real axis of the Smith Chart)
-    ctx.beginPath();
-    ctx.moveTo(centerX - radius, centerY);
-    ctx.lineTo(centerX + radius, centerY);
-    ctx.strokeStyle = '#95a5a6';
-    ctx.lineWidth = 1;
-    ctx.stroke();
-
-    // Iterate over each impedance point in the history and plot it
-    impedancePoints.forEach((impedance, index) => {
-        const r = impedance.real_impedance;
-        const x = impedance.imag_impedance;
-
-        // Normalize impedance: z = R/Z0 + jX/Z0
-        const r_norm = r / z0;
-        const x_norm = x / z0;
-
-        // Convert normalized impedance to reflection coefficient Gamma (Γ)
-        // Γ = (z - 1) / (z + 1)
-        const denominator = (r_norm + 1) * (r_norm + 1) + x_norm * x_norm;
-        const gamma_real = ((r_norm - 1) * (r_norm + 1) + x_norm * x_norm) / denominator;
-        const gamma_imag = (2 * x_norm) / denominator;
-
-        // Map Gamma coordinates to canvas pixel coordinates
-        // Smith Chart center (Gamma = 0+j0) maps to (centerX, centerY) on canvas
-        // Radius of Smith Chart (Gamma = 1) maps to 'radius' on canvas
-        const plotX = centerX + gamma_real * radius;
-        const plotY = centerY - gamma_imag * radius; // Y-axis is inverted in canvas
-
-        // Draw the impedance point
-        ctx.beginPath();
-        // Use the selected plotColor for all points
-        ctx.arc(plotX, plotY, 4, 0, 2 * Math.PI); // Point size
-        ctx.fillStyle = impedance.color; // Use the stored color for each point
-        ctx.fill();
-        ctx.strokeStyle = '#333'; // A darker stroke for contrast
-        ctx.lineWidth = 1;
-        ctx.stroke();
-
-        // Optionally, add text label for the latest point or all points
-        if (index === impedancePoints.length - 1) { // Only label the latest point
-            ctx.fillStyle = '#2c3e50';
-            ctx.font = '12px Arial';
-            ctx.fillText(`Z: ${r.toFixed(2)} + j${x.toFixed(2)}`, plotX + 10, plotY - 10);
-        }
-    });
-}
-
 // Event listener for the Get Impedance button
 btnGetImpedance.addEventListener('click', async () => {
     // Get the frequency from the input field and parse it as a float
@@ -281,9 +233,9 @@ btnGetImpedance.addEventListener('click', async () => {
             // Add the new data point (which includes all details) to the client-side history
             impedanceHistory.push(data);
 
-            // Update the impedance table and redraw the Smith chart with all points
+            // Update the impedance table and add the point to the Smith chart
             updateImpedanceTable();
-            drawSmithChart(smithChartCanvas, impedanceHistory); // Pass the entire history to draw
+            smithChart.appendPoints([data]);
 
         } else {
             // Handle error response from Flask (e.g., VNA not connected)
@@ -345,7 +297,8 @@ btnExportCustomImpedance.addEventListener('click', async () => {
         showMessage('Please enter a filename for export.', 'error');
         return;
     }
-    saveCSV(impedanceHistory, filename);
+    const params = new URLSearchParams({ format: exportFormatSelect.value, filename: filename });
+    downloadExport(`${location.protocol}//${location.host}/export_history?${params}`);
 });
 
 // Event listener for the Clear History button
@@ -358,7 +311,7 @@ btnClearHistory.addEventListener('click', async () => {
         if (response.ok) {
             impedanceHistory = []; // Clear client-side history
             updateImpedanceTable(); // Update table to show no data
-            drawSmithChart(smithChartCanvas,impedanceHistory); // Clear Smith Chart
+            smithChart.clear(); // Clear Smith Chart
             showMessage('Impedance history cleared successfully!');
         } else {
             const errorText = await response.text();
@@ -375,7 +328,7 @@ btnClearHistory.addEventListener('click', async () => {
 // Event listener for the Start Sweep button
 btnStartSweep.addEventListener('click', startSweep);
 
-// Starts a frequency sweep.
+// Starts a parameter sweep as a background job and streams its points as they are measured.
 async function startSweep() {
     // Get the selected motor index from the dropdown
     const sweepMotorSelect = document.querySelector('#sweep-motor-select');
@@ -387,6 +340,24 @@ async function startSweep() {
     const stepSize = parseFloat(document.querySelector('#sweep-step-size').value);
     const frequencyMhz = parseFloat(document.querySelector('#sweep-freq-input').value);
 
+    // The selected motor varies fastest; an optional second motor turns the sweep into a grid
+    const axes = [{
+        motor_index: selectedMotorIndex,
+        start_value: startValue,
+        stop_value: stopValue,
+        step_size: stepSize
+    }];
+    const secondMotorIndex = document.querySelector('#sweep-motor-select-2').value;
+    if (secondMotorIndex !== 'none') {
+        axes.push({
+            motor_index: secondMotorIndex,
+            start_value: parseFloat(document.querySelector('#sweep-start-value-2').value),
+            stop_value: parseFloat(document.querySelector('#sweep-stop-value-2').value),
+            step_size: parseFloat(document.querySelector('#sweep-step-size-2').value)
+        });
+    }
+    const order = document.querySelector('#sweep-order-select').value;
+
     realImpedanceSweepSpan.innerHTML = 'Measuring...';
     imagImpedanceSweepSpan.innerHTML = 'Measuring...';
 
@@ -398,24 +369,23 @@ async function startSweep() {
                 'Content-Type': 'application/json' // Indicate that the body is JSON
             },
             body: JSON.stringify({
-                motor_index: selectedMotorIndex,
-                start_value: startValue,
-                stop_value: stopValue,
-                step_size: stepSize,
-                frequency_mhz: frequencyMhz
+                axes: axes,
+                order: order,
+                frequency_mhz: frequencyMhz,
+                dataset_color: datasetColorSelectSweep.value
                 // Add other sweep parameters here as needed by your Flask endpoint
             })
         });
 
         if (response.ok) {
-            showMessage('Frequency sweep started successfully!');
-
-            sweepImpedanceHistory = await response.json();
-            console.log(sweepImpedanceHistory);
+            const job = await response.json();
+            sweepImpedanceHistory = [];
+            sweepPointCount = 0;
+            sweepRunIds = [job.run_id];
             updateSweepImpedanceTable();
-            drawSmithChart(smithChartCanvasSweep, sweepImpedanceHistory);
-            realImpedanceSweepSpan.innerHTML = sweepImpedanceHistory[sweepImpedanceHistory.length -1].real_impedance.toFixed(3);
-            imagImpedanceSweepSpan.innerHTML = sweepImpedanceHistory[sweepImpedanceHistory.length -1].imag_impedance.toFixed(3);
+            smithChartSweep.clear();
+            updateSweepProgress(job);
+            followSweepJob(job.job_id);
         } else {
             const errorText = await response.text();
             showMessage(`Error starting sweep: ${errorText}`, 'error');
@@ -426,13 +396,92 @@ async function startSweep() {
     }
 }
 
+/**
+ * Subscribes to the Server-Sent Events stream of a sweep job and adds every point
+ * to the table and Smith chart as soon as it is measured.
+ * @param {string} jobId - The sweep job to follow.
+ */
+function followSweepJob(jobId) {
+    if (sweepEventSource) {
+        sweepEventSource.close(); // Stop following any previous sweep
+    }
+    currentSweepJobId = jobId;
+    const source = new EventSource(`${location.protocol}//${location.host}/sweep_stream/${jobId}`);
+    sweepEventSource = source;
+
+    source.addEventListener('point', (event) => {
+        const point = JSON.parse(event.data);
+        sweepImpedanceHistory.push(point);
+        if (sweepImpedanceHistory.length > MAX_SWEEP_TABLE_ROWS) {
+            sweepImpedanceHistory.shift();
+        }
+        sweepPointCount++;
+        appendSweepImpedanceRow(point, sweepPointCount - 1);
+        smithChartSweep.appendPoints([point]);
+        realImpedanceSweepSpan.innerHTML = point.real_impedance.toFixed(3);
+        imagImpedanceSweepSpan.innerHTML = point.imag_impedance.toFixed(3);
+    });
+
+    source.addEventListener('status', (event) => {
+        updateSweepProgress(JSON.parse(event.data));
+    });
+
+    source.addEventListener('end', (event) => {
+        const job = JSON.parse(event.data);
+        source.close(); // Otherwise the browser reconnects to the finished stream
+        sweepEventSource = null;
+        currentSweepJobId = null;
+        updateSweepProgress(job);
+        if (job.status === 'failed') {
+            showMessage(`Sweep failed: ${job.error}`, 'error');
+        } else {
+            showMessage(`Sweep ${job.status}: ${job.points_measured} points measured.`);
+        }
+    });
+
+    source.onerror = () => {
+        // EventSource reconnects by itself and resumes after the last point (Last-Event-ID)
+        console.warn(`Sweep stream for job ${jobId} interrupted, reconnecting...`);
+    };
+}
+
+/**
+ * Shows the status and progress of a sweep job.
+ * @param {Object} job - Job summary returned by the server.
+ */
+function updateSweepProgress(job) {
+    sweepStatusSpan.innerHTML = `${job.status} (${job.points_measured}/${job.total_points})`;
+}
+
+// Event listener for the Stop Scan button: cancels the running sweep job
+btnStopSweep.addEventListener('click', async () => {
+    if (!currentSweepJobId) {
+        showMessage('No sweep is running.', 'error');
+        return;
+    }
+    try {
+        let response = await fetch(`${location.protocol}//${location.host}/cancel_sweep/${currentSweepJobId}`, {
+            method: 'POST'
+        });
+        if (!response.ok) {
+            const errorText = await response.text();
+            showMessage(`Error stopping sweep: ${errorText}`, 'error');
+        }
+    } catch (error) {
+        console.error('Error stopping sweep:', error);
+        showMessage('Failed to stop sweep. Please try again.', 'error');
+    }
+});
+
 /**
  * Clears the sweep impedance history and updates the display.
  */
 async function btnClearSweepHistory() {
     sweepImpedanceHistory = []; // Clear client-side history
+    sweepPointCount = 0;
+    sweepRunIds = [];
     updateSweepImpedanceTable(); // Update table to show no data
-    drawSmithChart(smithChartCanvasSweep, sweepImpedanceHistory); // Clear Smith Chart
+    smithChartSweep.clear(); // Clear Smith Chart
     showMessage('Sweep impedance history cleared successfully!');
 }
 
@@ -447,28 +496,93 @@ function updateSweepImpedanceTable() {
         return;
     }
 
-    sweepImpedanceHistory.forEach((data, index) => {
-        const row = sweepImpedanceResultsTableBody.insertRow();
-        row.insertCell().textContent = index + 1;
-        row.insertCell().textContent = data.motor_positions; // Motor positions
-        row.insertCell().textContent = data.frequency_mhz.toFixed(1); // Frequency
-        row.insertCell().textContent = data.real_impedance.toFixed(2);
-        row.insertCell().textContent = data.imag_impedance.toFixed(2);
+    const firstIndex = sweepPointCount - sweepImpedanceHistory.length;
+    sweepImpedanceHistory.forEach((data, index) => appendSweepImpedanceRow(data, firstIndex + index));
+}
 
-        // Create a colored dot for the color column
-        const colorCell = row.insertCell();
-        const colorDot = document.createElement('span');
-        colorDot.classList.add('color-dot');
-        colorDot.style.backgroundColor = data.color;
-        colorCell.appendChild(colorDot);
+/**
+ * Shows a stored sweep run in the sweep tab: the Smith chart gets a decimated set of
+ * pre-computed Γ columns from the server that preserves the shape of the trajectory,
+ * and the table the newest MAX_SWEEP_TABLE_ROWS points.
+ * @param {Object} run - A run from /runs ({run_id, points}).
+ */
+async function loadSweepRun(run) {
+    sweepRunIds = [run.run_id];
+    sweepPointCount = run.points;
+    const chartParams = new URLSearchParams({
+        run_ids: run.run_id,
+        decimate: 'lttb',
+        max_points: MAX_SMITH_CHART_POINTS,
+        columns: 'gamma'
     });
+    const response = await fetch(`${location.protocol}//${location.host}/query_points?${chartParams}`);
+    smithChartSweep.clear();
+    smithChartSweep.appendGammaColumns(await response.json());
+
+    // Keyset cursor: the newest rows are the ones after sequence number points - rows - 1
+    const firstSeq = Math.max(0, run.points - MAX_SWEEP_TABLE_ROWS);
+    const tableFilters = { run_ids: run.run_id, limit: MAX_SWEEP_TABLE_ROWS };
+    if (firstSeq > 0) {
+        tableFilters.cursor = `${run.run_id}:${firstSeq - 1}`;
+    }
+    sweepImpedanceHistory = await fetchAllPoints(tableFilters);
+    updateSweepImpedanceTable();
+}
+
+/**
+ * Fetches every stored point matching a query, following the pagination cursor.
+ * @param {Object} filters - Query parameters for /query_points (e.g. run_ids).
+ * @returns {Promise<Array>} The points, in measurement order.
+ */
+async function fetchAllPoints(filters) {
+    let points = [];
+    let cursor = filters.cursor || null;
+    do {
+        const params = new URLSearchParams(filters);
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        const response = await fetch(`${location.protocol}//${location.host}/query_points?${params}`);
+        const page = await response.json();
+        points = points.concat(page.points);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return points;
+}
+
+/**
+ * Appends one point to the sweep impedance results table.
+ * @param {Object} data - The sweep point.
+ * @param {number} index - Number of the point within the sweep (0-based).
+ */
+function appendSweepImpedanceRow(data, index) {
+    if (index === 0) {
+        sweepImpedanceResultsTableBody.innerHTML = ''; // Remove the "No data" placeholder
+    }
+    const row = sweepImpedanceResultsTableBody.insertRow();
+    row.insertCell().textContent = index + 1;
+    row.insertCell().textContent = data.motor_positions; // Motor positions
+    row.insertCell().textContent = data.frequency_mhz.toFixed(1); // Frequency
+    row.insertCell().textContent = data.real_impedance.toFixed(2);
+    row.insertCell().textContent = data.imag_impedance.toFixed(2);
+
+    // Create a colored dot for the color column
+    const colorCell = row.insertCell();
+    const colorDot = document.createElement('span');
+    colorDot.classList.add('color-dot');
+    colorDot.style.backgroundColor = data.color;
+    colorCell.appendChild(colorDot);
+
+    if (sweepImpedanceResultsTableBody.rows.length > MAX_SWEEP_TABLE_ROWS) {
+        sweepImpedanceResultsTableBody.deleteRow(0); // Keep the table to the newest rows
+    }
 
     // Scroll to the bottom of the table to show the latest entry
     sweepImpedanceResultsTableBody.parentElement.scrollTop = sweepImpedanceResultsTableBody.parentElement.scrollHeight;
 }
 
 /**
- * Handles the export of sweep impedance data to CSV.
+ * Handles the export of sweep impedance data, in the selected format, from the server.
  */
 async function handleSweepExport() {
     const filename = exportFilenameInputSweep.value;
@@ -476,30 +590,29 @@ async function handleSweepExport() {
         showMessage('Please enter a filename for sweep export.', 'error');
         return;
     }
-    saveCSV(sweepImpedanceHistory, filename);
-}
-
-function saveCSV(data, filename) {
-  const csvRows = [];
-  const headers = Object.keys(data[0]);
-  csvRows.push(headers.join(','));
-
-  for (const row of data) {
-    const values = headers.map(header => {
-      const escaped = ('' + row[header]).replace(/"/g, '\\"');
-      return `"${escaped}"`;
+    if (sweepRunIds.length === 0) {
+        showMessage('No sweep data to export.', 'error');
+        return;
+    }
+    const params = new URLSearchParams({
+        run_ids: sweepRunIds.join(','),
+        format: exportFormatSelectSweep.value,
+        filename: filename
     });
-    csvRows.push(values.join(','));
-  }
-
-  const csvContent = csvRows.join('\n');
-  const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
+    downloadExport(`${location.protocol}//${location.host}/export_runs?${params}`);
+}
 
-  const link = document.createElement('a');
-  link.href = URL.createObjectURL(blob);
-  link.setAttribute('download', filename);
-  link.click();
-};
+/**
+ * Downloads an export streamed by the server. The browser saves the response as it
+ * arrives, so large histories are never assembled in the page.
+ * @param {string} url - Export URL including format and filename.
+ */
+function downloadExport(url) {
+    const link = document.createElement('a');
+    link.href = url;
+    link.setAttribute('download', '');
+    link.click();
+}
 
 // Event listener for the custom sweep export button
 btnExportCustomImpedanceSweep.addEventListener('click', handleSweepExport);
@@ -527,8 +640,43 @@ async function initPage() {
         showMessage("Failed to load initial motor positions.", 'error');
     }
 
+    // Restore the single measurement history kept by the server across restarts
+    try {
+        let response = await fetch(`${location.protocol}//${location.host}/runs?kind=single&limit=1`);
+        let runs = await response.json();
+        impedanceHistory = await fetchAllPoints({ run_ids: runs.single_run_id });
+    } catch (error) {
+        console.error("Error fetching impedance history:", error);
+    }
+
+    // Offer only the export formats the server supports (Parquet and Arrow need pyarrow)
+    try {
+        let response = await fetch(`${location.protocol}//${location.host}/export_formats`);
+        let formats = await response.json();
+        for (const select of [exportFormatSelect, exportFormatSelectSweep]) {
+            for (const option of Array.from(select.options)) {
+                if (!formats.includes(option.value)) {
+                    option.remove();
+                }
+            }
+        }
+    } catch (error) {
+        console.error("Error fetching the export formats:", error);
+    }
+
+    // Restore the latest sweep, decimated for the Smith chart
+    try {
+        let response = await fetch(`${location.protocol}//${location.host}/runs?kind=sweep&limit=1`);
+        let runs = await response.json();
+        if (runs.runs.length > 0 && runs.runs[0].points > 0 && !currentSweepJobId) {
+            await loadSweepRun(runs.runs[0]);
+        }
+    } catch (error) {
+        console.error("Error fetching the latest sweep:", error);
+    }
+
     // Initial draw of Smith Chart (will be empty if no history)
-    drawSmithChart(smithChartCanvas,impedanceHistory);
+    smithChart.setPoints(impedanceHistory);
     // Initial update of impedance table (will show "No data" if empty)
     updateImpedanceTable();
 }
@@ -0,0 +1,191 @@
+// Layered Smith chart renderer ------------------------------------------------------------------
+// The chart is composed from two offscreen layers and a label:
+//   grid layer   - outer circle and real axis, drawn once
+//   points layer - every plotted point; new points are drawn on top, never re-plotted
+//   label        - impedance of the latest point, drawn on the visible canvas
+// Updating the visible canvas therefore costs two drawImage calls whatever the number of
+// points. Points queued during a frame are drawn together on the next animation frame,
+// batched into a single path per colour.
+
+const Z0 = 50; // Characteristic impedance (typically 50 Ohms)
+const POINT_RADIUS = 4; // Point size in pixels
+const SMALL_POINT_RADIUS = 2; // Point size once the chart holds many points
+const SMALL_POINT_THRESHOLD = 5000; // Points plotted before switching to SMALL_POINT_RADIUS
+
+/**
+ * Reflection coefficient of a point: pre-computed by the server (impedance_conversion.py)
+ * or, for points without Γ, Γ = (z - 1) / (z + 1) with z = R/Z0 + jX/Z0.
+ * @param {Object} impedance - {real_impedance, imag_impedance, gamma_real?, gamma_imag?}
+ * @returns {Array} [gamma_real, gamma_imag]
+ */
+export function pointGamma(impedance) {
+    if (impedance.gamma_real !== undefined && impedance.gamma_imag !== undefined) {
+        return [impedance.gamma_real, impedance.gamma_imag];
+    }
+    const r_norm = impedance.real_impedance / Z0;
+    const x_norm = impedance.imag_impedance / Z0;
+    const denominator = (r_norm + 1) * (r_norm + 1) + x_norm * x_norm;
+    return [((r_norm - 1) * (r_norm + 1) + x_norm * x_norm) / denominator, (2 * x_norm) / denominator];
+}
+
+function createLayer(canvas) {
+    const layer = document.createElement('canvas');
+    layer.width = canvas.width;
+    layer.height = canvas.height;
+    return layer;
+}
+
+export class SmithChart {
+    /**
+     * @param {HTMLCanvasElement} canvas - The visible canvas to draw on.
+     */
+    constructor(canvas) {
+        this.canvas = canvas;
+        this.ctx = canvas.getContext('2d');
+        this.centerX = canvas.width / 2;
+        this.centerY = canvas.height / 2;
+        this.radius = Math.min(this.centerX, this.centerY) * 0.93; // Chart radius, 93% of smaller dimension
+        this.gridLayer = createLayer(canvas);
+        this.pointsLayer = createLayer(canvas);
+        this.pointCount = 0;
+        this.latest = null; // Latest point, labelled with its impedance
+        this.queue = []; // Points waiting for the next animation frame
+        this.frameRequested = false;
+        this.drawGrid();
+        this.compose();
+    }
+
+    drawGrid() {
+        const ctx = this.gridLayer.getContext('2d');
+        // Outer circle (|Gamma| = 1)
+        ctx.beginPath();
+        ctx.arc(this.centerX, this.centerY, this.radius, 0, 2 * Math.PI);
+        // Real axis
+        ctx.moveTo(this.centerX - this.radius, this.centerY);
+        ctx.lineTo(this.centerX + this.radius, this.centerY);
+        ctx.strokeStyle = '#95a5a6'; // Light grey color
+        ctx.lineWidth = 1; // Thin line
+        ctx.stroke();
+    }
+
+    /**
+     * Replaces all plotted points.
+     * @param {Array} impedancePoints - Impedance objects {real_impedance, imag_impedance, color, gamma_real?, gamma_imag?}.
+     */
+    setPoints(impedancePoints) {
+        this.clear();
+        this.appendPoints(impedancePoints);
+    }
+
+    /**
+     * Queues points to be drawn on top of the existing ones on the next animation frame.
+     * @param {Array} impedancePoints - The new impedance objects.
+     */
+    appendPoints(impedancePoints) {
+        if (impedancePoints.length === 0) {
+            this.compose();
+            return;
+        }
+        this.queue.push(...impedancePoints);
+        this.latest = impedancePoints[impedancePoints.length - 1];
+        this.requestFrame();
+    }
+
+    /**
+     * Queues points given as columns of pre-computed Γ (e.g. a decimated server query).
+     * @param {Object} columns - {gamma_real: [], gamma_imag: [], real_impedance: [], imag_impedance: [], color: []}
+     */
+    appendGammaColumns(columns) {
+        const points = columns.gamma_real.map((gammaReal, i) => ({
+            gamma_real: gammaReal,
+            gamma_imag: columns.gamma_imag[i],
+            real_impedance: columns.real_impedance[i],
+            imag_impedance: columns.imag_impedance[i],
+            color: columns.color[i]
+        }));
+        this.appendPoints(points);
+    }
+
+    /**
+     * Removes all points (the grid stays).
+     */
+    clear() {
+        this.pointsLayer.getContext('2d').clearRect(0, 0, this.pointsLayer.width, this.pointsLayer.height);
+        this.pointCount = 0;
+        this.latest = null;
+        this.queue = [];
+        this.compose();
+    }
+
+    requestFrame() {
+        if (!this.frameRequested) {
+            this.frameRequested = true;
+            requestAnimationFrame(() => {
+                this.frameRequested = false;
+                this.flush();
+            });
+        }
+    }
+
+    /**
+     * Draws the queued points onto the points layer, one path per colour, then
+     * refreshes the visible canvas.
+     */
+    flush() {
+        const points = this.queue;
+        this.queue = [];
+        this.pointCount += points.length;
+        const pointRadius = this.pointCount > SMALL_POINT_THRESHOLD ? SMALL_POINT_RADIUS : POINT_RADIUS;
+
+        const byColor = new Map();
+        points.forEach((impedance) => {
+            if (!byColor.has(impedance.color)) {
+                byColor.set(impedance.color, []);
+            }
+            byColor.get(impedance.color).push(impedance);
+        });
+
+        const ctx = this.pointsLayer.getContext('2d');
+        ctx.strokeStyle = '#333'; // A darker stroke for contrast
+        ctx.lineWidth = 1;
+        byColor.forEach((colorPoints, color) => {
+            ctx.beginPath();
+            colorPoints.forEach((impedance) => {
+                const [plotX, plotY] = this.toCanvas(impedance);
+                ctx.moveTo(plotX + pointRadius, plotY); // Start each circle as its own subpath
+                ctx.arc(plotX, plotY, pointRadius, 0, 2 * Math.PI);
+            });
+            ctx.fillStyle = color; // Use the stored color for each point
+            ctx.fill();
+            ctx.stroke();
+        });
+        this.compose();
+    }
+
+    /**
+     * Maps a point's Γ to canvas pixel coordinates: Γ = 0 is the centre and |Γ| = 1
+     * the chart radius (the canvas y axis is inverted).
+     * @returns {Array} The [x, y] canvas coordinates of the point.
+     */
+    toCanvas(impedance) {
+        const [gammaReal, gammaImag] = pointGamma(impedance);
+        return [this.centerX + gammaReal * this.radius, this.centerY - gammaImag * this.radius];
+    }
+
+    /**
+     * Composes the visible canvas from the layers and the latest point's label.
+     */
+    compose() {
+        const ctx = this.ctx;
+        ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+        ctx.drawImage(this.gridLayer, 0, 0);
+        ctx.drawImage(this.pointsLayer, 0, 0);
+        if (this.latest) {
+            const [plotX, plotY] = this.toCanvas(this.latest);
+            ctx.fillStyle = '#2c3e50';
+            ctx.font = '12px Arial';
+            ctx.fillText(`Z: ${this.latest.real_impedance.toFixed(2)} + j${this.latest.imag_impedance.toFixed(2)}`,
+                         plotX + 10, plotY - 10);
+        }
+    }
+}
@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from measurement_store import MeasurementStore, RUN_SWEEP
+from metrics import Counter, Histogram
+
+MAX_FINISHED_JOBS = 20 # Finished jobs kept for status/point queries before being forgotten
+RECENT_POINTS = 1000 # Newest points of each job kept in memory; older ones are read from the store
+
+# Metrics, served at /metrics by app.py
+POINTS = Counter("sweep_points_total", "Points published by sweep and auto-tune jobs", ["kind"])
+POINT_SECONDS = Histogram("sweep_point_seconds", "Time from one point of a job to the next (move, measure, store)",
+                          ["kind"], buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+JOBS = Counter("sweep_jobs_total", "Jobs ended, by final status", ["status"])
+
+logger = logging.getLogger("sweep_jobs")
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+    DONE = (FINISHED, CANCELLED, FAILED)
+
+class SweepCancelled(Exception):
+    """
+    Raised inside a job's run function when the job has been cancelled.
+    """
+
+class SweepJob:
+    """
+    One sweep running (or waiting to run) on the job worker thread. The run function
+    appends points as they are measured, so they can be read while the job runs.
+    Points are stored as a run in the measurement store; only the newest RECENT_POINTS
+    are also kept in memory for live readers, so a job of any length uses bounded memory.
+    """
+    def __init__(self, config:dict, total_points:int, store:MeasurementStore, kind:str = RUN_SWEEP)->None:
+        """
+        Args:
+            config (dict): The sweep configuration as submitted.
+            total_points (int): Number of points the sweep is expected to measure.
+            store (MeasurementStore): Where the job's points are persisted.
+            kind (str): Run kind recorded in the store.
+        """
+        self.job_id = uuid.uuid4().hex[:12]
+        self.config = config
+        self.total_points = total_points
+        self.status = JobStatus.QUEUED
+        self.error = None
+        self.result = None # optional final outcome set by the run function (e.g. auto-tune best point)
+        self.store = store
+        self.kind = kind
+        self.run_id = store.create_run(kind, config, self.job_id)
+        self.point_count = 0
+        self.recent_points = deque(maxlen=RECENT_POINTS)
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.last_point_at = None # monotonic time of the latest point (or of the start)
+        self.cancel_event = threading.Event()
+        self.condition = threading.Condition() # notified on every new point and status change
+
+    def add_point(self, point:dict)->None:
+        """
+        Publish a measured point.
+        """
+        with self.condition:
+            self.store.add_point(self.run_id, point)
+            self.recent_points.append(point)
+            self.point_count += 1
+            self.condition.notify_all()
+        now = time.monotonic()
+        if self.last_point_at is not None:
+            POINT_SECONDS.labels(self.kind).observe(now - self.last_point_at)
+        self.last_point_at = now
+        POINTS.labels(self.kind).inc()
+
+    def set_status(self, status:str, error:str = None)->None:
+        with self.condition:
+            self.status = status
+            self.error = error
+            if status == JobStatus.RUNNING:
+                self.started_at = time.time()
+                self.last_point_at = time.monotonic()
+            elif status in JobStatus.DONE:
+                self.finished_at = time.time()
+                JOBS.labels(status).inc()
+            self.condition.notify_all()
+
+    def check_cancelled(self)->None:
+        """
+        Called by the run function between moves and measurements.
+        """
+        if self.cancel_event.is_set():
+            raise SweepCancelled()
+
+    def wait_for_update(self, index:int, status:str, timeout:float, limit:int = None)->tuple:
+        """
+        Block until there are points after the first `index`, the status differs from
+        `status`, or the timeout expires. At most `limit` points are returned.
+
+        Returns:
+            tuple: (new points, current status)
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.point_count > index or self.status != status, timeout)
+            return self.points_since(index, limit), self.status
+
+    def points_since(self, index:int, limit:int = None)->list:
+        """
+        Points measured after the first `index` points (at most `limit` of them), from
+        memory when they are recent enough, otherwise from the store.
+        """
+        with self.condition:
+            first_recent = self.point_count - len(self.recent_points)
+            if index >= first_recent:
+                points = list(self.recent_points)[index - first_recent:]
+                return points if limit is None else points[:limit]
+        return self.store.get_points(self.run_id, index, limit)
+
+    def points_per_minute(self)->float:
+        """
+        Measuring rate since the job started (until it finished).
+        """
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.point_count / elapsed * 60 if elapsed > 0 else 0.0
+
+    def summary(self)->dict:
+        """
+        JSON-ready job state and progress.
+        """
+        with self.condition:
+            measured = self.point_count
+            return {
+                'job_id': self.job_id,
+                'run_id': self.run_id,
+                'status': self.status,
+                'error': self.error,
+                'points_measured': measured,
+                'total_points': self.total_points,
+                'progress': measured / self.total_points if self.total_points else 0.0,
+                'points_per_minute': self.points_per_minute(),
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'config': self.config,
+                'result': self.result,
+            }
+
+class SweepJobManager:
+    """
+    Runs sweep jobs one at a time on a single worker thread (there is only one set of
+    motors and one VNA), keeping recent jobs available for status and point queries.
+    """
+    def __init__(self, store:MeasurementStore, max_finished_jobs:int = MAX_FINISHED_JOBS)->None:
+        self.store = store
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sweep")
+
+    def submit(self, run, config:dict, total_points:int, kind:str = RUN_SWEEP)->SweepJob:
+        """
+        Queue a job.
+
+        Args:
+            run (Callable[[SweepJob], None]): Performs the sweep, calling job.add_point() for
+                                              every point and job.check_cancelled() regularly.
+            config (dict): The sweep configuration, reported back in the job summary.
+            total_points (int): Number of points the sweep is expected to measure.
+            kind (str): Run kind recorded in the measurement store.
+
+        Returns:
+            SweepJob: The queued job.
+        """
+        job = SweepJob(config, total_points, self.store, kind)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self._forget_old_jobs()
+        self.executor.submit(self._execute, job, run)
+        return job
+
+    def _execute(self, job:SweepJob, run)->None:
+        if job.cancel_event.is_set():
+            job.set_status(JobStatus.CANCELLED)
+            return
+        job.set_status(JobStatus.RUNNING)
+        try:
+            run(job)
+            job.set_status(JobStatus.FINISHED)
+        except SweepCancelled:
+            logger.info("Sweep job cancelled", extra={'job_id': job.job_id, 'points': job.point_count})
+            job.set_status(JobStatus.CANCELLED)
+        except Exception as e:
+            logger.exception("Sweep job failed", extra={'job_id': job.job_id, 'points': job.point_count})
+            job.set_status(JobStatus.FAILED, f"{e}")
+        finally:
+            self.store.flush() # Persist the last partial batch
+
+    def _forget_old_jobs(self)->None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in JobStatus.DONE]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    def forget_finished(self)->None:
+        """
+        Drop all finished jobs (their points stay in the measurement store).
+        """
+        with self.lock:
+            for job_id in [job_id for job_id, job in self.jobs.items() if job.status in JobStatus.DONE]:
+                del self.jobs[job_id]
+
+    def running(self):
+        """
+        Returns the job currently running, or None.
+        """
+        with self.lock:
+            return next((job for job in self.jobs.values() if job.status == JobStatus.RUNNING), None)
+
+    def get(self, job_id:str):
+        """
+        Returns the job, or None if it is unknown (or has been forgotten).
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id:str, stop_motors)->bool:
+        """
+        Cancel a queued or running job.
+
+        Args:
+            job_id (str): The job to cancel.
+            stop_motors (Callable[[], None]): Stops any motion in progress so the job
+                                              reaches its next cancellation check quickly.
+
+        Returns:
+            bool: False if the job is unknown.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        if job.status == JobStatus.RUNNING:
+            stop_motors()
+        return True
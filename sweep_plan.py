@@ -0,0 +1,112 @@
+import itertools
+
+# Visiting orders for grid sweeps
+ORDER_SERPENTINE = "serpentine" # boustrophedon: every step moves one axis by one increment
+ORDER_RASTER = "raster" # every row starts from the same end (long return moves)
+ORDERS = (ORDER_SERPENTINE, ORDER_RASTER)
+
+def axis_values(start_value:int, stop_value:int, step_size:int)->list:
+    """
+    Positions of one axis from start to stop inclusive.
+
+    Raises:
+        ValueError: If the step is zero or points away from stop.
+    """
+    is_increasing = stop_value >= start_value
+    if is_increasing and step_size <= 0:
+        raise ValueError("Step size must be positive for increasing sweep.")
+    if not is_increasing and step_size >= 0:
+        raise ValueError("Step size must be negative for decreasing sweep.")
+    return list(range(start_value, stop_value + (1 if is_increasing else -1), step_size))
+
+def parse_axes(axes:list, num_motors:int)->list:
+    """
+    Validates and normalises the axes of a grid sweep.
+
+    Args:
+        axes (list): Dicts with 'motor_index' (0-based), 'start_value', 'stop_value' and
+                     'step_size'. The first axis varies fastest.
+        num_motors (int): Number of motors available.
+
+    Returns:
+        list: The axes with integer fields.
+
+    Raises:
+        ValueError: If an axis is malformed, out of range or repeated.
+    """
+    if not axes:
+        raise ValueError("A sweep needs at least one axis.")
+    parsed = []
+    for axis in axes:
+        try:
+            parsed.append({key: int(axis[key]) for key in ('motor_index', 'start_value', 'stop_value', 'step_size')})
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Malformed sweep axis: {axis}")
+    motor_indices = [axis['motor_index'] for axis in parsed]
+    if any(not 0 <= index < num_motors for index in motor_indices):
+        raise ValueError(f"Motor index out of range in {motor_indices}.")
+    if len(set(motor_indices)) != len(motor_indices):
+        raise ValueError(f"Each motor can only be swept once: {motor_indices}.")
+    for axis in parsed:
+        axis_values(axis['start_value'], axis['stop_value'], axis['step_size'])
+    return parsed
+
+def grid_points(axes:list, order:str = ORDER_SERPENTINE):
+    """
+    Yields the grid points of a sweep in visiting order.
+
+    With ORDER_SERPENTINE the fastest axis reverses direction every time a slower axis
+    advances (recursively for more than two axes), so consecutive points differ in
+    exactly one axis by exactly one step.
+
+    Args:
+        axes (list): Axes as returned by parse_axes; the first axis varies fastest.
+        order (str): One of ORDERS.
+
+    Yields:
+        tuple: One target position per axis, in the order of `axes`.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Unknown sweep order: {order}")
+    # Work slowest-axis-first internally, and flip each point back to the order of `axes`
+    value_lists = [axis_values(axis['start_value'], axis['stop_value'], axis['step_size'])
+                   for axis in reversed(axes)]
+    if order == ORDER_RASTER:
+        points = itertools.product(*value_lists)
+    else:
+        points = _serpentine(value_lists)
+    for point in points:
+        yield point[::-1]
+
+def _serpentine(value_lists:list):
+    """
+    Boustrophedon traversal, slowest axis first.
+    """
+    if len(value_lists) == 1:
+        for value in value_lists[0]:
+            yield (value,)
+        return
+    inner = list(_serpentine(value_lists[1:]))
+    for k, value in enumerate(value_lists[0]):
+        for point in (inner if k % 2 == 0 else reversed(inner)):
+            yield (value,) + point
+
+def count_points(axes:list)->int:
+    """
+    Number of points in the grid.
+    """
+    total = 1
+    for axis in axes:
+        total *= len(axis_values(axis['start_value'], axis['stop_value'], axis['step_size']))
+    return total
+
+def total_travel(points)->int:
+    """
+    Sum over all axes of the distance moved between consecutive points, for comparing orders.
+    """
+    travel, previous = 0, None
+    for point in points:
+        if previous is not None:
+            travel += sum(abs(a - b) for a, b in zip(point, previous))
+        previous = point
+    return travel
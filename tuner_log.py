@@ -0,0 +1,172 @@
+"""
+Logging for the tuner processes (app.py, Encoder.py, Impedance_Tuning.py).
+
+A log call only copies the record onto a queue; a listener thread formats it and writes
+it to a rotating file (and the console), so a slow terminal or SD card never stalls a
+move or a measurement. Records carry structured fields given as `extra`:
+    logger.info("Measured point", extra={'run_id': 3, 'motor': 1, 'position': 412})
+which are written as key=value pairs after the message, or as JSON lines with
+TUNER_LOG_FORMAT=json.
+
+Per-point and per-request messages are logged at DEBUG behind a logger.isEnabledFor()
+check, so at the normal INFO level they cost one cached comparison and nothing is
+formatted or queued.
+
+Environment: TUNER_LOG_LEVEL (default INFO), TUNER_LOG_FORMAT (text or json),
+TUNER_LOG_DIR (default logs), TUNER_CONSOLE_LEVEL (default INFO).
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_LEVEL = os.environ.get("TUNER_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("TUNER_LOG_FORMAT", "text")
+LOG_DIR = os.environ.get("TUNER_LOG_DIR", "logs")
+CONSOLE_LEVEL = os.environ.get("TUNER_CONSOLE_LEVEL", "INFO").upper()
+MAX_LOG_BYTES = 5 * 1024 * 1024 # Size at which a log file is rotated
+LOG_BACKUPS = 5 # Rotated files kept per process
+QUIET_LOGGERS = ("pyvisa", "pyvisa_py", "asyncio") # Libraries logged at WARNING and above only
+
+# Attributes every LogRecord has; anything else on a record is a structured field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+def fields(record:logging.LogRecord)->dict:
+    """
+    The structured fields of a record (the keys passed as extra).
+    """
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+class StructuredFormatter(logging.Formatter):
+    """
+    "time LEVEL logger: message key=value ..." lines, or one JSON object per line.
+    """
+    def __init__(self, json_lines:bool = False)->None:
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record:logging.LogRecord)->str:
+        message = record.getMessage()
+        if self.json_lines:
+            entry = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                     'message': message, **fields(record)}
+            if record.exc_text:
+                entry['exception'] = record.exc_text
+            return json.dumps(entry, default=str)
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name}: {message}"
+        pairs = " ".join(f"{key}={value}" for key, value in fields(record).items())
+        if pairs:
+            line += " " + pairs
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues a copy of the record with its message merged and its traceback rendered,
+    keeping the structured fields separate from the message.
+    """
+    def prepare(self, record:logging.LogRecord)->logging.LogRecord:
+        prepared = copy.copy(record)
+        prepared.msg = record.getMessage()
+        prepared.args = None
+        if record.exc_info:
+            prepared.exc_text = logging.Formatter().formatException(record.exc_info)
+        prepared.exc_info = None
+        prepared.stack_info = None
+        return prepared
+
+def setup_logging(process:str, level:str = LOG_LEVEL, log_dir:str = LOG_DIR, console:bool = True):
+    """
+    Routes all logging of this process through a queue to a rotating file
+    (log_dir/<process>.log) and, optionally, the console. Calling it again has no effect.
+
+    Args:
+        process (str): Name of the log file, e.g. "app" or "encoder".
+        level (str): Lowest level logged.
+        log_dir (str): Directory of the log files, created if needed.
+        console (bool): Also write records at TUNER_CONSOLE_LEVEL and above to stderr.
+
+    Returns:
+        logging.handlers.QueueListener: The listener thread, stopped (and flushed) at exit
+                                        or by shutdown_logging().
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(os.path.join(log_dir, f"{process}.log"),
+                                                        maxBytes=MAX_LOG_BYTES, backupCount=LOG_BACKUPS,
+                                                        encoding="utf-8")
+    file_handler.setFormatter(StructuredFormatter(json_lines=LOG_FORMAT == "json"))
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(CONSOLE_LEVEL)
+        console_handler.setFormatter(StructuredFormatter())
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers = [_QueueHandler(log_queue)]
+    for name in QUIET_LOGGERS: # their debug output (every VISA read and write) would swamp the log
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+def shutdown_logging()->None:
+    """
+    Writes out the queued records and closes the log files.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().handlers = []
+    _listener = None
+
+def test()->None:
+    """
+    Logs through the queue into a temporary directory and measures the cost of a log
+    call, and of a disabled debug call, to the calling thread.
+    """
+    import tempfile
+    import time
+    with tempfile.TemporaryDirectory() as directory:
+        setup_logging("test", "INFO", directory, console=False)
+        logger = logging.getLogger("test")
+        logger.info("Measured point", extra={'run_id': 3, 'motor': 1, 'position': 412, 'frequency_mhz': 18.5})
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("Failed", extra={'motor': 2})
+        count = 20000
+        start = time.perf_counter()
+        for i in range(count):
+            logger.info("Point", extra={'run_id': 3, 'position': i})
+        info_us = (time.perf_counter() - start) / count * 1e6
+        start = time.perf_counter()
+        for i in range(count):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Point", extra={'run_id': 3, 'position': i})
+        debug_us = (time.perf_counter() - start) / count * 1e6
+        shutdown_logging()
+        with open(os.path.join(directory, "test.log")) as file:
+            lines = file.read().splitlines()
+        print("\n".join(lines[:6]))
+        assert "Measured point run_id=3 motor=1 position=412 frequency_mhz=18.5" in lines[0]
+        print(f"{len(lines)} lines; info {info_us:.1f} us per call, disabled debug {debug_us:.2f} us per call")
+
+# Example usage
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,234 @@
+import glob
+import logging
+import threading
+import numpy as np
+
+import impedance_conversion as ic
+from auto_tune import mismatch
+from encoder_journal import LEGACY_POSITION_SCALE # the recordings in data/ predate 4x decoding too
+
+NUM_AXES = 4
+DEFAULT_CANDIDATES = 5 # Nearest recorded points returned with every prediction
+REFINE_RADIUS = 3 # Local model uses samples within this many grid steps of the best candidate
+
+logger = logging.getLogger("tuning_map")
+
+class TuningMap:
+    """
+    Inverse map from impedance to motor positions, built from recorded sweeps.
+    Samples are grouped by frequency; a query picks the recorded frequency nearest to
+    the requested one, finds the samples whose impedance is closest to the target
+    (by the same |Γ| mismatch the auto-tuner minimises) and refines the best one with
+    a local linear model of Γ over the positions around it.
+    """
+    def __init__(self, z0:float = ic.Z0)->None:
+        self.z0 = z0
+        self.positions = np.empty((0, NUM_AXES))
+        self.frequency_hz = np.empty(0)
+        self.impedance = np.empty(0, dtype=complex)
+        self.lock = threading.Lock()
+        self._groups = None # frequency -> (positions, impedance), rebuilt after every add
+
+    def add(self, motor_positions, frequency_hz, impedance)->int:
+        """
+        Add measured samples. Rows with a missing position, frequency or impedance are skipped.
+
+        Args:
+            motor_positions (array-like): (N, 4) motor positions, in current encoder counts.
+            frequency_hz (array-like): (N,) measurement frequencies.
+            impedance (array-like): (N,) complex impedances.
+
+        Returns:
+            int: Number of samples added.
+        """
+        motor_positions = np.asarray(motor_positions, dtype=float).reshape(-1, NUM_AXES)
+        frequency_hz = np.asarray(frequency_hz, dtype=float).reshape(-1)
+        impedance = np.asarray(impedance, dtype=complex).reshape(-1)
+        valid = (np.all(np.isfinite(motor_positions), axis=1) & np.isfinite(frequency_hz)
+                 & np.isfinite(impedance))
+        with self.lock:
+            self.positions = np.concatenate([self.positions, motor_positions[valid]])
+            self.frequency_hz = np.concatenate([self.frequency_hz, frequency_hz[valid]])
+            self.impedance = np.concatenate([self.impedance, impedance[valid]])
+            self._groups = None
+        return int(np.count_nonzero(valid))
+
+    def add_points(self, points:list)->int:
+        """
+        Add data points as produced by the web interface (dicts with 'motor_positions',
+        'frequency_mhz', 'real_impedance' and 'imag_impedance').
+        """
+        points = [point for point in points if len(point.get('motor_positions') or []) == NUM_AXES]
+        return self.add([point['motor_positions'] for point in points],
+                        [point['frequency_mhz'] * 1e6 for point in points],
+                        [complex(point['real_impedance'], point['imag_impedance']) for point in points])
+
+    def load_csv(self, path:str, position_scale:float = 1)->int:
+        """
+        Add the samples of a CSV exported by the web interface.
+
+        Args:
+            path (str): Path to the CSV file.
+            position_scale (float): Factor converting the file's positions to current encoder
+                                    counts (LEGACY_POSITION_SCALE for the files in data/).
+
+        Returns:
+            int: Number of samples added.
+        """
+        history = ic.load_history_csv(path)
+        return self.add(history['motor_positions'] * position_scale, history['frequency_hz'],
+                        history['impedance'])
+
+    def _index(self)->dict:
+        with self.lock:
+            if self._groups is None:
+                self._groups = {}
+                for frequency in np.unique(self.frequency_hz):
+                    rows = self.frequency_hz == frequency
+                    self._groups[float(frequency)] = (self.positions[rows], self.impedance[rows])
+            return self._groups
+
+    def __len__(self)->int:
+        return self.impedance.size
+
+    def summary(self)->dict:
+        """
+        Number of samples recorded at each frequency.
+        """
+        return {'samples': len(self),
+                'frequencies_hz': {frequency: positions.shape[0]
+                                   for frequency, (positions, _) in self._index().items()}}
+
+    def predict(self, target_impedance:complex, frequency_hz:float,
+                candidates:int = DEFAULT_CANDIDATES, max_frequency_offset_hz:float = None)->dict:
+        """
+        Motor positions expected to produce the target impedance at a frequency.
+
+        Args:
+            target_impedance (complex): Impedance to match, in Ohms.
+            frequency_hz (float): Frequency of the match.
+            candidates (int): Number of nearest recorded samples to return.
+            max_frequency_offset_hz (float | None): Reject the query if no samples were
+                recorded within this distance of frequency_hz (None: always use the nearest).
+
+        Returns:
+            dict: 'positions' (predicted, rounded to counts), 'predicted_real',
+                  'predicted_imag' and 'predicted_mismatch', 'refined' (whether the local
+                  model moved the prediction off the best sample), 'frequency_hz' of the
+                  samples used, and 'candidates' (nearest samples, best first).
+
+        Raises:
+            ValueError: If the map is empty or has no samples near frequency_hz.
+        """
+        groups = self._index()
+        if not groups:
+            raise ValueError("The tuning map has no samples.")
+        frequencies = np.array(list(groups))
+        recorded_hz = float(frequencies[np.argmin(np.abs(frequencies - frequency_hz))])
+        if max_frequency_offset_hz is not None and abs(recorded_hz - frequency_hz) > max_frequency_offset_hz:
+            raise ValueError(f"No samples within {max_frequency_offset_hz} Hz of {frequency_hz} Hz "
+                             f"(nearest is {recorded_hz} Hz).")
+        positions, impedance = groups[recorded_hz]
+        target_impedance = complex(target_impedance)
+
+        errors = mismatch(impedance, target_impedance)
+        count = min(max(1, int(candidates)), errors.size)
+        nearest = np.argpartition(errors, count - 1)[:count]
+        nearest = nearest[np.argsort(errors[nearest])]
+        best = nearest[0]
+
+        predicted_positions, predicted_impedance = self._refine(positions, impedance, best, target_impedance)
+        refined = not np.array_equal(predicted_positions, positions[best])
+        return {
+            'positions': predicted_positions.astype(int).tolist(),
+            'predicted_real': predicted_impedance.real,
+            'predicted_imag': predicted_impedance.imag,
+            'predicted_mismatch': float(mismatch(predicted_impedance, target_impedance)),
+            'refined': refined,
+            'frequency_hz': recorded_hz,
+            'candidates': [{'positions': positions[i].astype(int).tolist(),
+                            'real_impedance': impedance[i].real,
+                            'imag_impedance': impedance[i].imag,
+                            'mismatch': float(errors[i])} for i in nearest],
+        }
+
+    def _refine(self, positions, impedance, best:int, target_impedance:complex)->tuple:
+        """
+        Fit Γ ≈ Γ_best + J·Δp over the samples around the best one, along the axes that
+        vary there, and solve for the Δp that reaches the target. The step is limited to
+        the extent of the fitted samples so the model is never extrapolated.
+
+        Returns:
+            tuple: (positions, predicted impedance), the best sample itself if no local
+                   model can be fitted.
+        """
+        origin = positions[best]
+        fallback = (origin.round(), impedance[best])
+        steps = np.abs(positions - origin)
+        varying = [axis for axis in range(NUM_AXES) if np.any(steps[:, axis] > 0)]
+        if not varying:
+            return fallback
+        # Grid spacing per varying axis: the smallest non-zero distance to another sample
+        spacing = np.array([steps[steps[:, axis] > 0, axis].min() for axis in varying])
+        offsets = positions[:, varying] - origin[varying]
+        local = np.all(np.abs(offsets) <= REFINE_RADIUS * spacing, axis=1)
+        if np.count_nonzero(local) < len(varying) + 1:
+            return fallback
+
+        gamma = ic.impedance_to_gamma(impedance[local], self.z0)
+        gamma_best = ic.impedance_to_gamma(impedance[best], self.z0)
+        gamma_target = ic.impedance_to_gamma(target_impedance, self.z0)
+        # Least-squares Jacobian of Γ (as real and imaginary rows) with respect to the offsets
+        delta = gamma - gamma_best
+        jacobian, *_ = np.linalg.lstsq(offsets[local], np.column_stack([delta.real, delta.imag]), rcond=None)
+        jacobian = jacobian.T # (2, axes)
+        residual = gamma_target - gamma_best
+        step, *_ = np.linalg.lstsq(jacobian, np.array([residual.real, residual.imag]), rcond=None)
+        extent = np.abs(offsets[local]).max(axis=0)
+        step = np.clip(step, -extent, extent)
+
+        predicted = origin.copy()
+        predicted[varying] = np.round(origin[varying] + step)
+        step = predicted[varying] - origin[varying]
+        predicted_impedance = complex(ic.s11_to_impedance(gamma_best + complex(*(jacobian @ step)), self.z0))
+        if mismatch(predicted_impedance, target_impedance) >= mismatch(impedance[best], target_impedance):
+            return fallback
+        return predicted, predicted_impedance
+
+def load_default_map(pattern:str = "data/*.csv", position_scale:float = LEGACY_POSITION_SCALE)->TuningMap:
+    """
+    Build a tuning map from the recorded sweeps in data/.
+    """
+    tuning_map = TuningMap()
+    for path in sorted(glob.glob(pattern)):
+        added = tuning_map.load_csv(path, position_scale)
+        logger.info("Tuning map samples loaded", extra={'path': path, 'samples': added})
+    return tuning_map
+
+def test()->None:
+    """
+    Predicts recorded samples from the rest of the data (each held out in turn), then
+    queries a 50 Ohm match, reporting the predicted mismatch and query time.
+    """
+    import time
+    tuning_map = load_default_map()
+    print(tuning_map.summary())
+    rng = np.random.default_rng(0)
+    for i in rng.choice(len(tuning_map), size=5, replace=False):
+        held_out = TuningMap()
+        keep = np.arange(len(tuning_map)) != i
+        held_out.add(tuning_map.positions[keep], tuning_map.frequency_hz[keep], tuning_map.impedance[keep])
+        target = tuning_map.impedance[i]
+        prediction = held_out.predict(target, tuning_map.frequency_hz[i])
+        print(f"Target {target:.2f} Ohm recorded at {tuning_map.positions[i].astype(int).tolist()}: "
+              f"predicted {prediction['positions']} |Γ|={prediction['predicted_mismatch']:.4f}")
+    start = time.perf_counter()
+    prediction = tuning_map.predict(complex(ic.Z0, 0), 18.5e6)
+    elapsed_ms = (time.perf_counter() - start) * 1e3
+    print(f"Best match to {ic.Z0} Ohm: {prediction['positions']} predicted "
+          f"{prediction['predicted_real']:.2f}{prediction['predicted_imag']:+.2f}j Ohm "
+          f"(refined: {prediction['refined']}) in {elapsed_ms:.2f} ms")
+
+# Example usage
+if __name__ == "__main__":
+    test()
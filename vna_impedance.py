@@ -1,61 +1,287 @@
+import logging
+import os
 import pyvisa
 import numpy as np
 import time
+import impedance_conversion as ic
+from scpi_session import SCPISession, SCPIError
+from metrics import Counter, Histogram
 
-VNA_ADDRESS = "TCPIP0::10.0.0.124::INSTR"
+# VNA_ADDRESS overrides the instrument, e.g. TCPIP0::127.0.0.1::5025::SOCKET for vna_sim.py
+VNA_ADDRESS = os.environ.get("VNA_ADDRESS", "TCPIP0::10.0.0.124::INSTR")
+
+# Completion wait: the timeout for one sweep is derived from the instrument's own sweep time
+SWEEP_TIMEOUT_FACTOR = 3.0   # Allowance over the reported sweep time (retrace, settling, IF processing)
+SWEEP_TIMEOUT_MARGIN_S = 2.0 # Fixed allowance added on top, dominates for single point sweeps
+ESR_POLL_INTERVAL_S = 0.005  # Poll period for the "esr" sync mode
+ESR_ERROR_BITS = 0x3C        # Query, device-dependent, execution and command error bits of *ESR?
+
+# Metrics, served at /metrics by app.py
+TRIGGER_SECONDS = Histogram("vna_trigger_to_data_seconds",
+                            "Time from triggering a sweep to holding its S11 trace", ["sweep"])
+SWEEP_WAIT_SECONDS = Histogram("vna_sweep_wait_seconds", "Time waiting for the VNA to complete a sweep", ["sync"])
+ERRORS = Counter("vna_errors_total", "Failed VNA measurements (visa: VISA I/O errors and timeouts, "
+                 "instrument: errors in the instrument's error queue)", ["kind"])
+
+# Trace transfer formats: VNA FORM setting -> pyvisa binary datatype (None means ASCII text)
+DATA_FORMATS = {"REAL,64": "d", "REAL,32": "f", "ASCII": None}
+
+logger = logging.getLogger("vna")
 
 class VNAController:
     """
     Controls a Rohde & Schwarz ZVA8 VNA, maintaining a persistent connection
-    for repeated impedance measurements.
+    for repeated impedance measurements. Commands go through an SCPISession, so
+    settings the instrument already has are not sent again and the rest travel
+    in the same message as the next query.
     """
-    def __init__(self, vna_address: str):
+    def __init__(self, vna_address: str, sync_mode: str = "opc", data_format: str = "REAL,64",
+                 z0: float = ic.Z0):
         """
         Initializes the VNA connection and performs initial configuration.
 
         Args:
             vna_address (str): The VISA resource string or IP address of the VNA.
+            sync_mode (str): How sweep completion is detected. "opc" blocks on a combined
+                             "INIT1:IMM;*OPC?" query, "esr" sends "*OPC" and polls the
+                             event status register so the VISA session is not held.
+            data_format (str): Trace transfer format, one of DATA_FORMATS. "REAL,64" and
+                               "REAL,32" read binary blocks straight into NumPy; "ASCII"
+                               keeps human-readable transfers for debugging.
+            z0 (float): Reference impedance in Ohms used to convert S11 to impedance.
         """
+        if sync_mode not in ("opc", "esr"):
+            raise ValueError(f"Unknown sync mode: {sync_mode}")
+        if data_format not in DATA_FORMATS:
+            raise ValueError(f"Unknown data format: {data_format}")
         self.vna_address = vna_address
+        self.sync_mode = sync_mode
+        self.data_format = data_format
+        self.z0 = z0
+        # De-embedding applied to every trace, see set_deembedding()
+        self.port_extension_m = 0.0
+        self.velocity_factor = 1.0
+        self.fixture_abcd = None
         self.rm = pyvisa.ResourceManager()
         self.vna = None
+        self.session:SCPISession = None
+        self.sweep_mode = None # "single", "linear" or "segmented"; tracks how channel 1 is programmed
+        self.sweep_time_s = None # Sweep time reported by the VNA for the current configuration
+        self.last_wait_s = None # How long the last trigger took to complete
 
         try:
             self.vna = self.rm.open_resource(self.vna_address)
             self.vna.timeout = 20000  # Increase timeout to 20 sec
-            print(f"Connected to VNA: {self.vna.query('*IDN?')}")
+            if self.vna_address.upper().endswith("::SOCKET"):
+                # Raw SCPI sockets have no message framing: messages end with a newline
+                self.vna.read_termination = "\n"
+                self.vna.write_termination = "\n"
+            self.session = SCPISession(self.vna)
+            logger.info("Connected to VNA", extra={'idn': self.session.query('*IDN?').strip(),
+                                                   'address': self.vna_address})
 
             # --- Initial Configuration ---
-            print("Performing initial VNA configuration...")
+            logger.info("Performing initial VNA configuration...")
 
             # Reset the instrument to a known state
-            self.vna.write("*RST")
-            self.vna.write("*CLS")  # Clear the error queue
-            self.vna.write("SYST:DISP:UPD ON")  # Ensure display updates
+            self.session.send("*RST")
+            self.session.send("*CLS")  # Clear the error queue
+            self.session.set("SYST:DISP:UPD", "ON")  # Ensure display updates
+            self.session.set("INIT1:CONT", "OFF")  # Single sweep mode, so *OPC marks the end of one sweep
+            self.session.set("*ESE", 1)  # Report Operation Complete in the event status register
+            self.session.set("FORM:BORD", "SWAP")  # Little-endian binary blocks, matching the Pi and PCs
+            self.set_data_format(self.data_format)
 
             # Set up S11 measurement on Channel 1
-            self.vna.write("CALC1:PAR:DEL:ALL")
-            self.vna.write("CALC1:PAR:SDEF 'CH1_Tr1', 'S11'")
-            self.vna.write("DISP:WIND1:STAT ON")
-            self.vna.write("DISP:WIND1:TRAC1:FEED 'CH1_Tr1'")
-            self.vna.write("SOUR1:POW -15") # Set channel base power to -15 dBm
-            self.vna.write("SENS1:BAND 10000") # Set measurement bandwidth to 10 kHz
+            self.session.send("CALC1:PAR:DEL:ALL")
+            self.session.send("CALC1:PAR:SDEF 'CH1_Tr1', 'S11'")
+            self.session.set("DISP:WIND1:STAT", "ON")
+            self.session.send("DISP:WIND1:TRAC1:FEED 'CH1_Tr1'")
+            self.session.set("SOUR1:POW", -15) # Set channel base power to -15 dBm
+            self.session.set("SENS1:BAND", 10000) # Set measurement bandwidth to 10 kHz
 
             # Set to single point sweep mode. Frequency will be set per measurement.
-            self.vna.write("SENS1:SWE:POIN 1")
-            self.vna.write("CALC1:FORM SMIT") # Set format to Smith Chart (for S11 data retrieval)
+            self.session.set("SENS1:SWE:TYPE", "LIN")
+            self.session.set("SENS1:SWE:POIN", 1)
+            self.sweep_mode = "single"
+            self.session.set("CALC1:FORM", "SMIT") # Set format to Smith Chart (for S11 data retrieval)
 
-            print("VNA initial configuration complete.")
+            # The whole configuration goes out as one message; check the instrument accepted it
+            errors = self.session.check_errors()
+            if errors:
+                logger.warning("VNA reported configuration errors", extra={'errors': errors})
+
+            logger.info("VNA initial configuration complete.")
 
         except pyvisa.VisaIOError as e:
-            print(f"Error connecting or configuring VNA: {e}")
+            logger.error(f"Error connecting or configuring VNA: {e}")
             self.vna = None # Ensure vna is None if connection fails
             raise ConnectionError(f"Failed to connect to VNA: {e}")
         except Exception as e:
-            print(f"An unexpected error occurred during VNA initialization: {e}")
+            logger.error(f"An unexpected error occurred during VNA initialization: {e}")
             self.vna = None
             raise
 
+    def _configure_single_point(self, target_frequency_hz: float)->None:
+        """
+        Puts channel 1 back into a one-point linear sweep at the given frequency.
+        Repeated measurements at one frequency send nothing.
+        """
+        if self.sweep_mode != "single":
+            self.sweep_mode = "single"
+            self.sweep_time_s = None
+        self.session.set("SENS1:SWE:TYPE", "LIN")
+        self.session.set("SENS1:SWE:POIN", 1)
+        self.session.set("SENS1:FREQ:STAR", target_frequency_hz)
+        self.session.set("SENS1:FREQ:STOP", target_frequency_hz)
+
+    def _configure_linear_sweep(self, start_hz: float, stop_hz: float, points: int)->None:
+        """
+        Programs channel 1 for a linear sweep of `points` points between start and stop.
+        """
+        changed = [self.session.set("SENS1:SWE:TYPE", "LIN"),
+                   self.session.set("SENS1:SWE:POIN", points),
+                   self.session.set("SENS1:FREQ:STAR", start_hz),
+                   self.session.set("SENS1:FREQ:STOP", stop_hz)]
+        if any(changed) or self.sweep_mode != "linear":
+            self.sweep_time_s = None
+        self.sweep_mode = "linear"
+
+    def _configure_segmented_sweep(self, frequencies_hz: np.ndarray)->None:
+        """
+        Programs channel 1 for a segmented sweep with one single-point segment per frequency.
+        The frequencies must already be sorted and unique (the ZVA rejects overlapping segments).
+        The segment table is only rewritten when the frequencies differ from the last list.
+        """
+        commands = ["SENS1:SEGM:DEL:ALL"]
+        for segment, frequency_hz in enumerate(frequencies_hz, start=1):
+            commands += [f"SENS1:SEGM{segment}:ADD",
+                         f"SENS1:SEGM{segment}:FREQ:STAR {frequency_hz}",
+                         f"SENS1:SEGM{segment}:FREQ:STOP {frequency_hz}",
+                         f"SENS1:SEGM{segment}:SWE:POIN 1"]
+        changed = [self.session.configure("SENS1:SEGM", tuple(frequencies_hz.tolist()), commands),
+                   self.session.set("SENS1:SWE:TYPE", "SEGM")]
+        if any(changed) or self.sweep_mode != "segmented":
+            self.sweep_time_s = None
+        self.sweep_mode = "segmented"
+
+    def _sweep_timeout_s(self)->float:
+        """
+        Returns how long to wait for one sweep before giving up. The sweep time is queried
+        from the VNA once per configuration, so slow set-ups (low IF bandwidth, many points)
+        get a proportionally longer timeout.
+        """
+        if self.sweep_time_s is None:
+            self.sweep_time_s = float(self.session.query("SENS1:SWE:TIME?"))
+        return self.sweep_time_s * SWEEP_TIMEOUT_FACTOR + SWEEP_TIMEOUT_MARGIN_S
+
+    def _trigger_and_wait(self)->float:
+        """
+        Triggers one sweep on channel 1 and returns once the instrument reports it complete.
+
+        Returns:
+            float: The time in seconds spent waiting for the sweep.
+        """
+        timeout_s = self._sweep_timeout_s()
+        start = time.perf_counter()
+
+        if self.sync_mode == "opc":
+            # *OPC? only answers once the sweep started by INIT1:IMM has finished. Settings
+            # queued by the configuration go out in the same message.
+            previous_timeout = self.vna.timeout
+            self.vna.timeout = int(timeout_s * 1000)
+            try:
+                self.session.query("INIT1:IMM;*OPC?")
+            finally:
+                self.vna.timeout = previous_timeout
+        else:
+            # *OPC sets bit 0 of the event status register when the sweep completes
+            self.session.query("*ESR?") # Reading the register clears any stale bits
+            self.session.write("INIT1:IMM;*OPC")
+            while True:
+                esr = int(self.session.query("*ESR?"))
+                if esr & ESR_ERROR_BITS:
+                    # A command or the sweep failed: read the error queue (forgetting the known settings)
+                    raise SCPIError(self.session.check_errors() or [f"*ESR? {esr}"])
+                if esr & 1:
+                    break
+                if time.perf_counter() - start > timeout_s:
+                    raise TimeoutError(f"Sweep did not complete within {timeout_s:.1f} s")
+                time.sleep(ESR_POLL_INTERVAL_S)
+
+        self.last_wait_s = time.perf_counter() - start
+        SWEEP_WAIT_SECONDS.labels(self.sync_mode).observe(self.last_wait_s)
+        return self.last_wait_s
+
+    def set_data_format(self, data_format: str)->None:
+        """
+        Selects how trace data is transferred from the VNA.
+
+        Args:
+            data_format (str): One of DATA_FORMATS ("REAL,64", "REAL,32" or "ASCII").
+        """
+        if data_format not in DATA_FORMATS:
+            raise ValueError(f"Unknown data format: {data_format}")
+        self.session.set("FORM", data_format)
+        self.data_format = data_format
+
+    def _read_s11(self)->np.ndarray:
+        """
+        Reads the current S11 trace of channel 1 without triggering a new sweep.
+
+        Returns:
+            np.ndarray: Complex S11 values, one per sweep point.
+        """
+        datatype = DATA_FORMATS[self.data_format]
+        if datatype is None:
+            # ASCII transfer: comma separated re,im pairs
+            self.session.write("CALC1:DATA? SDATA")
+            raw_data = self.session.read()
+            data_points = np.array(raw_data.split(","), dtype=float)
+        else:
+            # Binary block (#<n><length><bytes>) read straight into a NumPy buffer
+            data_points = self.session.query_binary_values("CALC1:DATA? SDATA", datatype=datatype,
+                                                           is_big_endian=False, container=np.array)
+
+        data_points = data_points.astype(float, copy=False).reshape(-1, 2)
+        return data_points[:, 0] + 1j * data_points[:, 1]
+
+    def _trigger_and_read_s11(self)->np.ndarray:
+        """
+        Triggers one sweep on channel 1 and reads the whole S11 trace in a single query.
+
+        Returns:
+            np.ndarray: Complex S11 values, one per sweep point.
+        """
+        with TRIGGER_SECONDS.labels(self.sweep_mode).time():
+            # Trigger measurement and wait for the instrument to report completion
+            self._trigger_and_wait()
+            return self._read_s11()
+
+    def set_deembedding(self, port_extension_m: float = 0.0, velocity_factor: float = 1.0,
+                        fixture_abcd=None)->None:
+        """
+        Moves the measurement reference plane from the VNA port to the tuner.
+
+        Args:
+            port_extension_m (float): Length of the cable/line to remove, in metres.
+            velocity_factor (float): Velocity factor of that line.
+            fixture_abcd (Callable[[np.ndarray], np.ndarray] | None): Returns the fixture's
+                (N, 2, 2) ABCD matrices for an array of frequencies in Hz, or None for no fixture.
+        """
+        self.port_extension_m = port_extension_m
+        self.velocity_factor = velocity_factor
+        self.fixture_abcd = fixture_abcd
+
+    def _s11_to_impedance(self, s11: np.ndarray, frequencies_hz: np.ndarray)->np.ndarray:
+        """
+        De-embeds S11 and converts it to impedance referenced to self.z0, for a whole trace at once.
+        """
+        fixture_abcd = self.fixture_abcd(frequencies_hz) if self.fixture_abcd else None
+        s11 = ic.deembed_s11(s11, frequencies_hz, self.z0, self.port_extension_m,
+                             self.velocity_factor, fixture_abcd)
+        return ic.s11_to_impedance(s11, self.z0)
+
     def get_impedance(self, target_frequency_hz: float):
         """
         Measures S11 at a specific frequency and returns the impedance.
@@ -65,42 +291,132 @@ class VNAController:
             target_frequency_hz (float): The specific frequency in Hz at which to measure impedance.
 
         Returns:
-            dict: A dictionary containing 'real_impedance' and 'imag_impedance' if successful,
-                  otherwise an error message.
+            dict: A dictionary containing 'real_impedance', 'imag_impedance' and 'wait_time_s'
+                  (time spent waiting for the sweep) if successful, otherwise an error message.
         """
         if not self.vna:
             return {"error": "VNA not connected. Please initialize VNAController first."}
 
         try:
             # Set frequency for the single point measurement
-            self.vna.write(f"SENS1:FREQ:STAR {target_frequency_hz}")
-            self.vna.write(f"SENS1:FREQ:STOP {target_frequency_hz}")
+            self._configure_single_point(target_frequency_hz)
 
-            # Trigger measurement and wait for completion
-            self.vna.write("INIT1:IMM")
-            time.sleep(0.5) # Short delay for single point measurement
+            s11 = self._trigger_and_read_s11()[:1] # Get the single S11 point
+            impedance = self._s11_to_impedance(s11, np.array([target_frequency_hz]))[0]
 
-            # Read S11 data (real and imaginary parts)
-            self.vna.write("CALC1:DATA? SDATA")
-            raw_data = self.vna.read()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Impedance measured", extra={'frequency_mhz': target_frequency_hz / 1e6,
+                                                          'real': round(impedance.real, 2),
+                                                          'imag': round(impedance.imag, 2),
+                                                          'wait_ms': round(self.last_wait_s * 1000, 1)})
+            return {"real_impedance": impedance.real, "imag_impedance": impedance.imag,
+                    "wait_time_s": self.last_wait_s}
 
-            # Parse the retrieved S11 data
-            data_points = np.array(raw_data.split(","), dtype=float).reshape(-1, 2)
-            s11_complex = data_points[0, 0] + 1j * data_points[0, 1] # Get the single S11 point
+        except pyvisa.VisaIOError as e:
+            ERRORS.labels("visa").inc()
+            logger.error(f"Error communicating with the VNA during measurement: {e}")
+            return {"error": f"VNA communication error during measurement: {e}"}
+        except SCPIError as e:
+            ERRORS.labels("instrument").inc()
+            logger.error(f"VNA rejected the settings of the measurement: {e}")
+            return {"error": f"VNA error during measurement: {e}"}
+        except Exception as e:
+            ERRORS.labels("other").inc()
+            logger.exception(f"An unexpected error occurred during VNA measurement: {e}")
+            return {"error": f"An unexpected error occurred during measurement: {e}"}
+
+    def get_impedance_sweep(self, start_hz: float, stop_hz: float, points: int):
+        """
+        Measures S11 over a linear frequency sweep with a single trigger and a single
+        trace read, instead of one round trip per frequency.
+
+        Args:
+            start_hz (float): First frequency of the sweep in Hz.
+            stop_hz (float): Last frequency of the sweep in Hz.
+            points (int): Number of sweep points (the ZVA8 accepts 1 to 60001).
+
+        Returns:
+            dict: 'frequency_hz', 'real_impedance' and 'imag_impedance' as NumPy arrays
+                  of length `points`, plus 'wait_time_s', if successful, otherwise an error message.
+        """
+        if not self.vna:
+            return {"error": "VNA not connected. Please initialize VNAController first."}
+        if points < 1 or stop_hz < start_hz:
+            return {"error": f"Invalid sweep: {start_hz} Hz to {stop_hz} Hz with {points} points."}
 
-            # Convert to impedance (Z = Z0 * (1 + Γ) / (1 - Γ), assuming Z0 = 50Ω)
-            z0 = 50
-            impedance = z0 * (1 + s11_complex) / (1 - s11_complex)
+        try:
+            self._configure_linear_sweep(start_hz, stop_hz, points)
+            frequencies_hz = np.linspace(start_hz, stop_hz, points)
+            impedance = self._s11_to_impedance(self._trigger_and_read_s11(), frequencies_hz)
 
-            print(f"Impedance at {target_frequency_hz / 1e6} MHz: Real={impedance.real:.2f}, Imag={impedance.imag:.2f}")
-            return {"real_impedance": impedance.real, "imag_impedance": impedance.imag}
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Impedance sweep measured", extra={'start_mhz': start_hz / 1e6, 'stop_mhz': stop_hz / 1e6,
+                                                                'points': points})
+            return {"frequency_hz": frequencies_hz,
+                    "real_impedance": impedance.real,
+                    "imag_impedance": impedance.imag,
+                    "wait_time_s": self.last_wait_s}
 
         except pyvisa.VisaIOError as e:
-            print(f"Error communicating with the VNA during measurement: {e}")
-            return {"error": f"VNA communication error during measurement: {e}"}
+            ERRORS.labels("visa").inc()
+            logger.error(f"Error communicating with the VNA during sweep: {e}")
+            return {"error": f"VNA communication error during sweep: {e}"}
+        except SCPIError as e:
+            ERRORS.labels("instrument").inc()
+            logger.error(f"VNA rejected the settings of the sweep: {e}")
+            return {"error": f"VNA error during sweep: {e}"}
         except Exception as e:
-            print(f"An unexpected error occurred during VNA measurement: {e}")
-            return {"error": f"An unexpected error occurred during measurement: {e}"}
+            ERRORS.labels("other").inc()
+            logger.exception(f"An unexpected error occurred during VNA sweep: {e}")
+            return {"error": f"An unexpected error occurred during sweep: {e}"}
+
+    def get_impedance_list(self, frequencies_hz):
+        """
+        Measures S11 at an arbitrary list of frequencies using a segmented sweep,
+        so the whole list costs one trigger and one trace read.
+
+        Args:
+            frequencies_hz (Sequence[float]): Frequencies in Hz, in any order. Duplicates are
+                                              measured once and repeated in the result.
+
+        Returns:
+            dict: 'frequency_hz', 'real_impedance' and 'imag_impedance' as NumPy arrays in the
+                  same order as `frequencies_hz`, plus 'wait_time_s', if successful, otherwise
+                  an error message.
+        """
+        if not self.vna:
+            return {"error": "VNA not connected. Please initialize VNAController first."}
+
+        frequencies_hz = np.asarray(frequencies_hz, dtype=float)
+        if frequencies_hz.ndim != 1 or frequencies_hz.size == 0:
+            return {"error": "Frequency list must be a non-empty one-dimensional sequence."}
+
+        try:
+            # Segments have to be ascending and non-overlapping on the instrument
+            unique_hz, order = np.unique(frequencies_hz, return_inverse=True)
+            self._configure_segmented_sweep(unique_hz)
+            impedance = self._s11_to_impedance(self._trigger_and_read_s11(), unique_hz)[order]
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Impedance list measured", extra={'frequencies': frequencies_hz.size,
+                                                               'segments': unique_hz.size})
+            return {"frequency_hz": frequencies_hz,
+                    "real_impedance": impedance.real,
+                    "imag_impedance": impedance.imag,
+                    "wait_time_s": self.last_wait_s}
+
+        except pyvisa.VisaIOError as e:
+            ERRORS.labels("visa").inc()
+            logger.error(f"Error communicating with the VNA during segmented sweep: {e}")
+            return {"error": f"VNA communication error during segmented sweep: {e}"}
+        except SCPIError as e:
+            ERRORS.labels("instrument").inc()
+            logger.error(f"VNA rejected the settings of the segmented sweep: {e}")
+            return {"error": f"VNA error during segmented sweep: {e}"}
+        except Exception as e:
+            ERRORS.labels("other").inc()
+            logger.exception(f"An unexpected error occurred during VNA segmented sweep: {e}")
+            return {"error": f"An unexpected error occurred during segmented sweep: {e}"}
 
     def close(self):
         """
@@ -109,9 +425,9 @@ class VNAController:
         if self.vna:
             try:
                 self.vna.close()
-                print("VNA connection closed.")
+                logger.info("VNA connection closed.")
             except Exception as e:
-                print(f"Error closing VNA connection: {e}")
+                logger.error(f"Error closing VNA connection: {e}")
 
 def test():
     print("Running the VNA Test Procedure")
@@ -128,6 +444,53 @@ def test():
         impedance_data = vna_controller.get_impedance(20e6)
         print(f"Result for 20 MHz: {impedance_data}")
 
+        # Sweep 201 points across the tuning band in one trigger
+        sweep_data = vna_controller.get_impedance_sweep(15e6, 25e6, 201)
+        print(f"Result for 201-point sweep: {sweep_data}")
+
+        # Measure an arbitrary frequency list in one segmented sweep
+        list_data = vna_controller.get_impedance_list([20e6, 13.56e6, 18.5e6])
+        print(f"Result for frequency list: {list_data}")
+
+    except ConnectionError as e:
+        print(f"Could not establish VNA connection: {e}")
+    finally:
+        if vna_controller:
+            vna_controller.close()
+
+def test_data_formats(vna_address: str = VNA_ADDRESS, ascii_tolerance: float = 1e-9):
+    """
+    Reads one trace in every transfer format and checks that they agree, proving the binary
+    block path returns the same data as the ASCII path. vna_sim.py runs it against the
+    simulator, which prints ASCII traces at full precision, with ascii_tolerance=0.
+
+    Args:
+        vna_address (str): The VNA (or simulator) to read from.
+        ascii_tolerance (float): Accepted deviation of the ASCII trace from REAL,64.
+    """
+    print("Running the VNA Data Format Test")
+    vna_controller = None
+    try:
+        vna_controller = VNAController(vna_address, data_format="ASCII")
+        vna_controller._configure_linear_sweep(15e6, 25e6, 401)
+        vna_controller._trigger_and_wait()
+
+        # Read the same (untriggered) trace back in each format
+        traces = {}
+        for data_format in DATA_FORMATS:
+            vna_controller.set_data_format(data_format)
+            traces[data_format] = vna_controller._read_s11()
+
+        reference = traces["REAL,64"]
+        # REAL,32 is limited to single precision; ASCII to the digits the VNA prints
+        tolerances = {"REAL,64": 0.0, "REAL,32": 1e-6, "ASCII": ascii_tolerance}
+        for data_format, trace in traces.items():
+            deviation = np.max(np.abs(trace - reference))
+            matches = trace.shape == reference.shape and deviation <= tolerances[data_format]
+            print(f"{data_format}: {trace.size} points, max deviation from REAL,64 {deviation:.3g} "
+                  f"-> {'OK' if matches else 'MISMATCH'}")
+            assert matches, f"{data_format} trace does not match REAL,64"
+
     except ConnectionError as e:
         print(f"Could not establish VNA connection: {e}")
     finally:
@@ -137,5 +500,6 @@ def test():
 # Example usage (for testing vna_impedance.py independently)
 if __name__ == "__main__":
     test()
+    test_data_formats()
 
 
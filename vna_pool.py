@@ -0,0 +1,388 @@
+"""
+Pool of VNAs shared by the measurement code of one server.
+
+Each configured instrument keeps its own persistent VNAController. Measurements lease an
+instrument for exclusive use, by name or by the frequency band it covers, so a sweep and
+a single measurement (or jobs on different bands) run in parallel on different VNAs
+without their SCPI exchanges interleaving on one connection:
+    with pool.lease(frequency_hz=18.5e6) as instrument:
+        result = instrument.controller.get_impedance(18.5e6)
+        if "error" in result:
+            instrument.failed = True # checked before it is leased again
+
+A health thread queries *IDN? on idle instruments every HEALTH_CHECK_INTERVAL_S, checks a
+failed instrument straight after its lease, and reconnects instruments that dropped off.
+
+Instruments are listed in the JSON file named by VNA_INSTRUMENTS (default vna_instruments.json):
+    [{"name": "low", "address": "TCPIP0::10.0.0.124::INSTR", "min_mhz": 1, "max_mhz": 30},
+     {"name": "high", "address": "TCPIP0::10.0.0.125::INSTR", "min_mhz": 30, "max_mhz": 8000,
+      "sync_mode": "esr"}]
+Other keys are passed to VNAController (sync_mode, data_format, z0). Without the file
+the pool holds the single instrument at VNA_ADDRESS.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from vna_impedance import VNAController, VNA_ADDRESS
+from metrics import Counter, Gauge, Histogram
+
+VNA_INSTRUMENTS = os.environ.get("VNA_INSTRUMENTS", "vna_instruments.json")
+HEALTH_CHECK_INTERVAL_S = 10.0 # How often an idle instrument is checked
+RECONNECT_INTERVAL_S = 5.0 # Wait after the first failed connection attempt, doubled after every further one
+MAX_RECONNECT_INTERVAL_S = 60.0 # Longest wait between connection attempts
+LEASE_TIMEOUT_S = 60.0 # Longest wait for a free instrument (a sweep point on a busy VNA takes well under this)
+
+# Instrument states
+IDLE = "idle"
+LEASED = "leased"
+CHECKING = "checking" # held by the health thread
+SUSPECT = "suspect" # a measurement failed; checked before the next lease
+OFFLINE = "offline"
+
+# Metrics, served at /metrics by app.py
+LEASES = Counter("vna_leases_total", "Instrument leases", ["instrument"])
+LEASE_WAIT_SECONDS = Histogram("vna_lease_wait_seconds", "Time waiting for a free instrument")
+RECONNECTS = Counter("vna_connects_total", "Connection attempts to instruments, by result",
+                     ["instrument", "result"])
+
+logger = logging.getLogger("vna.pool")
+
+class VNAUnavailable(Exception):
+    """
+    Raised when no configured instrument matches a lease, or none became free in time.
+    """
+
+class Instrument:
+    """
+    One configured VNA, its controller (None while offline) and its pool state.
+    """
+    def __init__(self, name:str, address:str, min_hz:float = 0.0, max_hz:float = float("inf"),
+                 options:dict = None)->None:
+        """
+        Args:
+            name (str): Name used to select the instrument, e.g. in a sweep's 'instrument'.
+            address (str): VISA resource string.
+            min_hz (float): Lowest frequency the instrument is leased for.
+            max_hz (float): Highest frequency the instrument is leased for.
+            options (dict): Keyword arguments of VNAController (sync_mode, data_format, z0).
+        """
+        if min_hz > max_hz:
+            raise ValueError(f"Instrument {name}: band {min_hz} Hz to {max_hz} Hz is empty")
+        self.name = name
+        self.address = address
+        self.min_hz = min_hz
+        self.max_hz = max_hz
+        self.options = options or {}
+        self.controller:VNAController = None
+        self.state = OFFLINE
+        self.failed = False # set by the lease holder when a measurement failed
+        self.last_error = None
+        self.last_checked = 0.0 # monotonic time of the last check or connection attempt
+        self.failures = 0 # failed connection attempts since it was last connected
+        self.leases = 0
+
+    def covers(self, frequency_hz:float)->bool:
+        return self.min_hz <= frequency_hz <= self.max_hz
+
+    def status(self)->dict:
+        return {'name': self.name, 'address': self.address, 'state': self.state,
+                'min_mhz': self.min_hz / 1e6, 'max_mhz': self.max_hz / 1e6 if self.max_hz != float("inf") else None,
+                'leases': self.leases, 'last_error': self.last_error}
+
+def load_instruments(path:str = VNA_INSTRUMENTS, default_address:str = VNA_ADDRESS)->list:
+    """
+    Reads the instrument list, or returns the single default instrument if the file does not exist.
+
+    Returns:
+        list: Instrument objects, not yet connected.
+    """
+    if not os.path.exists(path):
+        return [Instrument("vna1", default_address)]
+    with open(path) as file:
+        entries = json.load(file)
+    instruments = []
+    for i, entry in enumerate(entries, start=1):
+        options = {key: value for key, value in entry.items()
+                   if key not in ("name", "address", "min_mhz", "max_mhz")}
+        instruments.append(Instrument(entry.get("name", f"vna{i}"), entry["address"],
+                                      float(entry.get("min_mhz", 0.0)) * 1e6,
+                                      float(entry.get("max_mhz", float("inf"))) * 1e6, options))
+    names = [instrument.name for instrument in instruments]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Instrument names in {path} are not unique: {names}")
+    return instruments
+
+class VNAPool:
+    """
+    Leases connected instruments to measurements and keeps them connected.
+    """
+    def __init__(self, instruments:list, health_check_interval_s:float = HEALTH_CHECK_INTERVAL_S,
+                 reconnect_interval_s:float = RECONNECT_INTERVAL_S, connect = VNAController)->None:
+        """
+        Args:
+            instruments (list): Instrument objects, e.g. from load_instruments().
+            health_check_interval_s (float): Period of the idle instrument checks.
+            reconnect_interval_s (float): Wait after the first failed connection attempt (doubled
+                                          after every further one, up to MAX_RECONNECT_INTERVAL_S).
+            connect (callable): Opens a controller: connect(address, **options).
+        """
+        self.instruments = {instrument.name: instrument for instrument in instruments}
+        self.health_check_interval_s = health_check_interval_s
+        self.reconnect_interval_s = reconnect_interval_s
+        self.connect = connect
+        self.condition = threading.Condition()
+        self.wake = threading.Event() # cuts the health thread's wait short after a failed lease
+        self.stop_event = threading.Event()
+        self.thread = None
+        Gauge("vna_instruments_connected", "Instruments connected (idle, leased or being checked)").set_function(
+            lambda: sum(instrument.controller is not None for instrument in list(self.instruments.values())))
+
+    def __len__(self)->int:
+        return len(self.instruments)
+
+    def start(self)->None:
+        """
+        Connects every instrument (in parallel, so an unreachable one does not delay the
+        others) and starts the health thread.
+        """
+        threads = [threading.Thread(target=self._check, args=(instrument,), daemon=True)
+                   for instrument in self.instruments.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.thread = threading.Thread(target=self._health_loop, name="vna-health", daemon=True)
+        self.thread.start()
+
+    def _candidates(self, name:str, frequency_hz:float)->list:
+        if name is not None:
+            if name not in self.instruments:
+                raise VNAUnavailable(f"No VNA named {name}.")
+            candidates = [self.instruments[name]]
+        else:
+            candidates = list(self.instruments.values())
+        if frequency_hz is not None:
+            candidates = [instrument for instrument in candidates if instrument.covers(frequency_hz)]
+            if not candidates:
+                raise VNAUnavailable(f"No VNA{' ' + name if name else ''} covers {frequency_hz / 1e6} MHz.")
+        return candidates
+
+    def acquire(self, name:str = None, frequency_hz:float = None, timeout:float = LEASE_TIMEOUT_S)->Instrument:
+        """
+        Waits for a matching idle instrument and marks it leased. Prefer lease().
+
+        Args:
+            name (str): Instrument name, or None for any.
+            frequency_hz (float): Frequency the instrument has to cover, or None for any.
+            timeout (float): Longest wait in seconds.
+
+        Raises:
+            VNAUnavailable: No instrument matches, all matching ones are offline, or none
+                            became free within the timeout.
+        """
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            candidates = self._candidates(name, frequency_hz)
+            while True:
+                idle = [instrument for instrument in candidates if instrument.state == IDLE]
+                if idle:
+                    instrument = min(idle, key=lambda instrument: instrument.leases) # spread the load
+                    instrument.state = LEASED
+                    instrument.failed = False
+                    instrument.leases += 1
+                    break
+                if all(instrument.state == OFFLINE for instrument in candidates):
+                    errors = "; ".join(f"{instrument.name}: {instrument.last_error}" for instrument in candidates)
+                    raise VNAUnavailable(f"VNA offline ({errors}).")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    states = ", ".join(f"{instrument.name} {instrument.state}" for instrument in candidates)
+                    raise VNAUnavailable(f"No VNA became free within {timeout} s ({states}).")
+                self.condition.wait(remaining)
+        LEASES.labels(instrument.name).inc()
+        LEASE_WAIT_SECONDS.observe(time.perf_counter() - start)
+        return instrument
+
+    def release(self, instrument:Instrument)->None:
+        """
+        Returns a leased instrument. A failed one is checked by the health thread first.
+        """
+        with self.condition:
+            instrument.state = SUSPECT if instrument.failed else IDLE
+            self.condition.notify_all()
+        if instrument.failed:
+            self.wake.set()
+
+    @contextmanager
+    def lease(self, name:str = None, frequency_hz:float = None, timeout:float = LEASE_TIMEOUT_S):
+        """
+        Context manager holding an instrument for exclusive use, see acquire(). An
+        exception inside the block marks the instrument failed.
+        """
+        instrument = self.acquire(name, frequency_hz, timeout)
+        try:
+            yield instrument
+        except Exception:
+            instrument.failed = True
+            raise
+        finally:
+            self.release(instrument)
+
+    def _due(self, instrument:Instrument, now:float)->bool:
+        if instrument.state == SUSPECT:
+            return True
+        if instrument.state == IDLE:
+            return now - instrument.last_checked >= self.health_check_interval_s
+        if instrument.state == OFFLINE:
+            backoff = self.reconnect_interval_s * 2 ** (instrument.failures - 1)
+            return now - instrument.last_checked >= min(backoff, MAX_RECONNECT_INTERVAL_S)
+        return False
+
+    def _health_loop(self)->None:
+        while not self.stop_event.is_set():
+            self.wake.wait(min(self.health_check_interval_s, self.reconnect_interval_s))
+            self.wake.clear()
+            if self.stop_event.is_set():
+                return
+            now = time.monotonic()
+            with self.condition:
+                due = [instrument for instrument in self.instruments.values() if self._due(instrument, now)]
+                for instrument in due:
+                    instrument.state = CHECKING
+            for instrument in due:
+                self._check(instrument)
+
+    def _check(self, instrument:Instrument)->None:
+        """
+        Queries a connected instrument, and (re)connects it if that fails or it is offline.
+        The caller owns the instrument (it is not leasable) until the new state is set.
+        """
+        if instrument.controller is not None:
+            try:
+                instrument.controller.session.query("*IDN?")
+                self._set_state(instrument, IDLE)
+                return
+            except Exception as e:
+                logger.warning("VNA failed its health check", extra={'instrument': instrument.name, 'error': e})
+                instrument.controller.close()
+                instrument.controller = None
+        try:
+            instrument.controller = self.connect(instrument.address, **instrument.options)
+            RECONNECTS.labels(instrument.name, "connected").inc()
+            logger.info("VNA connected", extra={'instrument': instrument.name, 'address': instrument.address})
+            self._set_state(instrument, IDLE)
+        except Exception as e:
+            RECONNECTS.labels(instrument.name, "failed").inc()
+            if not instrument.failures: # only the first of a series of failed attempts
+                logger.error("VNA connection failed", extra={'instrument': instrument.name,
+                                                             'address': instrument.address, 'error': e})
+            self._set_state(instrument, OFFLINE, f"{e}")
+
+    def _set_state(self, instrument:Instrument, state:str, error:str = None)->None:
+        with self.condition:
+            instrument.state = state
+            instrument.failures = instrument.failures + 1 if state == OFFLINE else 0
+            instrument.last_error = error
+            instrument.last_checked = time.monotonic()
+            self.condition.notify_all()
+
+    def status(self)->list:
+        """
+        State, band and lease count of every instrument.
+        """
+        with self.condition:
+            return [instrument.status() for instrument in self.instruments.values()]
+
+    def close(self)->None:
+        """
+        Stops the health thread and closes every connection.
+        """
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        for instrument in self.instruments.values():
+            if instrument.controller is not None:
+                instrument.controller.close()
+                instrument.controller = None
+            instrument.state = OFFLINE
+
+def test()->None:
+    """
+    Serves two simulated VNAs on free ports as a low and a high band and measures on both
+    in parallel. A third instrument starts without a server: it stays offline until one
+    appears on its port, and is then reconnected by the health thread.
+    """
+    import socket
+    import numpy as np
+    import vna_sim
+    model = vna_sim.ImpedanceModel.from_recordings()
+    positions = [0, 0, 0, 0]
+    def serve(port:int = 0):
+        server = vna_sim.SCPIServer(("127.0.0.1", port), vna_sim.SimulatedZVA(model, lambda: positions, noise=0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    def address(port:int)->str:
+        return f"TCPIP0::127.0.0.1::{port}::SOCKET"
+    servers = [serve(), serve()]
+    with socket.socket() as probe: # a free port for the instrument that is switched on later
+        probe.bind(("127.0.0.1", 0))
+        spare_port = probe.getsockname()[1]
+    pool = VNAPool([Instrument("low", address(servers[0].server_address[1]), 1e6, 19e6),
+                    Instrument("high", address(servers[1].server_address[1]), 19e6, 8e9),
+                    Instrument("spare", address(spare_port))],
+                   health_check_interval_s=0.2, reconnect_interval_s=0.2)
+    try:
+        pool.start()
+        print(pool.status())
+        assert pool.instruments["spare"].state == OFFLINE
+        results = {}
+        def measure(frequency_hz):
+            with pool.lease(frequency_hz=frequency_hz) as instrument:
+                results[frequency_hz] = (instrument.name, instrument.controller.get_impedance(frequency_hz))
+        start = time.perf_counter()
+        threads = [threading.Thread(target=measure, args=(frequency_hz,)) for frequency_hz in (18.5e6, 20e6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"Parallel measurements in {(time.perf_counter() - start) * 1e3:.1f} ms: {results}")
+        assert {name for name, _ in results.values()} <= {"low", "high"}
+        assert np.isfinite(results[18.5e6][1]['real_impedance'])
+        try:
+            pool.acquire(frequency_hz=10e9, name="high", timeout=0)
+            raise AssertionError("10 GHz is outside the band of 'high'")
+        except VNAUnavailable as e:
+            print(e)
+
+        with pool.lease("low") as instrument:
+            instrument.failed = True # checked, found healthy and leasable again
+        with pool.lease("low", timeout=2) as instrument:
+            assert "error" not in instrument.controller.get_impedance(18.5e6)
+
+        try:
+            pool.acquire("spare")
+            raise AssertionError("'spare' has no server yet")
+        except VNAUnavailable as e:
+            print(e)
+        servers.append(serve(spare_port))
+        deadline = time.monotonic() + 5
+        while pool.instruments["spare"].state == OFFLINE and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with pool.lease("spare", timeout=5) as instrument:
+            assert "error" not in instrument.controller.get_impedance(100e6)
+        print(pool.status())
+    finally:
+        pool.close()
+        for server in servers:
+            server.shutdown()
+
+# Example usage
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    test()
@@ -0,0 +1,382 @@
+"""
+Simulated Rohde & Schwarz ZVA8 for developing off the bench. It serves SCPI over a raw
+TCP socket (port 5025, like the instrument), understands the commands VNAController
+sends, and answers S11 modelled from the recorded sweeps in data/ as a function of the
+tuner's motor positions, read from the simulated axes shared with gpio_sim.py.
+
+Run it with `python vna_sim.py` and point the app at it:
+    VNA_ADDRESS=TCPIP0::127.0.0.1::5025::SOCKET TUNER_SIMULATION=1 python app.py
+"""
+import argparse
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+import numpy as np
+
+import impedance_conversion as ic
+from tuning_map import load_default_map
+
+DEFAULT_PORT = 5025 # Raw SCPI socket port of R&S instruments
+IDN = "Rohde-Schwarz,ZVA8-4Port,100000/SIM,3.00-SIM"
+
+NEAREST_SAMPLES = 4 # Recorded samples blended for one prediction
+IDW_POWER = 2 # Inverse distance weighting exponent
+COVERAGE_COUNTS = 20 # A recorded frequency is used only if it has samples this close to the positions
+ELECTRICAL_DELAY_S = 5e-9 # Round-trip delay rotating Γ away from the recorded frequency
+NOISE_GAMMA = 0.001 # Standard deviation of the trace noise, in Γ
+
+# Sweep timing model: every point takes one IF period plus processing
+SWEEP_OVERHEAD_S = 0.005
+POINT_OVERHEAD_S = 20e-6
+SEGMENT_OVERHEAD_S = 0.001
+
+# Instrument limits: out-of-range settings are rejected with an error, like the ZVA8
+MIN_FREQUENCY_HZ = 300e3
+MAX_FREQUENCY_HZ = 8e9
+MAX_POINTS = 60001
+
+NO_ERROR = '0,"No error"'
+COMMAND_ERROR = 0x20 # *ESR? bit of -1xx errors
+EXECUTION_ERROR = 0x10 # *ESR? bit of -2xx errors
+
+class ImpedanceModel:
+    """
+    S11 of the tuner as a function of motor positions and frequency, interpolated from
+    recorded samples: at the nearest recorded frequency that has samples around the
+    positions, Γ is the inverse-distance weighted mean of the nearest samples in position
+    space, then rotated by ELECTRICAL_DELAY_S for the frequency offset.
+    """
+    def __init__(self, motor_positions, frequency_hz, impedance, z0:float = ic.Z0,
+                 delay_s:float = ELECTRICAL_DELAY_S)->None:
+        motor_positions = np.asarray(motor_positions, dtype=float)
+        frequency_hz = np.asarray(frequency_hz, dtype=float)
+        gamma = ic.impedance_to_gamma(np.asarray(impedance, dtype=complex), z0)
+        self.delay_s = delay_s
+        self.frequencies = np.unique(frequency_hz)
+        self.groups = {frequency: (motor_positions[frequency_hz == frequency], gamma[frequency_hz == frequency])
+                       for frequency in self.frequencies}
+
+    @classmethod
+    def from_recordings(cls, pattern:str = "data/*.csv")->"ImpedanceModel":
+        """
+        Model of the recorded sweeps in data/ (positions in current encoder counts).
+        """
+        recordings = load_default_map(pattern)
+        if not len(recordings):
+            raise ValueError(f"No recorded samples match {pattern}")
+        return cls(recordings.positions, recordings.frequency_hz, recordings.impedance, recordings.z0)
+
+    def _gamma_at(self, recorded_hz:float, positions:np.ndarray)->tuple:
+        """
+        Returns:
+            tuple: (interpolated Γ, distance to the nearest sample).
+        """
+        sample_positions, gamma = self.groups[recorded_hz]
+        distance = np.linalg.norm(sample_positions - positions, axis=1)
+        count = min(NEAREST_SAMPLES, distance.size)
+        nearest = np.argpartition(distance, count - 1)[:count]
+        closest = distance[nearest].min()
+        if closest == 0:
+            return complex(gamma[nearest][distance[nearest] == 0].mean()), 0.0
+        weights = distance[nearest] ** -IDW_POWER
+        return complex(np.sum(weights * gamma[nearest]) / np.sum(weights)), float(closest)
+
+    def s11(self, positions, frequencies_hz)->np.ndarray:
+        """
+        Args:
+            positions (array-like): The four motor positions, in encoder counts.
+            frequencies_hz (array-like): Sweep frequencies.
+
+        Returns:
+            np.ndarray: Complex S11 at each frequency.
+        """
+        positions = np.asarray(positions, dtype=float)
+        frequencies_hz = np.asarray(frequencies_hz, dtype=float)
+        gamma, closest = zip(*(self._gamma_at(frequency, positions) for frequency in self.frequencies))
+        gamma, closest = np.array(gamma), np.array(closest)
+        covered = closest <= COVERAGE_COUNTS
+        if not covered.any():
+            covered = closest == closest.min()
+        # Nearest covered recorded frequency for every sweep frequency
+        offset = np.abs(frequencies_hz[:, None] - self.frequencies[None, :])
+        offset[:, ~covered] = np.inf
+        recorded = offset.argmin(axis=1)
+        return gamma[recorded] * np.exp(-2j * np.pi * (frequencies_hz - self.frequencies[recorded]) * self.delay_s)
+
+class SimulatedZVA:
+    """
+    Instrument state and SCPI command handling of the simulated VNA (channel 1 only).
+    A triggered sweep samples the motor positions and finishes after the modelled sweep time.
+    """
+    def __init__(self, model:ImpedanceModel, positions, noise:float = NOISE_GAMMA, seed:int = None)->None:
+        """
+        Args:
+            model (ImpedanceModel): S11 model.
+            positions (Callable[[], list]): Returns the current four motor positions.
+            noise (float): Standard deviation of complex Gaussian trace noise, in Γ.
+            seed (int | None): Noise generator seed.
+        """
+        self.model = model
+        self.positions = positions
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self)->None:
+        self.start_hz = 10e6
+        self.stop_hz = 8e9
+        self.points = 201
+        self.bandwidth_hz = 10e3
+        self.sweep_type = "LIN"
+        self.segments = {} # segment number -> [start, stop, points]
+        self.data_format = "ASCII"
+        self.little_endian = False
+        self.esr = 0
+        self.opc_pending = False
+        self.sweep_done_at = 0.0
+        self.trace = np.zeros(0, dtype=complex)
+        self.errors = []
+
+    def frequencies(self)->np.ndarray:
+        if self.sweep_type == "SEGM":
+            return np.concatenate([np.linspace(*self.segments[number][:2], int(self.segments[number][2]))
+                                   for number in sorted(self.segments)] or [np.empty(0)])
+        return np.linspace(self.start_hz, self.stop_hz, self.points)
+
+    def sweep_time(self)->float:
+        points = self.frequencies().size
+        segments = len(self.segments) if self.sweep_type == "SEGM" else 0
+        return (SWEEP_OVERHEAD_S + points * (1 / self.bandwidth_hz + POINT_OVERHEAD_S)
+                + segments * SEGMENT_OVERHEAD_S)
+
+    def _trigger(self)->None:
+        s11 = self.model.s11(self.positions(), self.frequencies())
+        if self.noise:
+            s11 = s11 + self.noise * (self.rng.standard_normal(s11.size) + 1j * self.rng.standard_normal(s11.size))
+        self.trace = s11
+        self.sweep_done_at = time.monotonic() + self.sweep_time()
+
+    def _update_opc(self)->None:
+        if self.opc_pending and time.monotonic() >= self.sweep_done_at:
+            self.esr |= 1
+            self.opc_pending = False
+
+    def _trace_data(self)->bytes:
+        values = np.column_stack([self.trace.real, self.trace.imag]).reshape(-1)
+        if self.data_format == "ASCII":
+            return ",".join(f"{value!r}" for value in values.tolist()).encode() + b"\n" # round-trips exactly
+        datatype = "d" if self.data_format == "REAL,64" else "f"
+        payload = struct.pack(("<" if self.little_endian else ">") + datatype * values.size, *values)
+        length = str(len(payload))
+        return f"#{len(length)}{length}".encode() + payload + b"\n"
+
+    def handle(self, line:str)->bytes:
+        """
+        Executes one line of (possibly ';'-separated) SCPI commands.
+
+        Returns:
+            bytes: The reply to the queries on the line, or b"" if there were none.
+        """
+        replies = []
+        self.lock.acquire()
+        try:
+            for command in filter(None, (part.strip() for part in line.split(";"))):
+                header, _, argument = command.partition(" ")
+                # A leading ':' roots the header at the top of the command tree (after a ';')
+                header = header.upper().lstrip(":")
+                reply = self._execute(header, argument.strip())
+                if reply is not None:
+                    replies.append(reply)
+                if header == "*OPC?":
+                    # Answer when the sweep completes, serving other clients meanwhile
+                    wait_s = self.sweep_done_at - time.monotonic()
+                    if wait_s > 0:
+                        self.lock.release()
+                        try:
+                            time.sleep(wait_s)
+                        finally:
+                            self.lock.acquire()
+        finally:
+            self.lock.release()
+        if not replies:
+            return b""
+        if len(replies) == 1 and isinstance(replies[0], bytes):
+            return replies[0]
+        return (";".join(str(reply) for reply in replies) + "\n").encode()
+
+    def _error(self, error:str, esr_bit:int)->None:
+        self.errors.append(error)
+        self.esr |= esr_bit
+
+    def _in_range(self, header:str, argument:str, low:float, high:float):
+        """
+        Returns the numeric argument, or None (queueing -222) if it is outside [low, high].
+        """
+        value = float(argument)
+        if not low <= value <= high:
+            self._error(f'-222,"Data out of range;{header} {argument}"', EXECUTION_ERROR)
+            return None
+        return value
+
+    def _execute(self, header:str, argument:str):
+        """
+        Returns the reply to a query (str, or bytes for trace data), None for a setting.
+        """
+        segment = re.fullmatch(r"SENS1:SEGM(\d+):(ADD|FREQ:STAR|FREQ:STOP|SWE:POIN)", header)
+        if segment:
+            number, field = int(segment.group(1)), segment.group(2)
+            if field == "ADD":
+                self.segments[number] = [0.0, 0.0, 1]
+            else:
+                index = {"FREQ:STAR": 0, "FREQ:STOP": 1, "SWE:POIN": 2}[field]
+                limits = (1, MAX_POINTS) if field == "SWE:POIN" else (MIN_FREQUENCY_HZ, MAX_FREQUENCY_HZ)
+                value = self._in_range(header, argument, *limits)
+                if value is not None:
+                    self.segments.setdefault(number, [0.0, 0.0, 1])[index] = value
+            return None
+        if header == "*IDN?":
+            return IDN
+        if header == "*RST":
+            self.reset()
+        elif header == "*CLS":
+            self.esr = 0
+            self.errors = []
+        elif header in ("INIT1:IMM", "INIT:IMM", "INIT1"):
+            self._trigger()
+        elif header == "*OPC?":
+            return "1" # sent once the sweep has completed, see handle()
+        elif header == "*OPC":
+            self.opc_pending = True
+            self._update_opc()
+        elif header == "*ESR?":
+            self._update_opc()
+            esr, self.esr = self.esr, 0
+            return str(esr)
+        elif header == "SENS1:SWE:TIME?":
+            return f"{self.sweep_time():.9g}"
+        elif header in ("SENS1:FREQ:STAR", "SENS1:FREQ:STOP"):
+            value = self._in_range(header, argument, MIN_FREQUENCY_HZ, MAX_FREQUENCY_HZ)
+            if value is not None:
+                setattr(self, "start_hz" if header.endswith("STAR") else "stop_hz", value)
+        elif header == "SENS1:SWE:POIN":
+            value = self._in_range(header, argument, 1, MAX_POINTS)
+            if value is not None:
+                self.points = int(value)
+        elif header == "SENS1:SWE:TYPE":
+            self.sweep_type = argument.upper()
+        elif header == "SENS1:BAND":
+            self.bandwidth_hz = float(argument)
+        elif header == "SENS1:SEGM:DEL:ALL":
+            self.segments = {}
+        elif header == "FORM":
+            self.data_format = argument.upper().replace(" ", "")
+        elif header == "FORM:BORD":
+            self.little_endian = argument.upper() == "SWAP"
+        elif header == "CALC1:DATA?":
+            return self._trace_data()
+        elif header == "SYST:ERR?":
+            return self.errors.pop(0) if self.errors else NO_ERROR
+        elif header.endswith("?"):
+            self._error(f'-113,"Undefined header;{header}"', COMMAND_ERROR)
+        # Display, power, trace definition etc. are accepted and ignored
+        return None
+
+class SCPIHandler(socketserver.StreamRequestHandler):
+    """
+    One client connection: newline-terminated commands in, replies out.
+    """
+    disable_nagle_algorithm = True
+
+    def handle(self)->None:
+        for line in self.rfile:
+            if hasattr(socket, "TCP_QUICKACK"):
+                # Acknowledge at once: clients that leave Nagle on would otherwise stall
+                # ~40 ms on every command followed by another write (Linux delayed ACK)
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            reply = self.server.instrument.handle(line.decode(errors="replace"))
+            if reply:
+                self.wfile.write(reply)
+
+class SCPIServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address:tuple, instrument:SimulatedZVA)->None:
+        super().__init__(address, SCPIHandler)
+        self.instrument = instrument
+
+def test()->None:
+    """
+    Serves the simulator on a free port, measures through VNAController at two motor
+    positions and compares the readings with the model.
+    """
+    from vna_impedance import VNAController, test_data_formats
+    model = ImpedanceModel.from_recordings()
+    positions = [0, 0, 0, 0]
+
+    # A client waiting on *OPC? does not hold up another client
+    instrument = SimulatedZVA(model, lambda: positions, noise=0)
+    instrument.handle("SENS1:SWE:POIN 5001")
+    waiter = threading.Thread(target=instrument.handle, args=("INIT1:IMM;*OPC?",))
+    waiter.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    instrument.handle("*IDN?")
+    assert time.monotonic() - start < 0.1 and waiter.is_alive(), "*IDN? waited for the sweep"
+    waiter.join()
+
+    server = SCPIServer(("127.0.0.1", 0), SimulatedZVA(model, lambda: positions, noise=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        vna = VNAController(f"TCPIP0::127.0.0.1::{server.server_address[1]}::SOCKET")
+        for positions[:] in ([0, 0, 0, 0], [200, 200, 0, 0]):
+            result = vna.get_impedance(18.5e6)
+            expected = ic.s11_to_impedance(model.s11(positions, [18.5e6])[0])
+            print(f"{positions}: measured {result['real_impedance']:.2f}{result['imag_impedance']:+.2f}j Ohm, "
+                  f"model {expected:.2f} Ohm, waited {result['wait_time_s'] * 1e3:.1f} ms")
+            assert np.isclose(complex(result['real_impedance'], result['imag_impedance']), expected)
+        sweep = vna.get_impedance_sweep(18e6, 19e6, 11)
+        print(f"Sweep 18-19 MHz: {sweep}")
+
+        # A rejected setting is reported, and the settings known to the session are sent again
+        for sync_mode in ("opc", "esr"):
+            vna.sync_mode = sync_mode
+            result = vna.get_impedance(9e9) # above the ZVA8's range
+            print(f"{sync_mode}, 9 GHz: {result}")
+            assert "-222" in result.get("error", "") and not vna.session.known, result
+            result = vna.get_impedance(18.5e6)
+            expected = ic.s11_to_impedance(model.s11(positions, [18.5e6])[0])
+            assert np.isclose(complex(result['real_impedance'], result['imag_impedance']), expected), result
+
+        # The trace read as REAL,64 and REAL,32 binary blocks and as ASCII text agrees (REAL,64 and ASCII exactly)
+        test_data_formats(vna.vna_address, ascii_tolerance=0.0)
+    finally:
+        server.shutdown()
+
+def main()->None:
+    import gpio_sim
+    parser = argparse.ArgumentParser(description="Simulated ZVA8 VNA serving SCPI over TCP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data", default="data/*.csv", help="Recorded sweeps the S11 model is built from")
+    parser.add_argument("--noise", type=float, default=NOISE_GAMMA, help="Trace noise standard deviation, in Γ")
+    parser.add_argument("--test", action="store_true", help="Run the self test and exit")
+    args = parser.parse_args()
+    if args.test:
+        test()
+        return
+
+    instrument = SimulatedZVA(ImpedanceModel.from_recordings(args.data), gpio_sim.axes().positions, args.noise)
+    with SCPIServer((args.host, args.port), instrument) as server:
+        print(f"Simulated VNA listening on {args.host}:{args.port} (positions from {gpio_sim.SIM_STATE_PATH})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()